@@ -9,6 +9,11 @@ class Settings(BaseSettings):
     auth0_api_audience: str
     auth0_issuer: str
     auth0_algorithms: str
+    # a local JWKS file to verify against instead of fetching it from auth0
+    auth0_jwks_path: str | None = None
+    # how often the in-memory keyset is refreshed in the background, 0 disables it
+    auth0_jwks_refresh_seconds: float = 3600
+    auth0_token_cache_size: int = 1024
 
 
 @lru_cache()
@@ -25,4 +30,9 @@ def get_settings():
         auth0_api_audience=audience,  # type: ignore
         auth0_issuer=issuer,  # type: ignore
         auth0_algorithms=algorithms,  # type: ignore
+        auth0_jwks_path=os.getenv("AUTH0_JWKS_PATH"),
+        auth0_jwks_refresh_seconds=float(
+            os.getenv("AUTH0_JWKS_REFRESH_SECONDS", "3600")
+        ),
+        auth0_token_cache_size=int(os.getenv("AUTH0_TOKEN_CACHE_SIZE", "1024")),
     )
@@ -0,0 +1,130 @@
+import json
+import time
+
+import jwt
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+
+from benchmarks.auth import SETTINGS
+
+from .utils import KeySet, TokenCache, UnauthorizedException, VerifyToken
+
+
+@pytest.fixture
+def count_decodes(monkeypatch):
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        calls.append(1)
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting_decode)
+    return calls
+
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.mark.anyio
+async def test_verify_with_local_jwks_file_and_cache(
+    tmp_path, count_decodes, make_signer
+):
+    signer = make_signer("local")
+    jwks_path = tmp_path / "jwks.json"
+    signer.write_jwks(str(jwks_path))
+    keys = KeySet(jwks_path=str(jwks_path), refresh_seconds=0)
+    auth = VerifyToken(SETTINGS, keys=keys)
+    token = bearer(signer.token("auth0|test"))
+
+    first = await auth.verify(SecurityScopes(), token)
+    second = await auth.verify(SecurityScopes(), token)
+
+    assert first["sub"] == second["sub"] == "auth0|test"
+    assert len(count_decodes) == 1
+    assert (auth.cache.hits, auth.cache.misses) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_verify_with_warmed_keyset_rejects_unknown_keys(make_signer):
+    signer = make_signer("warm")
+    other = make_signer("other")
+    # right kid, wrong signature
+    forger = make_signer("other", kid="warm")
+    auth = VerifyToken(SETTINGS, keys=KeySet.from_jwks(signer.jwks()))
+
+    token = bearer(signer.token("auth0|test"))
+    assert (await auth.verify(SecurityScopes(), token))["sub"]
+    with pytest.raises(UnauthorizedException):
+        await auth.verify(SecurityScopes(), bearer(other.token("auth0|test")))
+    with pytest.raises(UnauthorizedException):
+        await auth.verify(SecurityScopes(), bearer(forger.token("auth0|test")))
+
+
+@pytest.mark.anyio
+async def test_verify_rejects_expired_tokens(make_signer):
+    signer = make_signer("warm")
+    auth = VerifyToken(SETTINGS, keys=KeySet.from_jwks(signer.jwks()))
+    token = signer.token("auth0|test", expires_in=-10)
+    with pytest.raises(UnauthorizedException):
+        await auth.verify(SecurityScopes(), bearer(token))
+    assert auth.cache.get(token) is None
+
+
+def test_token_cache_honours_exp_and_size():
+    cache = TokenCache(max_size=2)
+    now = time.time()
+    cache.put("expired", {"exp": now - 1})
+    cache.put("no-exp", {"sub": "x"})
+    assert cache.get("expired") is None
+    assert cache.get("no-exp") is None
+
+    for token in ["a", "b", "c"]:
+        cache.put(token, {"sub": token, "exp": now + 60})
+    assert cache.get("a") is None
+    assert cache.get("c") == {"sub": "c", "exp": now + 60}
+
+
+def test_keyset_picks_up_rotated_file(tmp_path, make_signer):
+    old = make_signer("old").jwks()
+    new = make_signer("new").jwks()
+    jwks_path = tmp_path / "jwks.json"
+    jwks_path.write_text(json.dumps(old))
+    keys = KeySet(jwks_path=str(jwks_path), refresh_seconds=0)
+    keys.refresh()
+    assert keys.get_signing_key("old") is not None
+
+    jwks_path.write_text(json.dumps(new))
+    keys.refresh()
+    assert keys.get_signing_key("old") is None
+    assert keys.get_signing_key("new") is not None
+
+
+def test_keyset_warms_in_the_background(tmp_path, make_signer):
+    jwks_path = tmp_path / "jwks.json"
+    make_signer("bg").write_jwks(str(jwks_path))
+    keys = KeySet(jwks_path=str(jwks_path), refresh_seconds=60)
+    keys.start()
+    try:
+        deadline = time.monotonic() + 5
+        while keys.get_signing_key("bg") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert keys.get_signing_key("bg") is not None
+    finally:
+        keys.stop()
+
+
+def test_keyset_may_refresh_before_ever_refreshing_on_a_fresh_host(
+    monkeypatch, make_signer
+):
+    # a host booted seconds ago, whose monotonic clock is still small
+    now = 5.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    keys = KeySet(jwks_url="https://chess.test/.well-known/jwks.json")
+    assert keys.can_refresh()
+
+    keys.set_jwks(make_signer("fresh").jwks())
+    assert not keys.can_refresh()
+    now += KeySet.MIN_REFRESH_SECONDS
+    assert keys.can_refresh()
@@ -1,14 +1,25 @@
+import hashlib
+import logging
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
 from json import load
 from pprint import pprint
 from typing import Optional
 
+import anyio
 import jwt
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, SecurityScopes
 
-from .config import get_settings
+from app.monitoring.metrics import JWT_VERIFY_SECONDS
+
+from .config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
 
 
 class UnauthorizedException(HTTPException):
@@ -31,17 +42,153 @@ class UnauthenticatedException(HTTPException):
         )
 
 
+class TokenCache:
+    """
+    A bounded LRU map from a token's hash to its verified claims.
+    Entries expire with the token's `exp`, tokens without one are not cached.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._claims: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> dict | None:
+        key = self.key(token)
+        with self._lock:
+            entry = self._claims.get(key)
+            if entry is None or entry[1] <= time.time():
+                self._claims.pop(key, None)
+                self.misses += 1
+                return None
+            self._claims.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: dict) -> None:
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or self.max_size < 1:
+            return
+        with self._lock:
+            self._claims[self.key(token)] = (claims, float(exp))
+            self._claims.move_to_end(self.key(token))
+            while len(self._claims) > self.max_size:
+                self._claims.popitem(last=False)
+
+
+class KeySet:
+    """
+    The signing keys, held in memory and refreshed in the background.
+    Keys come from a local JWKS file if `jwks_path` is set, otherwise from `jwks_url`,
+    or are handed over already loaded through `from_jwks`.
+    """
+
+    # don't refetch more often than this when a token names an unknown key
+    MIN_REFRESH_SECONDS = 60.0
+
+    def __init__(
+        self,
+        jwks_url: str | None = None,
+        jwks_path: str | None = None,
+        refresh_seconds: float = 3600,
+    ) -> None:
+        self.jwks_url = jwks_url
+        self.jwks_path = jwks_path
+        self.refresh_seconds = refresh_seconds
+        self._keys: dict[str, jwt.PyJWK] = {}
+        # never refreshed, so the first unknown key may always trigger a refresh
+        self._refreshed_at = -math.inf
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_jwks(cls, jwks: dict) -> "KeySet":
+        """A keyset warmed from an in-memory JWKS, with no background refresh"""
+        keys = cls(refresh_seconds=0)
+        keys.set_jwks(jwks)
+        return keys
+
+    def fetch(self) -> dict:
+        if self.jwks_path is not None:
+            with open(self.jwks_path) as f:
+                return load(f)
+        if self.jwks_url is not None:
+            return jwt.PyJWKClient(self.jwks_url).fetch_data()
+        raise ValueError("No JWKS source to fetch from")
+
+    def set_jwks(self, jwks: dict) -> None:
+        keys = {key.key_id: key for key in jwt.PyJWKSet.from_dict(jwks).keys}
+        with self._lock:
+            self._keys = keys  # type: ignore
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self) -> None:
+        self.set_jwks(self.fetch())
+
+    def get_signing_key(self, kid: str) -> jwt.PyJWK | None:
+        with self._lock:
+            return self._keys.get(kid)
+
+    def can_refresh(self) -> bool:
+        if self.jwks_path is None and self.jwks_url is None:
+            return False
+        with self._lock:
+            return time.monotonic() - self._refreshed_at >= self.MIN_REFRESH_SECONDS
+
+    def start(self) -> None:
+        """Warm the keyset and keep it fresh from a daemon thread"""
+        if self._thread is not None or self.refresh_seconds <= 0:
+            return
+        self._thread = threading.Thread(
+            target=self._refresh_loop, name="jwks-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as error:
+                # keep serving the keys we have, a failed refresh is retried next round
+                logger.warning("Could not refresh JWKS: %s", error)
+            self._stop.wait(self.refresh_seconds)
+
+
 class VerifyToken:
     """Does all the token verification using PyJWT"""
 
-    def __init__(self):
-        load_dotenv(override=True)
-        self.config = get_settings()
+    def __init__(
+        self,
+        config: Settings | None = None,
+        keys: KeySet | None = None,
+        cache: TokenCache | None = None,
+    ):
+        if config is None:
+            load_dotenv(override=True)
+            config = get_settings()
+        self.config = config
 
-        # This gets the JWKS from a given URL and does processing so you can
-        # use any of the keys available
-        jwks_url = f"https://{self.config.auth0_domain}/.well-known/jwks.json"
-        self.jwks_client = jwt.PyJWKClient(jwks_url)
+        # The keys are loaded from a local file or from the JWKS of the auth0
+        # domain, and kept in memory so no request waits on a fetch
+        if keys is None:
+            keys = KeySet(
+                jwks_url=f"https://{self.config.auth0_domain}/.well-known/jwks.json",
+                jwks_path=self.config.auth0_jwks_path,
+                refresh_seconds=self.config.auth0_jwks_refresh_seconds,
+            )
+            keys.start()
+        self.keys = keys
+        self.cache = cache or TokenCache(self.config.auth0_token_cache_size)
 
     async def verify(
         self,
@@ -51,20 +198,44 @@ class VerifyToken:
         if token is None:
             raise UnauthenticatedException
 
+        start = time.perf_counter()
+        result = "failed"
+        try:
+            payload = self.cache.get(token.credentials)
+            if payload is not None:
+                result = "cached"
+                return payload
+            payload = await self.decode(token.credentials)
+            result = "verified"
+            return payload
+        finally:
+            JWT_VERIFY_SECONDS.observe(time.perf_counter() - start, result=result)
+
+    async def decode(self, credentials: str) -> dict:
+        """Verify a token that is not cached, and cache its claims"""
         # This gets the 'kid' from the passed token
         try:
-            signing_key = self.jwks_client.get_signing_key_from_jwt(
-                token.credentials
-            ).key
-        except jwt.exceptions.PyJWKClientError as error:
-            raise UnauthorizedException(str(error))
+            kid = jwt.get_unverified_header(credentials).get("kid")
         except jwt.exceptions.DecodeError as error:
             raise UnauthorizedException(str(error))
 
+        signing_key = self.keys.get_signing_key(kid)
+        if signing_key is None and self.keys.can_refresh():
+            # the keys may have been rotated since the last refresh
+            try:
+                await anyio.to_thread.run_sync(self.keys.refresh)
+            except Exception as error:
+                raise UnauthorizedException(f"Could not fetch signing keys: {error}")
+            signing_key = self.keys.get_signing_key(kid)
+        if signing_key is None:
+            raise UnauthorizedException(
+                f"Unable to find a signing key that matches: {kid}"
+            )
+
         try:
             payload = jwt.decode(
-                token.credentials,
-                signing_key,
+                credentials,
+                signing_key.key,
                 algorithms=self.config.auth0_algorithms,  # type: ignore
                 audience=self.config.auth0_api_audience,
                 issuer=self.config.auth0_issuer,
@@ -72,4 +243,5 @@ class VerifyToken:
         except Exception as error:
             raise UnauthorizedException(str(error))
 
+        self.cache.put(credentials, payload)
         return payload
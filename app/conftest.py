@@ -0,0 +1,26 @@
+from uuid import uuid4
+
+import pytest
+
+from app.models.game import BasicUserInfo, DetailedGame
+
+
+@pytest.fixture
+def make_game():
+    """Makes a game in progress with no players, owned by a fresh user"""
+
+    def make(game_id, turn_count: int = 1) -> DetailedGame:
+        owner_id = uuid4()
+        return DetailedGame(
+            game_id=game_id,
+            self=f"/games/{game_id}",
+            owner=BasicUserInfo(
+                username="owner", user_id=owner_id, self=f"/users/{owner_id}"
+            ),
+            turn="white",
+            turn_count=turn_count,
+            game_state="in progress",
+            board={},
+        )
+
+    return make
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+from uuid import UUID
+
+from chess import Board
+from pydantic import BaseModel
+
+# Rough footprint of a Board, measured with tracemalloc: the position itself,
+# plus a saved board state for every move on the stack
+BOARD_BASE_BYTES = 1024
+BOARD_BYTES_PER_MOVE = 512
+
+
+class BoardCacheStats(BaseModel):
+    """Counters for the in-process board cache"""
+
+    entries: int
+    bytes: int
+    max_entries: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class BoardCache:
+    """
+    A bounded LRU cache of live boards keyed by game id, each tagged with the game's version.
+    A board is only served for the version it was cached at, so a game moved on
+    by another worker process is loaded afresh rather than served stale.
+    Boards are evicted least recently used first once either `max_entries`
+    or the estimated `max_bytes` is exceeded.
+    Cached boards are shared, callers must copy() a board before mutating it.
+    """
+
+    def __init__(
+        self, max_entries: int = 1024, max_bytes: int = 64 * 1024**2
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # board, version, estimated size
+        self._boards: OrderedDict[UUID, tuple[Board, int, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def estimate_size(board: Board) -> int:
+        return BOARD_BASE_BYTES + BOARD_BYTES_PER_MOVE * len(board.move_stack)
+
+    def get(self, game_id: UUID, version: int) -> Board | None:
+        with self._lock:
+            entry = self._boards.get(game_id)
+            if entry is None or entry[1] != version:
+                self._misses += 1
+                return None
+            self._boards.move_to_end(game_id)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, game_id: UUID, board: Board, version: int) -> None:
+        size = self.estimate_size(board)
+        with self._lock:
+            old = self._boards.pop(game_id, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._boards[game_id] = (board, version, size)
+            self._bytes += size
+            while len(self._boards) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._boards.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def invalidate(self, game_id: UUID) -> None:
+        with self._lock:
+            entry = self._boards.pop(game_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._boards.clear()
+            self._bytes = 0
+
+    def stats(self) -> BoardCacheStats:
+        with self._lock:
+            return BoardCacheStats(
+                entries=len(self._boards),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+            )
+
+
+def new_board_cache() -> BoardCache:
+    """A board cache bounded by BOARD_CACHE_SIZE and BOARD_CACHE_MAX_BYTES"""
+    return BoardCache(
+        max_entries=int(os.getenv("BOARD_CACHE_SIZE", "1024")),
+        max_bytes=int(os.getenv("BOARD_CACHE_MAX_BYTES", str(64 * 1024**2))),
+    )
@@ -0,0 +1,58 @@
+from chess import (
+    BLACK,
+    COLORS,
+    PIECE_SYMBOLS,
+    PIECE_TYPES,
+    SQUARES,
+    WHITE,
+    Board,
+    scan_forward,
+    square_name,
+)
+
+# the symbol of each (color, piece type), indexed [color][piece_type]
+SYMBOLS = {
+    WHITE: [symbol.upper() if symbol else "" for symbol in PIECE_SYMBOLS],
+    BLACK: [symbol or "" for symbol in PIECE_SYMBOLS],
+}
+
+
+def board_array(board: Board) -> list[str]:
+    """
+    The board as 64 piece symbols indexed by square, a1 = 0 through h8 = 63,
+    uppercase for white, lowercase for black and empty strings for empty squares.
+    Read straight off the piece bitboards, visiting only occupied squares.
+    """
+    squares = [""] * len(SQUARES)
+    for color in COLORS:
+        for piece_type in PIECE_TYPES:
+            symbol = SYMBOLS[color][piece_type]
+            for square in scan_forward(board.pieces_mask(piece_type, color)):
+                squares[square] = symbol
+    return squares
+
+
+def board_fen(board: Board) -> str:
+    """The board's full FEN, with the piece placement built from `board_array`"""
+    squares = board_array(board)
+    ranks = []
+    for rank_start in range(56, -1, -8):
+        rank, empty = "", 0
+        for symbol in squares[rank_start : rank_start + 8]:
+            if symbol:
+                rank += f"{empty or ''}{symbol}"
+                empty = 0
+            else:
+                empty += 1
+        ranks.append(f"{rank}{empty or ''}")
+    ep_square = board.ep_square if board.has_legal_en_passant() else None
+    return " ".join(
+        [
+            "/".join(ranks),
+            "w" if board.turn == WHITE else "b",
+            board.castling_xfen(),
+            square_name(ep_square) if ep_square is not None else "-",
+            str(board.halfmove_clock),
+            str(board.fullmove_number),
+        ]
+    )
@@ -0,0 +1,436 @@
+import fcntl
+import os
+import pickle
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from uuid import UUID
+
+import anyio
+from chess import Board
+from chess import Move as ChessMove
+from pydantic import BaseModel
+
+from app.db.games import GameQueries
+
+# A position has to occur five times for a fivefold repetition, which takes at
+# least 16 reversible plies
+FIVEFOLD_MIN_PLIES = 16
+
+# how often a file store waits to retry a game's file lock held by someone else
+LOCK_POLL_SECONDS = 0.001
+
+# a journaled game's journal is compacted into a snapshot every so many plies, so that
+# a load replays at most this many moves
+SNAPSHOT_PLIES = 32
+
+# the board storage used when BOARD_STORAGE is not set
+DEFAULT_BOARD_STORAGE = "journal"
+
+
+def has_repetition_context(board: Board) -> bool:
+    """
+    Whether the board's move stack covers enough of the game to detect a fivefold repetition.
+    If not, the board still reports the right position but may miss that the game is over.
+    """
+    return board.halfmove_clock < FIVEFOLD_MIN_PLIES or board.halfmove_clock <= len(
+        board.move_stack
+    )
+
+
+class BoardStore(ABC):
+    """Where the chess.Board for each game lives"""
+
+    # the BOARD_STORAGE value that picks this store, and its label in the metrics
+    name = ""
+
+    def __init__(self, queries: GameQueries) -> None:
+        self.queries = queries
+
+    @abstractmethod
+    async def load(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        """Load the board for a game. `game_data` is the game's row, if already selected"""
+
+    async def load_history(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        """Load the board with every move of the game on its move stack, e.g. to export it"""
+        return await self.load(game_id, game_data)
+
+    @abstractmethod
+    async def create(self, game_id: UUID, board: Board) -> None:
+        """Store the board of a new game"""
+
+    @abstractmethod
+    async def save(
+        self, game_id: UUID, board: Board, new_moves: list[ChessMove], version: int
+    ) -> bool:
+        """
+        Persist `board` after `new_moves` were pushed, and mark the game as updated,
+        if the game is still at the `version` the board was read at. Returns whether it was;
+        if another write got there first nothing is stored.
+        """
+
+    @abstractmethod
+    async def delete(self, game_id: UUID) -> None:
+        """Remove the game's board"""
+
+
+class FileBoardStore(BoardStore):
+    """Boards kept in files in `games_dir`, behind a lock file per game"""
+
+    def __init__(self, queries: GameQueries, games_dir: str) -> None:
+        super().__init__(queries)
+        self.games_dir = games_dir
+
+    def lock_path(self, game_id: UUID) -> anyio.Path:
+        return anyio.Path(self.games_dir, f"{game_id}.lock")
+
+    @asynccontextmanager
+    async def locked(self, game_id: UUID, exclusive: bool) -> AsyncIterator[None]:
+        """
+        Hold the game's file lock, shared by readers and taken exclusively by writers.
+        Being a lock on a file, it holds across worker processes as well as tasks.
+        """
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        fd = os.open(self.lock_path(game_id), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # polled rather than waited for in a thread, so that waiters never
+            # take the threads the holder needs to finish
+            while True:
+                try:
+                    fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await anyio.sleep(LOCK_POLL_SECONDS)
+            yield
+        finally:
+            # closing the descriptor releases the lock
+            os.close(fd)
+
+    @staticmethod
+    def write_atomically(path: str, data: bytes) -> None:
+        """
+        Replace the file at `path` with `data`, so that it is either the old file or
+        the whole new one, even if the process or the machine dies midway
+        """
+        written = f"{path}.tmp"
+        with open(written, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(written, path)
+        # the rename itself is only durable once the directory is synced
+        directory = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class PickleBoardStore(FileBoardStore):
+    """One pickle file of the whole board per game"""
+
+    name = "pickle"
+
+    def path(self, game_id: UUID) -> anyio.Path:
+        return anyio.Path(self.games_dir, f"{game_id}.pickle")
+
+    async def load(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        async with self.locked(game_id, exclusive=False):
+            board: Board = pickle.loads(await self.path(game_id).read_bytes())
+        return board
+
+    async def create(self, game_id: UUID, board: Board) -> None:
+        await self.path(game_id).write_bytes(pickle.dumps(board))
+
+    async def save(
+        self, game_id: UUID, board: Board, new_moves: list[ChessMove], version: int
+    ) -> bool:
+        # the version is bumped and the file replaced under one lock, so a reader
+        # that sees the new version also reads the new board
+        async with self.locked(game_id, exclusive=True):
+            if not await self.queries.update_last_updated_at(game_id, version):
+                return False
+            await anyio.to_thread.run_sync(
+                self.write_atomically, str(self.path(game_id)), pickle.dumps(board)
+            )
+        return True
+
+    async def delete(self, game_id: UUID) -> None:
+        await self.path(game_id).unlink()
+        await self.lock_path(game_id).unlink(missing_ok=True)
+
+
+class Snapshot(BaseModel):
+    """
+    A journaled game's position after its first `plies` moves, heading the journal.
+    The moves before it are the first `history` bytes of the game's history file.
+    """
+
+    fen: str
+    plies: int
+    history: int
+
+
+class JournalBoardStore(FileBoardStore):
+    """
+    An append-only journal of each game's moves, one line of UCI moves per save.
+    A save appends only its own moves, so it costs the same at move 300 as at move 1.
+    Every `snapshot_plies` plies the journal is compacted: its moves are moved to the
+    game's history file, which is only read to replay the whole game, and the journal
+    is replaced by a snapshot of the position, so a load replays at most the moves
+    since then.
+    """
+
+    name = "journal"
+
+    def __init__(
+        self,
+        queries: GameQueries,
+        games_dir: str,
+        snapshot_plies: int = SNAPSHOT_PLIES,
+    ) -> None:
+        super().__init__(queries, games_dir)
+        self.snapshot_plies = snapshot_plies
+
+    def journal_path(self, game_id: UUID) -> anyio.Path:
+        return anyio.Path(self.games_dir, f"{game_id}.moves")
+
+    def history_path(self, game_id: UUID) -> anyio.Path:
+        return anyio.Path(self.games_dir, f"{game_id}.history")
+
+    def pickle_path(self, game_id: UUID) -> anyio.Path:
+        return anyio.Path(self.games_dir, f"{game_id}.pickle")
+
+    @staticmethod
+    def read_journal(path: str) -> tuple[Snapshot | None, list[str]]:
+        """The journal's snapshot, if any, and its moves, less a last line cut short by a crash"""
+        with open(path, "rb") as f:
+            data = f.read()
+        complete = data[: data.rfind(b"\n") + 1]
+        snapshot = None
+        if complete.startswith(b"#"):
+            # the journal is only ever replaced whole once it has a snapshot
+            header, _, complete = complete.partition(b"\n")
+            snapshot = Snapshot.model_validate_json(header[1:])
+        return snapshot, complete.decode().split()
+
+    @staticmethod
+    def read_game(journal: str, history: str) -> list[str]:
+        """Every move of the game, the history's followed by the journal's"""
+        snapshot, moves = JournalBoardStore.read_journal(journal)
+        if snapshot is None:
+            return moves
+        with open(history, "rb") as f:
+            # past `snapshot.history` is what a compaction that died midway left
+            compacted = f.read(snapshot.history).decode().split()
+        return compacted + moves
+
+    @staticmethod
+    def append(path: str, line: bytes) -> int:
+        """Append a line to the journal and sync it, returning the journal's new size"""
+        fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        try:
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                # a save died mid-append, drop its line, it was never reported as stored
+                size = JournalBoardStore.last_line_end(fd, size)
+                os.ftruncate(fd, size)
+            os.write(fd, line)
+            os.fsync(fd)
+            return size + len(line)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def truncate(path: str, size: int) -> None:
+        """Cut the journal back to `size` bytes, and sync it"""
+        fd = os.open(path, os.O_RDWR)
+        try:
+            os.ftruncate(fd, size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def last_line_end(fd: int, size: int) -> int:
+        """The offset just past the last newline in the first `size` bytes of the file"""
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            newline = os.pread(fd, end - start, start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+        return 0
+
+    @classmethod
+    def compact(cls, journal: str, history: str, board: Board) -> None:
+        """
+        Move the journal's moves to the end of the history, and replace the journal
+        with a snapshot of `board`, the position after them
+        """
+        snapshot, moves = cls.read_journal(journal)
+        fd = os.open(history, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            # drop the moves of a compaction that died before replacing the journal
+            os.ftruncate(fd, 0 if snapshot is None else snapshot.history)
+            if moves:
+                os.write(fd, (" ".join(moves) + "\n").encode())
+            os.fsync(fd)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        header = Snapshot(fen=board.fen(), plies=board.ply(), history=size)
+        # the history is synced first, so the new journal never points past its end
+        cls.write_atomically(journal, f"#{header.model_dump_json()}\n".encode())
+
+    async def load(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        await self.adopt_pickle(game_id)
+        async with self.locked(game_id, exclusive=False):
+            snapshot, moves = await anyio.to_thread.run_sync(
+                self.read_journal, str(self.journal_path(game_id))
+            )
+            board = Board() if snapshot is None else Board(snapshot.fen)
+            for uci in moves:
+                board.push(ChessMove.from_uci(uci))
+            if has_repetition_context(board):
+                return board
+            # repetition detection needs the move stack, so replay the game
+            return await self.replay(game_id)
+
+    async def load_history(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        await self.adopt_pickle(game_id)
+        async with self.locked(game_id, exclusive=False):
+            return await self.replay(game_id)
+
+    async def replay(self, game_id: UUID) -> Board:
+        board = Board()
+        moves = await anyio.to_thread.run_sync(
+            self.read_game,
+            str(self.journal_path(game_id)),
+            str(self.history_path(game_id)),
+        )
+        for uci in moves:
+            board.push(ChessMove.from_uci(uci))
+        return board
+
+    async def adopt_pickle(self, game_id: UUID) -> None:
+        """Journal a game pickled before BOARD_STORAGE=journal, the first time it is read"""
+        if await self.journal_path(game_id).exists():
+            return
+        async with self.locked(game_id, exclusive=True):
+            pickled = self.pickle_path(game_id)
+            if await self.journal_path(game_id).exists() or not await pickled.exists():
+                # journaled meanwhile, or no such game, in which case reading fails
+                return
+            board: Board = pickle.loads(await pickled.read_bytes())
+            ucis = " ".join(move.uci() for move in board.move_stack)
+            await anyio.to_thread.run_sync(
+                self.write_atomically,
+                str(self.journal_path(game_id)),
+                f"{ucis}\n".encode() if ucis else b"",
+            )
+            await pickled.unlink()
+
+    async def create(self, game_id: UUID, board: Board) -> None:
+        # the journal holds moves from the starting position
+        if board.move_stack or board.fen() != Board().fen():
+            raise ValueError("Games must be created from the starting position")
+        await self.journal_path(game_id).write_bytes(b"")
+
+    async def save(
+        self, game_id: UUID, board: Board, new_moves: list[ChessMove], version: int
+    ) -> bool:
+        line = (" ".join(move.uci() for move in new_moves) + "\n").encode()
+        # the journal is compacted whenever the save crosses a multiple of snapshot_plies
+        compaction_due = (
+            board.ply() // self.snapshot_plies
+            > (board.ply() - len(new_moves)) // self.snapshot_plies
+        )
+        path = str(self.journal_path(game_id))
+        async with self.locked(game_id, exclusive=True):
+            # the moves are on disk before the version bump reports them stored; a crash
+            # between the two leaves moves that were never reported, like a lost response
+            size = await anyio.to_thread.run_sync(self.append, path, line)
+            if not await self.queries.update_last_updated_at(game_id, version):
+                # another write got there first; readers wait on the lock, so none saw the line
+                await anyio.to_thread.run_sync(self.truncate, path, size - len(line))
+                return False
+            if compaction_due:
+                await anyio.to_thread.run_sync(
+                    self.compact, path, str(self.history_path(game_id)), board
+                )
+        return True
+
+    async def delete(self, game_id: UUID) -> None:
+        await self.journal_path(game_id).unlink()
+        await self.history_path(game_id).unlink(missing_ok=True)
+        await self.lock_path(game_id).unlink(missing_ok=True)
+
+
+class DatabaseBoardStore(BoardStore):
+    """The current FEN and the UCI move list, kept in columns on the game's row"""
+
+    name = "database"
+
+    async def load(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        if game_data is None:
+            game_data = await self.queries.select_board(game_id)
+            if game_data is None:
+                raise FileNotFoundError(f"No board stored for game {game_id}")
+        return self.board_from_columns(game_data.get("fen"), game_data.get("moves"))
+
+    async def load_history(self, game_id: UUID, game_data: dict | None = None) -> Board:
+        if game_data is None or "moves" not in game_data:
+            game_data = await self.queries.select_board(game_id)
+            if game_data is None:
+                raise FileNotFoundError(f"No board stored for game {game_id}")
+        return self.replay(game_data.get("moves"))
+
+    @staticmethod
+    def replay(moves: str | None) -> Board:
+        board = Board()
+        for uci in (moves or "").split():
+            board.push(ChessMove.from_uci(uci))
+        return board
+
+    @classmethod
+    def board_from_columns(cls, fen: str | None, moves: str | None) -> Board:
+        if fen is None:
+            return Board()
+        board = Board(fen)
+        if has_repetition_context(board):
+            return board
+        # repetition detection needs the move stack, so replay the game
+        return cls.replay(moves)
+
+    async def create(self, game_id: UUID, board: Board) -> None:
+        # a NULL fen is the starting position, so there is nothing to write
+        if board.move_stack or board.fen() != Board().fen():
+            raise ValueError("Games must be created from the starting position")
+
+    async def save(
+        self, game_id: UUID, board: Board, new_moves: list[ChessMove], version: int
+    ) -> bool:
+        # the FEN, the new moves and the version check are one conditional UPDATE
+        return await self.queries.update_board(
+            game_id, board.fen(), " ".join(move.uci() for move in new_moves), version
+        )
+
+    async def delete(self, game_id: UUID) -> None:
+        # the columns go with the game's row
+        pass
+
+
+def get_board_store(queries: GameQueries, games_dir: str) -> BoardStore:
+    """Pick the board storage from BOARD_STORAGE, `journal` (default), `pickle` or `database`"""
+    storage = os.getenv("BOARD_STORAGE", DEFAULT_BOARD_STORAGE).lower()
+    if storage == "journal":
+        return JournalBoardStore(
+            queries, games_dir, int(os.getenv("JOURNAL_SNAPSHOT_PLIES", SNAPSHOT_PLIES))
+        )
+    if storage == "pickle":
+        return PickleBoardStore(queries, games_dir)
+    if storage == "database":
+        return DatabaseBoardStore(queries)
+    raise ValueError(f"Unknown BOARD_STORAGE: {storage}")
@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from uuid import UUID
+
+from app.models.game import DetailedGame
+
+
+class GameBroadcaster:
+    """
+    Fans game updates out to every subscriber of a game within this process.
+    Each update is serialized once and queued for each subscriber as JSON.
+    A subscriber that falls more than `queue_size` updates behind loses the oldest ones,
+    every update carries the full game so the newest is all a client needs.
+    A `None` in the queue means the game is gone and the stream should end.
+    """
+
+    def __init__(self, queue_size: int = 16) -> None:
+        self.queue_size = queue_size
+        self._subscribers: dict[UUID, set[asyncio.Queue[str | None]]] = {}
+
+    @asynccontextmanager
+    async def subscribe(
+        self, game_id: UUID
+    ) -> AsyncIterator[asyncio.Queue[str | None]]:
+        queue: asyncio.Queue[str | None] = asyncio.Queue(self.queue_size)
+        self._subscribers.setdefault(game_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(game_id, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                self._subscribers.pop(game_id, None)
+
+    def subscriber_count(self, game_id: UUID) -> int:
+        return len(self._subscribers.get(game_id, ()))
+
+    def publish(self, game: DetailedGame) -> None:
+        subscribers = self._subscribers.get(game.game_id)
+        if not subscribers:
+            return
+        message = game.model_dump_json()
+        for queue in subscribers:
+            self._offer(queue, message)
+
+    def close(self, game_id: UUID) -> None:
+        """Tell every subscriber the game has been deleted"""
+        for queue in self._subscribers.get(game_id, ()):
+            self._offer(queue, None)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue[str | None], message: str | None) -> None:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
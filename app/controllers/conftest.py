@@ -0,0 +1,67 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+
+class BoardColumns:
+    """Keeps the fen/moves/version columns of a single game in memory"""
+
+    def __init__(self) -> None:
+        self.row: dict = {"fen": None, "moves": None, "version": 0}
+        self.updates = 0
+
+    async def select_board(self, game_id) -> dict:
+        return dict(self.row)
+
+    async def select_version(self, game_id) -> int:
+        return self.row["version"]
+
+    async def update_board(self, game_id, fen: str, new_moves: str, version) -> bool:
+        if version != self.row["version"]:
+            return False
+        self.updates += 1
+        moves = self.row["moves"]
+        self.row = {
+            "fen": fen,
+            "moves": f"{moves} {new_moves}" if moves else new_moves,
+            "version": version + 1,
+        }
+        return True
+
+    async def update_last_updated_at(self, game_id, version) -> bool:
+        if version != self.row["version"]:
+            return False
+        self.updates += 1
+        self.row["version"] += 1
+        return True
+
+
+class GameRow(BoardColumns):
+    """The board columns of a single game, along with the rest of its row"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.players: dict = {}
+
+    async def select_by_id(self, game_id) -> dict:
+        owner_id = str(uuid4())
+        return {
+            **self.row,
+            **self.players,
+            "game_id": str(game_id),
+            "owner_id": owner_id,
+            "owner_username": "owner",
+            "created_at": datetime(2024, 1, 1),
+            "last_updated_at": datetime(2024, 1, 1),
+        }
+
+
+@pytest.fixture
+def columns() -> BoardColumns:
+    return BoardColumns()
+
+
+@pytest.fixture
+def game_row() -> GameRow:
+    return GameRow()
@@ -1,114 +1,211 @@
+import hashlib
+import logging
+import math
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator
 from uuid import UUID
 
-import black
+import anyio
 from fastapi import HTTPException
-from icecream import ic
 
-from app.models.game import BaseGame, BasicUserInfo, DetailedGame
-from app.models.move import Move
-from app.models.users import BaseUser, DetailedUser, NewUser
+from app.db.games import GameQueries
+from app.db.pool import ConnectionPool
+from app.db.users import UserQueries
+from app.engine.pool import EngineBusyError, EnginePool
+from app.models.game import BaseGame, BoardFormat, DetailedGame, ExportFormat
+from app.models.move import LegalMoves, Move, MoveBatch
+from app.models.users import ENGINE_USER_ID, BaseUser, DetailedUser, NewUser
 
+from .broadcast import GameBroadcaster
 from .games import GameController
+from .pagination import DEFAULT_LIMIT, GameSort
+from .unit_of_work import unit_of_work
 from .users import UserController
 
+logger = logging.getLogger(__name__)
+
+# how often an engine reply that failed for want of a worker is tried again, and
+# how long to wait before the first retry, doubled for each one after
+ENGINE_RETRIES = 3
+ENGINE_RETRY_SECONDS = 1.0
+
 
 class APIController:
-    def __init__(self) -> None:
-        self.uc = UserController()
-        self.gc = GameController()
-
-    def create_game(self, auth0_id: str) -> UUID:
-        user = self.uc.get_user_by_auth_id(auth0_id)
-        return self.gc.create_game(user)
-
-    def get_base_user(self, user_id: UUID) -> BaseUser:
-        user = self.uc.get_user_by_uuid(user_id)
-        games = self.get_games_by_user_id(user.user_id)
-        user.games = games
-        return user
+    def __init__(
+        self, pool: ConnectionPool | None = None, engine: EnginePool | None = None
+    ) -> None:
+        self.uc = UserController(UserQueries(pool))
+        self.gc = GameController(GameQueries(pool))
+        self.broadcaster = GameBroadcaster()
+        self.engine = engine or EnginePool()
+        # games the engine is to reply in, see `play_engine_moves`
+        (
+            self._engine_turns,
+            self._engine_turns_waiting,
+        ) = anyio.create_memory_object_stream[UUID](math.inf)
+        # games in the stream, so that each waits for at most one reply
+        self._engine_turns_queued: set[UUID] = set()
 
-    def get_base_users(self) -> list[BaseUser]:
-        detailed_users = self.uc.get_all_users()
-        for user in detailed_users:
-            user.games = self.get_games_by_user_id(user.user_id)
-        users = [BaseUser(**user.model_dump()) for user in detailed_users]
-        return users
-
-    def get_detailed_user(self, requesting_auth0_id: str) -> DetailedUser:
-        return self.uc.get_user_by_auth_id(requesting_auth0_id)
-
-    def get_games_by_user_id(self, user_id: UUID) -> list[BaseGame]:
-        user = self.uc.get_user_by_uuid(user_id)
-        games_data = self.gc.queries.select_all_by_user_id(user.user_id)
-        return [self.get_base_game(game["game_id"]) for game in games_data]
-
-    def _process_players(self, game: BaseGame) -> None:
-        owner = self.uc.get_user_by_uuid(game.owner.user_id)
-        white = (
-            self.uc.get_user_by_uuid(game.white_player.user_id)
-            if game.white_player
-            else None
-        )
-        black = (
-            self.uc.get_user_by_uuid(game.black_player.user_id)
-            if game.black_player
-            else None
+    def close(self) -> None:
+        """Stop the engine workers and drop every cached user, board and position"""
+        self.engine.shutdown()
+        self.uc.cache.clear()
+        self.gc.cache.clear()
+        self.gc.legal_moves.clear()
+        self.gc.statuses.clear()
+
+    async def create_game(self, auth0_id: str) -> UUID:
+        user = await self.uc.get_user_by_auth_id(auth0_id)
+        return await self.gc.create_game(user)
+
+    async def get_base_user(
+        self,
+        user_id: UUID,
+        games_sort: GameSort = "last_updated_at",
+        games_limit: int = DEFAULT_LIMIT,
+        games_cursor: str | None = None,
+    ) -> BaseUser:
+        user = await self.uc.get_user_by_uuid(user_id)
+        user.games, user.games_next_cursor = await self.get_games_by_user_id(
+            user.user_id, games_sort, games_limit, games_cursor
         )
-        game.owner = BasicUserInfo(
-            user_id=owner.user_id,
-            self=f"/users/{owner.user_id}",
-            username=owner.username,
+        return user
+
+    async def get_user_etag(
+        self,
+        user_id: UUID,
+        games_sort: GameSort = "last_updated_at",
+        games_limit: int = DEFAULT_LIMIT,
+        games_cursor: str | None = None,
+    ) -> str:
+        """A strong ETag for the user and their games, read without hydrating any of them"""
+        rows = await self.gc.queries.select_games_summary_by_user_id(user_id)
+        if not rows:
+            raise HTTPException(status_code=404, detail="User not found")
+        digest = hashlib.sha1(rows[0]["username"].encode())
+        # each page of the user's games is a different representation, so it gets its own tag
+        digest.update(f";{games_sort};{games_limit};{games_cursor or ''};".encode())
+        games = sum(row["games"] for row in rows)
+        updated = max(
+            (row["last_updated_at"] for row in rows if row["games"]), default=""
         )
-        game.white_player = (
-            BasicUserInfo(
-                user_id=white.user_id,
-                self=f"/users/{white.user_id}",
-                username=white.username,
-            )
-            if white
-            else None
+        digest.update(f"{games}-{updated}".encode())
+        return f'"{digest.hexdigest()}"'
+
+    async def get_base_users(
+        self,
+        limit: int = DEFAULT_LIMIT,
+        cursor: str | None = None,
+        games_sort: GameSort = "last_updated_at",
+        games_limit: int = DEFAULT_LIMIT,
+    ) -> tuple[list[BaseUser], str | None]:
+        """A page of users with the first page of each of their games, and the next cursor"""
+        detailed_users, cursor = await self.uc.get_users_page(limit, cursor)
+        users_by_id: dict[UUID, BaseUser] = {
+            user.user_id: user for user in detailed_users
+        }
+        games_data = await self.gc.queries.select_first_pages_by_user_ids(
+            list(users_by_id), games_sort, games_limit + 1
         )
-        game.black_player = (
-            BasicUserInfo(
-                user_id=black.user_id,
-                self=f"/users/{black.user_id}",
-                username=black.username,
-            )
-            if black
-            else None
+        missing_ids = {
+            UUID(game[column])
+            for game in games_data
+            for column in ("owner_id", "white_player_id", "black_player_id")
+            if game.get(column)
+        } - users_by_id.keys()
+        if missing_ids:
+            for user in await self.uc.get_users_by_uuids(list(missing_ids)):
+                users_by_id[user.user_id] = user
+        games_by_user = self.gc.construct_games_by_user(
+            games_data, users_by_id, games_sort, games_limit
         )
+        for user in detailed_users:
+            user.games, user.games_next_cursor = games_by_user[user.user_id]
+        users = [BaseUser(**user.model_dump()) for user in detailed_users]
+        return users, cursor
 
-    def get_games_by_auth_token(self, auth0_id: str) -> list[BaseGame]:
-        owner = self.get_detailed_user(auth0_id)
-        return self.get_games_by_user_id(owner.user_id)
+    async def get_detailed_user(self, requesting_auth0_id: str) -> DetailedUser:
+        return await self.uc.get_user_by_auth_id(requesting_auth0_id)
 
-    def get_detailed_game(self, game_id: UUID) -> DetailedGame:
-        game = self.gc.get_detailed_game_by_uuid(game_id)
-        self._process_players(game)
+    async def get_games_by_user_id(
+        self,
+        user_id: UUID,
+        sort: GameSort = "last_updated_at",
+        limit: int = DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> tuple[list[BaseGame], str | None]:
+        return await self.gc.get_games_by_user_id(user_id, sort, limit, cursor)
 
-        return game
+    async def get_games_by_auth_token(
+        self,
+        auth0_id: str,
+        sort: GameSort = "last_updated_at",
+        limit: int = DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> tuple[list[BaseGame], str | None]:
+        owner = await self.get_detailed_user(auth0_id)
+        return await self.get_games_by_user_id(owner.user_id, sort, limit, cursor)
 
-    def get_base_game(self, game_id: UUID) -> BaseGame:
-        game = self.gc.get_base_game_by_uuid(game_id)
-        self._process_players(game)
+    async def export_games_by_user_id(
+        self, user_id: UUID, export_format: ExportFormat
+    ) -> AsyncIterator[str]:
+        """Check the user exists, then stream their games one at a time"""
+        await self.uc.get_user_by_uuid(user_id)
+        return self.gc.export_games_by_user_id(user_id, export_format)
+
+    async def get_detailed_game(
+        self, game_id: UUID, board_format: BoardFormat = "pieces"
+    ) -> DetailedGame:
+        game = await self.gc.get_detailed_game_by_uuid(game_id, board_format)
+        if self.engine_to_move(game):
+            # the reply may have been lost to a restart or a failed search
+            self.reply_later(game_id)
         return game
 
-    def delete_game(self, game_id: UUID, auth0_id: str) -> None:
-        user = self.uc.get_user_by_auth_id(auth0_id)
-        self.gc.delete_game(game_id, user.user_id)
+    async def get_game_etag(
+        self, game_id: UUID, board_format: BoardFormat = "pieces"
+    ) -> str:
+        return await self.gc.get_game_etag(game_id, board_format)
+
+    async def get_legal_moves(self, game_id: UUID) -> LegalMoves:
+        return await self.gc.get_legal_moves(game_id)
+
+    async def get_legal_moves_etag(self, game_id: UUID) -> str:
+        return await self.gc.get_version_etag(game_id, "moves")
+
+    async def get_base_game(self, game_id: UUID) -> BaseGame:
+        return await self.gc.get_base_game_by_uuid(game_id)
+
+    async def delete_game(self, game_id: UUID, auth0_id: str) -> None:
+        user = await self.uc.get_user_by_auth_id(auth0_id)
+        await self.gc.delete_game(game_id, user.user_id)
+        self.engine.cancel(game_id)
+        self.broadcaster.close(game_id)
 
-    def assign_player(
+    async def assign_player(
         self, game_id: UUID, owner_auth0_id: str, assignee_id: UUID, color: str
     ) -> BaseGame:
-        owner = self.uc.get_user_by_auth_id(owner_auth0_id)
-        assignee = self.uc.get_user_by_uuid(assignee_id)
-        ic(owner, assignee, color)
+        owner = await self.uc.get_user_by_auth_id(owner_auth0_id)
+        assignee = await self.uc.get_user_by_uuid(assignee_id)
         if owner.user_id == assignee.user_id:
             raise HTTPException(
                 status_code=400,
                 detail="Owner cannot assign themselves to a game. Assign another player instead.",
             )
-        game = self.gc.get_detailed_game_by_uuid(game_id)
+        return await self.assign_against_owner(game_id, owner, assignee, color)
+
+    async def assign_engine(
+        self, game_id: UUID, owner_auth0_id: str, color: str
+    ) -> BaseGame:
+        """Have the built-in engine play `color` against the owner"""
+        owner = await self.uc.get_user_by_auth_id(owner_auth0_id)
+        engine = await self.uc.get_user_by_uuid(ENGINE_USER_ID)
+        return await self.assign_against_owner(game_id, owner, engine, color)
+
+    async def assign_against_owner(
+        self, game_id: UUID, owner: DetailedUser, assignee: DetailedUser, color: str
+    ) -> BaseGame:
+        game = await self.gc.get_base_game_by_uuid(game_id)
         if owner.user_id != game.owner.user_id:
             raise HTTPException(status_code=403, detail="User does not own game")
         if game.black_player is not None or game.white_player is not None:
@@ -116,14 +213,95 @@ class APIController:
                 status_code=400,
                 detail="Players already assigned",
             )
-        self.gc.assign_player(game.game_id, assignee.user_id, color)
-        owner_color = "white" if color == "black" else "black"
-        self.gc.assign_player(game.game_id, owner.user_id, owner_color)
-        return self.gc.get_base_game_by_uuid(game_id)
-
-    def make_move(self, auth0_id: str, game_id: UUID, move: Move) -> DetailedGame:
-        user = self.uc.get_user_by_auth_id(auth0_id)
-        game = self.gc.get_detailed_game_by_uuid(game_id)
+        if color == "white":
+            await self.gc.assign_players(game_id, assignee.user_id, owner.user_id)
+        else:
+            await self.gc.assign_players(game_id, owner.user_id, assignee.user_id)
+        return await self.gc.get_base_game_by_uuid(game_id)
+
+    @staticmethod
+    def engine_to_move(game: DetailedGame) -> bool:
+        """Whether the game is waiting on a move from the built-in engine"""
+        player = game.white_player if game.turn == "white" else game.black_player
+        return (
+            game.game_state == "in progress"
+            and player is not None
+            and player.user_id == ENGINE_USER_ID
+        )
+
+    @staticmethod
+    def plays_engine(game: DetailedGame) -> bool:
+        """Whether the built-in engine plays either side of the game"""
+        return ENGINE_USER_ID in [
+            player.user_id
+            for player in (game.white_player, game.black_player)
+            if player
+        ]
+
+    def reply_later(self, game_id: UUID) -> None:
+        """Have the engine reply in the game once the request is done, see `play_engine_moves`"""
+        if game_id in self._engine_turns_queued:
+            return
+        self._engine_turns_queued.add(game_id)
+        self._engine_turns.send_nowait(game_id)
+
+    async def play_engine_moves(self) -> None:
+        """
+        Play the engine's replies asked for with `reply_later`, each in a task of its own,
+        for as long as the app runs. The tasks are started from here rather than from the
+        requests, so that their searches and queries are not timed, counted or profiled
+        as part of the request that asked for them.
+        """
+        async with anyio.create_task_group() as tg:
+            async for game_id in self._engine_turns_waiting:
+                # a reply asked for from now on is played after this one
+                self._engine_turns_queued.discard(game_id)
+                tg.start_soon(self.play_engine_move, game_id)
+
+    async def play_engine_move(self, game_id: UUID) -> None:
+        """
+        Search for the engine's move and play it, if it is the engine's turn.
+        The search itself runs in the engine's worker processes. If no worker could
+        take it, it is tried again with a backoff; should every retry fail, the next
+        read of the game asks for the reply again.
+        """
+        for attempt in range(ENGINE_RETRIES + 1):
+            if attempt:
+                await anyio.sleep(ENGINE_RETRY_SECONDS * 2 ** (attempt - 1))
+            try:
+                # in a unit of work of its own, what the request read is stale by now
+                with unit_of_work():
+                    await self._play_engine_move(game_id)
+                return
+            except (EngineBusyError, BrokenProcessPool) as e:
+                logger.warning(
+                    "Engine could not move in game %s, attempt %d: %s",
+                    game_id,
+                    attempt + 1,
+                    e,
+                )
+        logger.warning("Engine gave up on game %s until it is read again", game_id)
+
+    async def _play_engine_move(self, game_id: UUID) -> None:
+        try:
+            game = await self.gc.get_detailed_game_by_uuid(game_id)
+            if not self.engine_to_move(game):
+                return
+            board = await self.gc.get_board(game_id)
+            uci = await self.engine.best_move(game_id, board.fen())
+            if uci is None:
+                return
+            await self.gc.make_moves(game, [uci])
+        except HTTPException as e:
+            # the game was deleted or moved on meanwhile
+            logger.info("Engine did not move in game %s: %s", game_id, e)
+            return
+        await self.publish_move(game_id)
+
+    async def get_game_to_move_in(self, auth0_id: str, game_id: UUID) -> DetailedGame:
+        """The game, if both players are assigned and the user is one of them"""
+        user = await self.uc.get_user_by_auth_id(auth0_id)
+        game = await self.gc.get_detailed_game_by_uuid(game_id)
         if game.black_player is None or game.white_player is None:
             raise HTTPException(
                 status_code=400,
@@ -134,8 +312,63 @@ class APIController:
                 status_code=403,
                 detail="User is not a player in this game",
             )
-        self.gc.make_move(game, move)
-        return self.get_detailed_game(game_id)
+        if self.engine_to_move(game):
+            self.reply_later(game_id)
+            raise HTTPException(
+                status_code=409, detail="Waiting for the engine to move"
+            )
+        if self.plays_engine(game):
+            # refused before the move is stored, so the engine always gets to reply
+            if self.engine.is_full():
+                raise HTTPException(
+                    status_code=503, detail="The engine is busy, try again shortly"
+                )
+        return game
+
+    async def publish_move(
+        self, game_id: UUID, board_format: BoardFormat = "pieces"
+    ) -> DetailedGame:
+        """Read the game after a move, and push it to the game's subscribers"""
+        updated = await self.get_detailed_game(game_id, board_format)
+        # subscribers always get the pieces format
+        if board_format == "pieces":
+            self.broadcaster.publish(updated)
+        elif self.broadcaster.subscriber_count(game_id):
+            self.broadcaster.publish(await self.get_detailed_game(game_id))
+        return updated
+
+    async def make_move(
+        self,
+        auth0_id: str,
+        game_id: UUID,
+        move: Move,
+        board_format: BoardFormat = "pieces",
+    ) -> DetailedGame:
+        game = await self.get_game_to_move_in(auth0_id, game_id)
+        await self.gc.make_move(game, move)
+        return await self.publish_move(game_id, board_format)
+
+    async def make_moves(
+        self,
+        auth0_id: str,
+        game_id: UUID,
+        batch: MoveBatch,
+        board_format: BoardFormat = "pieces",
+    ) -> DetailedGame:
+        """Apply a batch of UCI moves, or the new moves of a PGN, in one write"""
+        game = await self.get_game_to_move_in(auth0_id, game_id)
+        if batch.pgn is not None:
+            ucis = await self.gc.moves_from_pgn(game_id, batch.pgn)
+        else:
+            ucis = batch.moves or []
+        if len(ucis) > 1 and self.plays_engine(game):
+            # the engine gets to reply to every move, so no batch may play its side
+            raise HTTPException(
+                status_code=400,
+                detail="Moves against the engine are played one at a time",
+            )
+        await self.gc.make_moves(game, ucis)
+        return await self.publish_move(game_id, board_format)
 
-    def create_user(self, user: NewUser, auth_result: dict) -> BaseUser:
-        return self.uc.create_user(user, auth_result)
+    async def create_user(self, user: NewUser, auth_result: dict) -> BaseUser:
+        return await self.uc.create_user(user, auth_result)
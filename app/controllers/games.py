@@ -1,34 +1,80 @@
+import io
 import os
-import pickle
+import random
+from typing import AsyncIterator
 from uuid import UUID
 
+import anyio
 from chess import (
     COLOR_NAMES,
     PIECE_NAMES,
     SQUARE_NAMES,
     SQUARES,
     Board,
-    IllegalMoveError,
 )
+from chess import Move as ChessMove
+from chess.pgn import Game, read_game
 from fastapi import HTTPException
-from icecream import ic
 
+from app.controllers.board_cache import new_board_cache
+from app.controllers.board_formats import board_array, board_fen
+from app.controllers.boards import get_board_store, has_repetition_context
+from app.controllers.pagination import (
+    DEFAULT_LIMIT,
+    GameSort,
+    decode_cursor,
+    next_cursor,
+)
+from app.controllers.position_cache import (
+    game_status,
+    legal_moves_by_square,
+    new_legal_moves_cache,
+    new_status_cache,
+)
+from app.controllers.unit_of_work import current_unit_of_work
 from app.db.games import GameQueries
-from app.models.game import BaseGame, BasicUserInfo, DetailedGame, PieceModel
-from app.models.move import Move
-from app.models.users import DetailedUser
+from app.models.game import (
+    BaseGame,
+    BasicUserInfo,
+    BoardFormat,
+    DetailedGame,
+    ExportFormat,
+    GameRecord,
+    PieceModel,
+)
+from app.models.move import MAX_BATCH_MOVES, LegalMoves, Move
+from app.models.users import BaseUser, DetailedUser
+from app.monitoring.metrics import BOARD_STORE_SECONDS
+
+
+# how often moves are tried again on a game written since it was read,
+# and the backoff before the first retry, doubling after each
+MAX_MOVE_ATTEMPTS = 5
+MOVE_RETRY_SECONDS = 0.005
+
+# games read per query while exporting, so memory does not grow with the user's games
+EXPORT_PAGE_SIZE = 100
 
 
 class GameController:
-    def __init__(self) -> None:
-        self.queries = GameQueries()
+    def __init__(self, queries: GameQueries | None = None) -> None:
+        self.queries = queries or GameQueries()
         self.games_dir = os.path.join(os.path.dirname(__file__), "games")
+        self.boards = get_board_store(self.queries, self.games_dir)
+        self.cache = new_board_cache()
+        self.legal_moves = new_legal_moves_cache()
+        self.statuses = new_status_cache()
+
+    def timed_store(self, operation: str):
+        """Time a board store operation for the metrics"""
+        return BOARD_STORE_SECONDS.time(store=self.boards.name, operation=operation)
 
     def construct_base_game(self, game_data: dict) -> BaseGame:
+        """Build a game from a row selected along with its players' usernames"""
         owner: BasicUserInfo = BasicUserInfo(
             user_id=game_data["owner_id"],
             self=f"/users/{game_data['owner_id']}",
-            username="TODO",
+            username=game_data["owner_username"],
         )
         last_updated_at = (
             game_data.get("last_updated_at")
@@ -41,11 +87,15 @@ class GameController:
         black_id = game_data.get("black_player_id")
         if white_id:
             white = BasicUserInfo(
-                user_id=white_id, self=f"/users/{white_id}", username="TODO"
+                user_id=white_id,
+                self=f"/users/{white_id}",
+                username=game_data["white_player_username"],
             )
         if black_id:
             black = BasicUserInfo(
-                user_id=black_id, self=f"/users/{black_id}", username="TODO"
+                user_id=black_id,
+                self=f"/users/{black_id}",
+                username=game_data["black_player_username"],
             )
 
         try:
@@ -59,27 +109,38 @@ class GameController:
                 black_player=black,
             )
         except Exception as e:
-            ic(e)
-            raise HTTPException(status_code=500, detail="Error constructing game")
+            raise HTTPException(
+                status_code=500, detail="Error constructing game"
+            ) from e
 
     def construct_detailed_game(
-        self, base_game: BaseGame, board: Board
+        self, base_game: BaseGame, board: Board, board_format: BoardFormat = "pieces"
     ) -> DetailedGame:
-        game_state: str = "in progress" if not board.is_game_over() else "finished"
+        status = game_status(board, self.statuses)
         return DetailedGame(
+            **status.model_dump(),
             game_id=base_game.game_id,
             self=base_game.self,
             owner=base_game.owner,
             turn=COLOR_NAMES[board.turn],
             turn_count=board.fullmove_number,
-            game_state=game_state,
             black_player=base_game.black_player,
             white_player=base_game.white_player,
             created_at=base_game.created_at,
             last_updated_at=base_game.last_updated_at,
-            board=self.construct_board(board),
+            board=self.construct_board_as(board, board_format),
         )
 
+    def construct_board_as(
+        self, board: Board, board_format: BoardFormat
+    ) -> dict[str, PieceModel] | str | list[str]:
+        """The board in the requested format, the compact ones built without a model per piece"""
+        if board_format == "fen":
+            return board_fen(board)
+        if board_format == "array":
+            return board_array(board)
+        return self.construct_board(board)
+
     @staticmethod
     def construct_board(board: Board) -> dict[str, PieceModel]:
         board_dict = {}
@@ -94,58 +155,322 @@ class GameController:
                 )
         return board_dict
 
-    def get_base_game_by_uuid(self, game_id: UUID) -> BaseGame:
-        game_data = self.queries.select_by_id(game_id)
+    async def select_game(self, game_id: UUID) -> dict:
+        """The game's row, read at most once per unit of work"""
+        unit = current_unit_of_work()
+        if unit is not None and game_id in unit.games:
+            return unit.games[game_id]
+        game_data = await self.queries.select_by_id(game_id)
         if game_data is None:
             raise HTTPException(status_code=404, detail="Game not found")
-        return self.construct_base_game(game_data)
+        if unit is not None:
+            unit.games[game_id] = game_data
+        return game_data
 
-    def get_detailed_game_by_uuid(self, game_id: UUID) -> DetailedGame:
-        game_data = self.queries.select_by_id(game_id)
-        if game_data is None:
+    async def select_version(self, game_id: UUID) -> int:
+        """The game's version, from its row if already read in this unit of work"""
+        unit = current_unit_of_work()
+        version = None if unit is None else unit.version(game_id)
+        if version is not None:
+            return version
+        version = await self.queries.select_version(game_id)
+        if version is None:
             raise HTTPException(status_code=404, detail="Game not found")
-        with open(os.path.join(self.games_dir, f"{game_id}.pickle"), "rb") as f:
-            board: Board = pickle.load(f)
+        if unit is not None:
+            unit.versions[game_id] = version
+        return version
+
+    async def load_board(
+        self, game_id: UUID, version: int, game_data: dict | None = None
+    ) -> Board:
+        """
+        Get a game's board at `version` from the unit of work or the cache,
+        loading it from storage if neither has it. Do not mutate it.
+        """
+        unit = current_unit_of_work()
+        if unit is not None and (game_id, version) in unit.boards:
+            return unit.boards[game_id, version]
+        board = self.cache.get(game_id, version)
+        if board is None:
+            with self.timed_store("load"):
+                board = await self.boards.load(game_id, game_data)
+            self.cache.put(game_id, board, version)
+        if unit is not None:
+            unit.boards[game_id, version] = board
+        return board
+
+    async def get_board(self, game_id: UUID) -> Board:
+        """The game's current board, for when its row is not needed. Do not mutate it."""
+        return await self.load_board(game_id, await self.select_version(game_id))
+
+    async def get_base_game_by_uuid(self, game_id: UUID) -> BaseGame:
+        return self.construct_base_game(await self.select_game(game_id))
+
+    async def get_game_etag(
+        self, game_id: UUID, board_format: BoardFormat = "pieces"
+    ) -> str:
+        """A strong ETag for the game, read without loading the board or players"""
+        # each format is a different representation, so it gets its own tag
+        return await self.get_version_etag(
+            game_id, "" if board_format == "pieces" else board_format
+        )
+
+    async def get_version_etag(self, game_id: UUID, representation: str = "") -> str:
+        """A strong ETag for a representation of the game, from its version alone"""
+        version = await self.select_version(game_id)
+        suffix = f"-{representation}" if representation else ""
+        return f'"{game_id}-{version}{suffix}"'
+
+    async def get_legal_moves(self, game_id: UUID) -> LegalMoves:
+        """
+        The legal moves of the game's current position. Both the board and the moves
+        are cached, so polling a game that has not moved generates nothing.
+        """
+        board = await self.get_board(game_id)
+        return LegalMoves(
+            game_id=game_id,
+            turn=COLOR_NAMES[board.turn],
+            moves=self.legal_moves.get_or_compute(board, legal_moves_by_square),
+        )
+
+    async def get_detailed_game_by_uuid(
+        self, game_id: UUID, board_format: BoardFormat = "pieces"
+    ) -> DetailedGame:
+        game_data = await self.select_game(game_id)
+        board = await self.load_board(game_id, game_data["version"], game_data)
         base_game = self.construct_base_game(game_data)
-        return self.construct_detailed_game(base_game, board)
+        return self.construct_detailed_game(base_game, board, board_format)
 
-    def create_game(self, owner: DetailedUser) -> UUID:
-        game_id = self.queries.insert_game(owner.user_id)
+    async def create_game(self, owner: DetailedUser) -> UUID:
+        game_id = await self.queries.insert_game(owner.user_id)
         board = Board()
-        with open(os.path.join(self.games_dir, f"{game_id}.pickle"), "wb") as f:
-            pickle.dump(board, f)
+        with self.timed_store("create"):
+            await self.boards.create(game_id, board)
+        self.cache.put(game_id, board, 0)
         return game_id
 
-    def get_games_by_user_id(self, user_id: UUID) -> list[BaseGame]:
-        games_data = self.queries.select_all_by_user_id(user_id)
-        return [self.construct_base_game(game) for game in games_data]
+    async def get_games_by_user_id(
+        self,
+        user_id: UUID,
+        sort: GameSort = "last_updated_at",
+        limit: int = DEFAULT_LIMIT,
+        cursor: str | None = None,
+    ) -> tuple[list[BaseGame], str | None]:
+        """A page of the games a user owns or plays in, and the cursor for the next page"""
+        after, after_id = decode_cursor(cursor, sort) if cursor else (None, None)
+        games_data = await self.queries.select_page_by_user_id(
+            user_id, sort, limit + 1, after, after_id
+        )
+        cursor = next_cursor(games_data, limit, sort, "game_id")
+        return [self.construct_base_game(game) for game in games_data], cursor
+
+    def construct_games_by_user(
+        self,
+        games_data: list[dict],
+        users: dict[UUID, BaseUser],
+        sort: GameSort,
+        limit: int,
+    ) -> dict[UUID, tuple[list[BaseGame], str | None]]:
+        """
+        Build first pages of games from rows tagged with the `player_id` they were selected for,
+        each selected without player joins. Usernames are resolved from `users`.
+        """
+        rows_by_user: dict[UUID, list[dict]] = {user_id: [] for user_id in users}
+        for game_data in games_data:
+            rows_by_user.setdefault(UUID(game_data["player_id"]), []).append(game_data)
 
-    def delete_game(self, game_id: UUID, user_id: UUID) -> None:
-        game = self.get_detailed_game_by_uuid(game_id)
+        games: dict[str, BaseGame] = {}
+        pages: dict[UUID, tuple[list[BaseGame], str | None]] = {}
+        for user_id, rows in rows_by_user.items():
+            rows.sort(key=lambda row: (row[sort], row["game_id"]), reverse=True)
+            cursor = next_cursor(rows, limit, sort, "game_id")
+            for game_data in rows:
+                if game_data["game_id"] not in games:
+                    games[game_data["game_id"]] = self.construct_base_game(
+                        {
+                            **game_data,
+                            **{
+                                f"{role}_username": users[
+                                    UUID(game_data[f"{role}_id"])
+                                ].username
+                                for role in ("owner", "white_player", "black_player")
+                                if game_data.get(f"{role}_id")
+                            },
+                        }
+                    )
+            pages[user_id] = ([games[row["game_id"]] for row in rows], cursor)
+        return pages
+
+    async def delete_game(self, game_id: UUID, user_id: UUID) -> None:
+        game = await self.get_detailed_game_by_uuid(game_id)
         if game.owner.user_id != user_id:
             raise HTTPException(
                 status_code=403, detail="User is not authorized to delete this game"
             )
-        self.queries.delete_game(game.game_id)
-        os.remove(os.path.join(self.games_dir, f"{game_id}.pickle"))
-
-    def assign_player(self, game_id: UUID, assignee_id: UUID, color: str) -> None:
-        print(f"assigning {assignee_id} to {color}")
-        color = color.lower()
-        game = self.get_detailed_game_by_uuid(game_id)
-        if color not in ["white", "black"]:
-            raise ValueError("Invalid color")
-        self.queries.assign_player(game.game_id, assignee_id, color)
-
-    def make_move(self, game: DetailedGame, move: Move) -> DetailedGame:
-        with open(os.path.join(self.games_dir, f"{game.game_id}.pickle"), "rb") as f:
-            b = pickle.load(f)
-        uci = f"{move.start}{move.end}"
-        try:
-            b.push_uci(uci)
-        except IllegalMoveError as e:
-            raise HTTPException(status_code=400, detail=f"Illegal move: {e}")
-        with open(os.path.join(self.games_dir, f"{game.game_id}.pickle"), "wb") as f:
-            pickle.dump(b, f)
-        self.queries.update_last_updated_at(game.game_id)
-        return self.get_detailed_game_by_uuid(game.game_id)
+        await self.queries.delete_game(game.game_id)
+        with self.timed_store("delete"):
+            await self.boards.delete(game.game_id)
+        self.cache.invalidate(game.game_id)
+        self.forget(game.game_id)
+
+    @staticmethod
+    def forget(game_id: UUID) -> None:
+        """Drop the game's row from the unit of work after writing it"""
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.forget_game(game_id)
+
+    async def assign_players(
+        self, game_id: UUID, white_player_id: UUID, black_player_id: UUID
+    ) -> None:
+        """Assign both players in one write, unless the game already has players"""
+        assigned = await self.queries.assign_players(
+            game_id, white_player_id, black_player_id
+        )
+        self.forget(game_id)
+        if not assigned:
+            raise HTTPException(status_code=400, detail="Players already assigned")
+
+    async def make_move(self, game: DetailedGame, move: Move) -> DetailedGame:
+        return await self.make_moves(game, [f"{move.start}{move.end}"])
+
+    async def make_moves(self, game: DetailedGame, ucis: list[str]) -> DetailedGame:
+        """
+        Play UCI moves from the game's current position and store them in one write.
+        If any move is illegal, none are stored.
+        The write only lands if nothing else wrote the game since it was read, so no move is lost.
+        If a write that was not a move got in first, e.g. a player being assigned, the moves
+        are tried again; if a move did, they were chosen for a position that is gone.
+        """
+        for attempt in range(MAX_MOVE_ATTEMPTS):
+            # the first attempt may go on the row this request already read,
+            # a stale one only costs a retry
+            game_data = await self.select_game(game.game_id)
+            version = game_data["version"]
+            b = (await self.load_board(game.game_id, version, game_data)).copy()
+            if (COLOR_NAMES[b.turn], b.fullmove_number) != (game.turn, game.turn_count):
+                raise HTTPException(
+                    status_code=409, detail="The game moved on meanwhile, try again"
+                )
+            pushed = []
+            for i, uci in enumerate(ucis):
+                try:
+                    move = ChessMove.from_uci(uci)
+                    # the null move, 0000, passes the turn and is never legal here
+                    if not move or not b.is_legal(move):
+                        raise ValueError(f"illegal uci: {uci!r} in {b.fen()}")
+                except ValueError as e:
+                    detail = f"Illegal move: {e}"
+                    if len(ucis) > 1:
+                        detail = f"Illegal move {i + 1} of {len(ucis)} ({uci}): {e}"
+                    raise HTTPException(status_code=400, detail=detail)
+                b.push(move)
+                pushed.append(move)
+            if not pushed:
+                return self.construct_detailed_game(
+                    self.construct_base_game(game_data), b
+                )
+            with self.timed_store("save"):
+                saved = await self.boards.save(game.game_id, b, pushed, version)
+            self.forget(game.game_id)
+            if saved:
+                break
+            # back off a little, so that writers racing on one game take turns
+            await anyio.sleep(random.uniform(0, MOVE_RETRY_SECONDS * 2**attempt))
+        else:
+            raise HTTPException(
+                status_code=409, detail="The game kept changing while moving, try again"
+            )
+        if has_repetition_context(b):
+            self.cache.put(game.game_id, b, version + 1)
+            unit = current_unit_of_work()
+            if unit is not None:
+                unit.boards[game.game_id, version + 1] = b
+        else:
+            # the store replays the moves on the next load, for repetition detection
+            self.cache.invalidate(game.game_id)
+        return await self.get_detailed_game_by_uuid(game.game_id)
+
+    @staticmethod
+    def construct_pgn(base_game: BaseGame, board: Board) -> str:
+        """The game as PGN, `board` holding every move of it"""
+        pgn = Game.from_board(board)
+        pgn.headers["Event"] = "Casual game"
+        pgn.headers["Site"] = base_game.self
+        if base_game.created_at is not None:
+            pgn.headers["Date"] = base_game.created_at.strftime("%Y.%m.%d")
+        for color, player in (
+            ("White", base_game.white_player),
+            ("Black", base_game.black_player),
+        ):
+            pgn.headers[color] = player.username if player else "?"
+        return f"{pgn}\n\n"
+
+    @staticmethod
+    def construct_record(base_game: BaseGame, board: Board) -> GameRecord:
+        return GameRecord(
+            **base_game.model_dump(),
+            result=board.result(),
+            fen=board.fen(),
+            moves=[move.uci() for move in board.move_stack],
+        )
+
+    async def export_games_by_user_id(
+        self, user_id: UUID, export_format: ExportFormat
+    ) -> AsyncIterator[str]:
+        """
+        Yield every game a user owns or plays in, newest first, one game at a time.
+        Pages are read by created_at, which moves made during the export do not change.
+        Boards are loaded past the cache, so an export does not evict the games being played.
+        """
+        after, after_id = None, None
+        while True:
+            page = await self.queries.select_page_by_user_id(
+                user_id, "created_at", EXPORT_PAGE_SIZE, after, after_id
+            )
+            for game_data in page:
+                base_game = self.construct_base_game(game_data)
+                with self.timed_store("load"):
+                    board = await self.boards.load_history(base_game.game_id, game_data)
+                if export_format == "pgn":
+                    yield self.construct_pgn(base_game, board)
+                else:
+                    record = self.construct_record(base_game, board)
+                    yield record.model_dump_json() + "\n"
+            if len(page) < EXPORT_PAGE_SIZE:
+                return
+            after, after_id = page[-1]["created_at"], page[-1]["game_id"]
+
+    async def moves_from_pgn(self, game_id: UUID, pgn: str) -> list[str]:
+        """
+        The UCI moves of a PGN's mainline that the game has not played yet.
+        The PGN must start from the starting position and replay the game so far.
+        """
+        parsed = read_game(io.StringIO(pgn))
+        if parsed is None:
+            raise HTTPException(status_code=400, detail="No game found in the PGN")
+        if parsed.errors:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid PGN: {parsed.errors[0]}"
+            )
+        replay = parsed.board()
+        if replay.fen() != Board().fen():
+            raise HTTPException(
+                status_code=400, detail="PGN must start from the starting position"
+            )
+        moves = list(parsed.mainline_moves())
+        board = await self.get_board(game_id)
+        played = board.ply()
+        for move in moves[:played]:
+            replay.push(move)
+        if len(moves) < played or replay.fen() != board.fen():
+            raise HTTPException(
+                status_code=409, detail="PGN does not continue the game so far"
+            )
+        new_moves = [move.uci() for move in moves[played:]]
+        if len(new_moves) > MAX_BATCH_MOVES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"PGN adds more than {MAX_BATCH_MOVES} moves",
+            )
+        return new_moves
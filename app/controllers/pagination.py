@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from typing import Literal
+
+from fastapi import HTTPException
+
+GameSort = Literal["last_updated_at", "created_at"]
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def encode_cursor(sort: str, value: datetime | None, row_id: str) -> str:
+    """An opaque cursor pointing just past the row with this sort value and id"""
+    payload = [sort, value.isoformat() if value else None, str(row_id)]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str) -> tuple[datetime | None, str]:
+    try:
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(cursor))
+        after = datetime.fromisoformat(value) if value else None
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(
+            status_code=400, detail=f"Cursor was issued for sort={cursor_sort}"
+        )
+    return after, row_id
+
+
+def next_cursor(rows: list[dict], limit: int, sort: str, id_column: str) -> str | None:
+    """
+    Rows are selected one past the limit to learn whether there is another page.
+    Trims that extra row and returns the cursor for the next page, if there is one.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last = rows[-1]
+    return encode_cursor(sort, last[sort], last[id_column])
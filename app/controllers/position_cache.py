@@ -0,0 +1,145 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, TypeVar
+
+from chess import SQUARE_NAMES, WHITE, Board
+from chess.polyglot import zobrist_hash
+from pydantic import BaseModel
+
+from app.controllers.boards import FIVEFOLD_MIN_PLIES
+from app.models.game import GameStatus
+
+V = TypeVar("V")
+
+
+class PositionCacheStats(BaseModel):
+    """Counters for a cache of values derived from positions"""
+
+    entries: int
+    max_entries: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class PositionCache(Generic[V]):
+    """
+    A bounded LRU cache of values computed from a position, keyed by its Zobrist hash.
+    The hash covers the pieces, side to move, castling rights and en passant square,
+    so a game that moves on simply looks up another position and nothing needs invalidating.
+    Cached values are shared, callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self.max_entries = max_entries
+        self._values: OrderedDict[int, V] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_or_compute(self, board: Board, compute: Callable[[Board], V]) -> V:
+        key = zobrist_hash(board)
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                self._hits += 1
+                return self._values[key]
+            self._misses += 1
+        # computed outside the lock, two threads racing on a position compute the same value
+        value = compute(board)
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+                self._evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def stats(self) -> PositionCacheStats:
+        with self._lock:
+            return PositionCacheStats(
+                entries=len(self._values),
+                max_entries=self.max_entries,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+            )
+
+
+def legal_moves_by_square(board: Board) -> dict[str, list[str]]:
+    """
+    The legal moves from each square, as the rest of the UCI move after the from-square,
+    e.g. {"e2": ["e3", "e4"]} or {"e7": ["e8q", "e8r", "e8b", "e8n"]}
+    """
+    moves: dict[str, list[str]] = {}
+    for move in board.legal_moves:
+        uci = move.uci()
+        moves.setdefault(SQUARE_NAMES[move.from_square], []).append(uci[2:])
+    return moves
+
+
+def new_legal_moves_cache() -> PositionCache[dict[str, list[str]]]:
+    """A cache of the legal moves of up to LEGAL_MOVES_CACHE_SIZE positions"""
+    return PositionCache(int(os.getenv("LEGAL_MOVES_CACHE_SIZE", "4096")))
+
+
+def position_status(board: Board) -> GameStatus:
+    """
+    Where the game stands judging by the position alone, in the order of `Board.outcome`.
+    The draws that depend on the move history are left to `game_status`.
+    """
+    if board.is_checkmate():
+        winner = "0-1" if board.turn == WHITE else "1-0"
+        return GameStatus(
+            game_state="finished", check=True, checkmate=True, result=winner
+        )
+    if board.is_insufficient_material():
+        return GameStatus(
+            game_state="finished",
+            check=board.is_check(),
+            draw_reason="insufficient_material",
+            result="1/2-1/2",
+        )
+    if not any(board.generate_legal_moves()):
+        return GameStatus(
+            game_state="finished",
+            stalemate=True,
+            draw_reason="stalemate",
+            result="1/2-1/2",
+        )
+    return GameStatus(check=board.is_check())
+
+
+def game_status(board: Board, cache: PositionCache[GameStatus]) -> GameStatus:
+    """
+    Where the game stands, the position's part cached by its Zobrist hash.
+    The seventy-five move rule and fivefold repetition need at least FIVEFOLD_MIN_PLIES
+    reversible plies, so they are only checked against the move history past that.
+    """
+    status = cache.get_or_compute(board, position_status)
+    if status.game_state == "finished" or board.halfmove_clock < FIVEFOLD_MIN_PLIES:
+        return status
+    if board.is_seventyfive_moves():
+        draw_reason = "seventyfive_moves"
+    elif board.is_fivefold_repetition():
+        draw_reason = "fivefold_repetition"
+    else:
+        return status
+    return status.model_copy(
+        update={
+            "game_state": "finished",
+            "draw_reason": draw_reason,
+            "result": "1/2-1/2",
+        }
+    )
+
+
+def new_status_cache() -> PositionCache[GameStatus]:
+    """A cache of the status of up to STATUS_CACHE_SIZE positions"""
+    return PositionCache(int(os.getenv("STATUS_CACHE_SIZE", "4096")))
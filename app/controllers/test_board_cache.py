@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+from chess import Board
+
+from .board_cache import BoardCache
+
+
+def test_cache_counts_hits_and_misses():
+    cache = BoardCache()
+    game_id = uuid4()
+    assert cache.get(game_id, 0) is None
+    board = Board()
+    cache.put(game_id, board, 0)
+    assert cache.get(game_id, 0) is board
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = BoardCache(max_entries=2)
+    first, second, third = uuid4(), uuid4(), uuid4()
+    cache.put(first, Board(), 0)
+    cache.put(second, Board(), 0)
+    cache.get(first, 0)
+    cache.put(third, Board(), 0)
+    assert cache.get(second, 0) is None
+    assert cache.get(first, 0) is not None
+    assert cache.get(third, 0) is not None
+    assert cache.stats().evictions == 1
+
+
+def test_cache_respects_memory_cap():
+    small = Board()
+    cache = BoardCache(max_bytes=2 * BoardCache.estimate_size(small))
+    long_game = Board()
+    for uci in ["g1f3", "g8f6", "f3g1", "f6g8"] * 5:
+        long_game.push_uci(uci)
+    cache.put(uuid4(), long_game, 0)
+    assert cache.stats().entries == 0
+    ids = [uuid4() for _ in range(3)]
+    for game_id in ids:
+        cache.put(game_id, Board(), 0)
+    stats = cache.stats()
+    assert stats.entries == 2
+    assert stats.bytes <= stats.max_bytes
+
+
+def test_cache_invalidate():
+    cache = BoardCache()
+    game_id = uuid4()
+    cache.put(game_id, Board(), 0)
+    cache.invalidate(game_id)
+    assert cache.get(game_id, 0) is None
+    assert cache.stats().bytes == 0
+
+
+def test_cache_only_serves_the_version_it_was_given():
+    cache = BoardCache()
+    game_id = uuid4()
+    board = Board()
+    cache.put(game_id, board, 3)
+    assert cache.get(game_id, 4) is None
+    assert cache.get(game_id, 3) is board
@@ -0,0 +1,53 @@
+import random
+
+import pytest
+from chess import SQUARES, Board
+
+from .board_formats import board_array, board_fen
+from .games import GameController
+
+
+def random_boards(n: int, seed: int = 7) -> list[Board]:
+    rng = random.Random(seed)
+    boards = [Board()]
+    for _ in range(n):
+        board = Board()
+        for _ in range(rng.randrange(1, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+@pytest.mark.parametrize("board", random_boards(25))
+def test_board_array_matches_every_square(board):
+    squares = board_array(board)
+    assert len(squares) == 64
+    for square in SQUARES:
+        piece = board.piece_at(square)
+        assert squares[square] == (piece.symbol() if piece else "")
+
+
+@pytest.mark.parametrize("board", random_boards(25))
+def test_board_fen_matches_python_chess(board):
+    assert board_fen(board) == board.fen()
+
+
+def test_en_passant_is_only_written_when_legal():
+    board = Board()
+    for uci in ["e2e4", "a7a6", "e4e5", "d7d5"]:
+        board.push_uci(uci)
+    assert board_fen(board).split()[3] == "d6"
+    board.push_uci("a2a3")
+    assert board_fen(board) == board.fen()
+
+
+def test_construct_board_as_each_format():
+    board = Board()
+    pieces = GameController.construct_board(board)
+    controller = GameController()
+    assert controller.construct_board_as(board, "pieces") == pieces
+    assert controller.construct_board_as(board, "fen") == board.fen()
+    assert controller.construct_board_as(board, "array")[4] == "K"
@@ -0,0 +1,224 @@
+import os
+from uuid import uuid4
+
+import pytest
+from chess import Board
+
+from .boards import (
+    BoardStore,
+    DatabaseBoardStore,
+    FileBoardStore,
+    JournalBoardStore,
+    PickleBoardStore,
+)
+
+
+async def play(store, columns, game_id, ucis: list[str]) -> Board:
+    for uci in ucis:
+        board = await store.load(game_id)
+        move = board.push_uci(uci)
+        assert await store.save(game_id, board, [move], columns.row["version"])
+    return await store.load(game_id)
+
+
+def test_a_store_missing_an_operation_cannot_be_created(columns):
+    class LoadOnly(BoardStore):
+        async def load(self, game_id, game_data=None) -> Board:
+            return Board()
+
+    with pytest.raises(TypeError, match="create, delete, save"):
+        LoadOnly(columns)  # type: ignore
+
+
+@pytest.mark.anyio
+async def test_database_store_round_trips_fen_and_moves(columns):
+    store = DatabaseBoardStore(columns)  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+
+    board = await play(store, columns, game_id, ["e2e4", "e7e5", "g1f3"])
+
+    assert columns.updates == 3
+    assert columns.row["moves"] == "e2e4 e7e5 g1f3"
+    assert board.fen() == columns.row["fen"]
+    # short of a possible repetition, only the FEN is read
+    assert board.move_stack == []
+
+
+@pytest.mark.anyio
+async def test_database_store_replays_moves_when_repetition_is_possible(columns):
+    store = DatabaseBoardStore(columns)  # type: ignore
+    game_id = uuid4()
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+    board = await play(store, columns, game_id, shuffle * 4)
+
+    assert len(board.move_stack) == 16
+    assert board.is_fivefold_repetition()
+    assert board.is_game_over()
+
+
+@pytest.mark.anyio
+async def test_pickle_store_round_trips_board(tmp_path, columns):
+    store = PickleBoardStore(columns, str(tmp_path))  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+
+    board = await play(store, columns, game_id, ["d2d4", "d7d5"])
+
+    assert [move.uci() for move in board.move_stack] == ["d2d4", "d7d5"]
+    await store.delete(game_id)
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize(
+    "store_class", [DatabaseBoardStore, PickleBoardStore, JournalBoardStore]
+)
+@pytest.mark.anyio
+async def test_a_stale_save_is_refused(store_class, tmp_path, columns):
+    args = (str(tmp_path),) if issubclass(store_class, FileBoardStore) else ()
+    store = store_class(columns, *args)  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    stale = await store.load(game_id)
+    await play(store, columns, game_id, ["e2e4"])
+
+    move = stale.push_uci("d2d4")
+
+    assert not await store.save(game_id, stale, [move], 0)
+    after_e4 = Board()
+    after_e4.push_uci("e2e4")
+    assert (await store.load(game_id)).fen() == after_e4.fen()
+
+
+@pytest.mark.anyio
+async def test_journal_store_compacts_the_journal_into_a_snapshot(tmp_path, columns):
+    store = JournalBoardStore(columns, str(tmp_path), snapshot_plies=4)  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    ucis = ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"]
+
+    board = await play(store, columns, game_id, ucis)
+
+    journal = tmp_path / f"{game_id}.moves"
+    history = tmp_path / f"{game_id}.history"
+    snapshot, moves = store.read_journal(str(journal))
+    assert snapshot is not None and snapshot.plies == 4
+    # the journal keeps only the moves since the snapshot, the rest are in the history
+    assert moves == ["f1b5"]
+    assert journal.read_text().endswith("\nf1b5\n")
+    assert history.read_text() == "e2e4 e7e5 g1f3 b8c6\n"
+    assert snapshot.history == history.stat().st_size
+    # only the moves since the snapshot are replayed
+    assert [move.uci() for move in board.move_stack] == ["f1b5"]
+    history = await store.load_history(game_id)
+    assert [move.uci() for move in history.move_stack] == ucis
+    assert history.fen() == board.fen()
+    await store.delete(game_id)
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.anyio
+async def test_journal_store_replays_moves_when_repetition_is_possible(
+    tmp_path, columns
+):
+    store = JournalBoardStore(columns, str(tmp_path), snapshot_plies=4)  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+    board = await play(store, columns, game_id, shuffle * 4)
+
+    assert len(board.move_stack) == 16
+    assert board.is_fivefold_repetition()
+
+
+@pytest.mark.anyio
+async def test_journal_store_drops_a_line_cut_short_by_a_crash(tmp_path, columns):
+    store = JournalBoardStore(columns, str(tmp_path))  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    await play(store, columns, game_id, ["e2e4"])
+    journal = tmp_path / f"{game_id}.moves"
+    with journal.open("a") as f:
+        f.write("e7e5 g1")
+
+    board = await play(store, columns, game_id, ["c7c5"])
+
+    assert [move.uci() for move in board.move_stack] == ["e2e4", "c7c5"]
+    assert journal.read_text() == "e2e4\nc7c5\n"
+
+
+@pytest.mark.anyio
+async def test_journal_store_takes_over_pickled_games(tmp_path, columns):
+    pickled = PickleBoardStore(columns, str(tmp_path))  # type: ignore
+    game_id = uuid4()
+    await pickled.create(game_id, Board())
+    await play(pickled, columns, game_id, ["d2d4", "d7d5"])
+    store = JournalBoardStore(columns, str(tmp_path))  # type: ignore
+
+    board = await play(store, columns, game_id, ["c2c4"])
+
+    assert [move.uci() for move in board.move_stack] == ["d2d4", "d7d5", "c2c4"]
+    assert not (tmp_path / f"{game_id}.pickle").exists()
+
+
+@pytest.mark.anyio
+async def test_journal_store_syncs_every_move_before_bumping_the_version(
+    tmp_path, monkeypatch, columns
+):
+    store = JournalBoardStore(columns, str(tmp_path))  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    journal = tmp_path / f"{game_id}.moves"
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(
+        os, "fsync", lambda fd: synced.append(journal.read_text()) or fsync(fd)
+    )
+    bumped = []
+    bump = columns.update_last_updated_at
+
+    async def bumping(game_id, version) -> bool:
+        bumped.append(journal.read_text())
+        return await bump(game_id, version)
+
+    monkeypatch.setattr(columns, "update_last_updated_at", bumping)
+
+    await play(store, columns, game_id, ["e2e4", "e7e5"])
+
+    # far short of a snapshot, each move is still synced before it is reported
+    assert synced == bumped == ["e2e4\n", "e2e4\ne7e5\n"]
+    board = await store.load(game_id)
+    move = board.push_uci("g1f3")
+    assert not await store.save(game_id, board, [move], 0)
+    assert journal.read_text() == "e2e4\ne7e5\n"
+
+
+@pytest.mark.anyio
+async def test_journal_store_ignores_a_compaction_that_died_midway(tmp_path, columns):
+    store = JournalBoardStore(columns, str(tmp_path), snapshot_plies=2)  # type: ignore
+    game_id = uuid4()
+    await store.create(game_id, Board())
+    await play(store, columns, game_id, ["e2e4", "e7e5", "g1f3"])
+    history = tmp_path / f"{game_id}.history"
+    # moves compacted into the history by a save that died before replacing the journal
+    with history.open("a") as f:
+        f.write("g1f3 b8c6\n")
+
+    assert [m.uci() for m in (await store.load_history(game_id)).move_stack] == [
+        "e2e4",
+        "e7e5",
+        "g1f3",
+    ]
+    board = await play(store, columns, game_id, ["b8c6"])
+
+    assert history.read_text() == "e2e4 e7e5\ng1f3 b8c6\n"
+    history_board = await store.load_history(game_id)
+    assert [m.uci() for m in history_board.move_stack] == [
+        "e2e4",
+        "e7e5",
+        "g1f3",
+        "b8c6",
+    ]
+    assert history_board.fen() == board.fen()
@@ -0,0 +1,34 @@
+from uuid import uuid4
+
+import pytest
+
+from app.models.game import DetailedGame
+
+from .broadcast import GameBroadcaster
+
+
+@pytest.mark.anyio
+async def test_publish_fans_out_to_every_subscriber(make_game):
+    broadcaster = GameBroadcaster()
+    game_id = uuid4()
+    async with broadcaster.subscribe(game_id) as first:
+        async with broadcaster.subscribe(game_id) as second:
+            assert broadcaster.subscriber_count(game_id) == 2
+            broadcaster.publish(make_game(game_id))
+            broadcaster.publish(make_game(uuid4()))
+            assert first.qsize() == second.qsize() == 1
+            assert (await first.get()) == (await second.get())
+    assert broadcaster.subscriber_count(game_id) == 0
+
+
+@pytest.mark.anyio
+async def test_slow_subscribers_keep_the_latest_updates(make_game):
+    broadcaster = GameBroadcaster(queue_size=2)
+    game_id = uuid4()
+    async with broadcaster.subscribe(game_id) as updates:
+        for turn in range(1, 6):
+            broadcaster.publish(make_game(game_id, turn))
+        broadcaster.close(game_id)
+        first = DetailedGame.model_validate_json(await updates.get())  # type: ignore
+        assert first.turn_count == 5
+        assert await updates.get() is None
@@ -0,0 +1,87 @@
+import random
+from uuid import UUID
+
+import anyio
+import pytest
+from chess import COLOR_NAMES, Board
+from fastapi import HTTPException
+
+from app.db.games import GameQueries
+from app.db.users import UserQueries
+from app.models.users import NewUser
+
+from .board_cache import BoardCache
+from .boards import DatabaseBoardStore, JournalBoardStore, PickleBoardStore
+from .games import GameController
+
+
+def worker(queries: GameQueries, store: str, games_dir: str) -> GameController:
+    """A controller with a cache of its own, like a second server process would have"""
+    controller = GameController()
+    controller.queries = queries
+    if store == "pickle":
+        controller.boards = PickleBoardStore(queries, games_dir)
+    elif store == "journal":
+        controller.boards = JournalBoardStore(queries, games_dir, snapshot_plies=4)
+    else:
+        controller.boards = DatabaseBoardStore(queries)
+    controller.cache = BoardCache()
+    return controller
+
+
+async def play_randomly(
+    controller: GameController, game_id: UUID, moves: int, make_game
+) -> int:
+    """Try `moves` random legal moves, returning how many were stored"""
+    stored = 0
+    for _ in range(moves):
+        board = await controller.get_board(game_id)
+        legal = [move.uci() for move in board.legal_moves]
+        if not legal:
+            break
+        game = make_game(game_id, board.fullmove_number).model_copy(
+            update={"turn": COLOR_NAMES[board.turn]}
+        )
+        try:
+            await controller.make_moves(game, [random.choice(legal)])
+        except HTTPException as e:
+            # someone else moved first
+            assert e.status_code == 409
+        else:
+            stored += 1
+    return stored
+
+
+@pytest.mark.parametrize("store", ["database", "pickle", "journal"])
+@pytest.mark.anyio
+async def test_concurrent_moves_are_never_lost(sqlite_pool, tmp_path, store, make_game):
+    queries = GameQueries(sqlite_pool)
+    owner = await UserQueries(sqlite_pool).insert_user(
+        NewUser(username="a", name="A"), "auth0|a"
+    )
+    workers = [worker(queries, store, str(tmp_path)) for _ in range(2)]
+    game_ids = [await queries.insert_game(owner) for _ in range(3)]
+    for game_id in game_ids:
+        await workers[0].boards.create(game_id, Board())
+
+    stored = {game_id: 0 for game_id in game_ids}
+
+    async def run(controller: GameController, game_id: UUID) -> None:
+        moves = await play_randomly(controller, game_id, 6, make_game)
+        stored[game_id] += moves
+
+    async with anyio.create_task_group() as tg:
+        for game_id in game_ids:
+            for controller in workers * 2:
+                tg.start_soon(run, controller, game_id)
+
+    for game_id in game_ids:
+        row = await queries.select_by_id(game_id)
+        history = await workers[1].boards.load_history(game_id)
+        assert len(history.move_stack) == stored[game_id] > 0
+        assert row["version"] == stored[game_id]
+        # every stored move was played on the position it was checked against
+        replayed = Board()
+        for move in history.move_stack:
+            replayed.push_uci(move.uci())
+        assert replayed.fen() == (await workers[1].get_board(game_id)).fen()
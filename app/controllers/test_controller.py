@@ -0,0 +1,483 @@
+import io
+import json
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+
+import anyio
+import chess.pgn
+import pytest
+from fastapi import HTTPException
+
+from app.db.base import count_queries, track_query
+from app.engine.pool import EngineBusyError
+from app.models.move import MoveBatch
+from app.models.users import ENGINE_USER_ID, DetailedUser
+
+from . import controller as controller_module
+from . import games as games_module
+from .board_cache import BoardCache
+from .boards import DatabaseBoardStore
+from .controller import ENGINE_RETRIES, APIController
+from .user_cache import UserCache
+
+
+class CountingQueries:
+    """Stands in for a query class, answering from canned rows and counting calls"""
+
+    def __init__(self, users: list[dict], games: list[dict]) -> None:
+        self.users = users
+        self.games = games
+        self.calls = 0
+
+    def _usernames(self, game: dict) -> dict:
+        usernames = {u["user_id"]: u["username"] for u in self.users}
+        return {
+            **game,
+            "owner_username": usernames[game["owner_id"]],
+            "white_player_username": usernames.get(game["white_player_id"]),
+            "black_player_username": usernames.get(game["black_player_id"]),
+        }
+
+    def _games_of(self, user_id) -> list[dict]:
+        return [
+            g
+            for g in self.games
+            if str(user_id)
+            in (g["owner_id"], g["white_player_id"], g["black_player_id"])
+        ]
+
+    @staticmethod
+    def _keyset(rows, sort, id_column, limit, after=None, after_id=None) -> list[dict]:
+        rows = sorted(rows, key=lambda row: (row[sort], row[id_column]), reverse=True)
+        if after is not None:
+            rows = [
+                row for row in rows if (row[sort], row[id_column]) < (after, after_id)
+            ]
+        return rows[:limit]
+
+    async def select_page_by_user_id(
+        self, user_id, sort, limit, after=None, after_id=None
+    ) -> list[dict]:
+        self.calls += 1
+        rows = self._keyset(
+            self._games_of(user_id), sort, "game_id", limit, after, after_id
+        )
+        return [self._usernames(g) for g in rows]
+
+    async def select_first_pages_by_user_ids(self, user_ids, sort, limit) -> list[dict]:
+        self.calls += 1
+        return [
+            {**g, "player_id": str(user_id)}
+            for user_id in user_ids
+            for g in self._keyset(self._games_of(user_id), sort, "game_id", limit)
+        ]
+
+    async def select_games_summary_by_user_id(self, user_id) -> list[dict]:
+        self.calls += 1
+        user = await self.get_by_uuid(user_id)
+        if user is None:
+            return []
+        summary = []
+        for column in ("owner_id", "white_player_id", "black_player_id"):
+            updated = [
+                g["last_updated_at"] for g in self.games if g[column] == str(user_id)
+            ]
+            summary.append(
+                {
+                    "username": user["username"],
+                    "games": len(updated),
+                    "last_updated_at": max(updated, default=None),
+                }
+            )
+        return summary
+
+    async def get_by_uuid(self, user_id) -> dict | None:
+        self.calls += 1
+        return next((u for u in self.users if u["user_id"] == str(user_id)), None)
+
+    async def get_by_uuids(self, user_ids) -> list[dict]:
+        self.calls += 1
+        ids = {str(user_id) for user_id in user_ids}
+        return [u for u in self.users if u["user_id"] in ids]
+
+    async def get_auth0_id(self, auth0_id: str) -> dict | None:
+        self.calls += 1
+        return next((u for u in self.users if u["auth0_id"] == auth0_id), None)
+
+    async def get_page(self, limit, after=None, after_id=None) -> list[dict]:
+        self.calls += 1
+        return self._keyset(self.users, "created_at", "user_id", limit, after, after_id)
+
+
+def seed(n_users: int, games_per_user: int) -> tuple[list[dict], list[dict]]:
+    start = datetime(2024, 1, 1)
+    users = [
+        {
+            "user_id": str(uuid4()),
+            "auth0_id": f"auth0|{i}",
+            "username": f"user-{i}",
+            "name": f"User {i}",
+            "email": None,
+            "created_at": start + timedelta(minutes=i),
+        }
+        for i in range(n_users)
+    ]
+    games = []
+    for i, user in enumerate(users):
+        opponent = users[(i + 1) % n_users]
+        for j in range(games_per_user):
+            created_at = start + timedelta(minutes=i, seconds=j)
+            games.append(
+                {
+                    "game_id": str(uuid4()),
+                    "owner_id": user["user_id"],
+                    "white_player_id": user["user_id"],
+                    "black_player_id": opponent["user_id"],
+                    "created_at": created_at,
+                    # every game is touched at the same time, so ties break on game_id
+                    "last_updated_at": start,
+                    "version": 0,
+                    "fen": None,
+                    "moves": None,
+                }
+            )
+    return users, games
+
+
+def make_controller(users: list[dict], games: list[dict]) -> tuple:
+    controller = APIController()
+    queries = CountingQueries(users, games)
+    controller.uc.queries = queries  # type: ignore
+    controller.uc.cache = UserCache()
+    controller.gc.queries = queries  # type: ignore
+    return controller, queries
+
+
+@pytest.mark.anyio
+async def test_get_base_user_hydrates_games_in_fixed_queries():
+    users, games = seed(n_users=3, games_per_user=50)
+    controller, queries = make_controller(users, games)
+
+    user = await controller.get_base_user(users[0]["user_id"], games_limit=100)
+
+    assert queries.calls == 2
+    assert len(user.games) == 100
+    assert user.games_next_cursor is None
+    for game in user.games:
+        assert game.owner.username.startswith("user-")
+        assert game.white_player and game.white_player.username.startswith("user-")
+        assert game.black_player and game.black_player.username.startswith("user-")
+
+
+@pytest.mark.anyio
+async def test_get_games_by_auth_token_hydrates_games_in_fixed_queries():
+    users, games = seed(n_users=3, games_per_user=200)
+    controller, queries = make_controller(users, games)
+
+    result, cursor = await controller.get_games_by_auth_token("auth0|1", limit=200)
+
+    assert queries.calls == 2
+    assert len(result) == 200
+    assert cursor is not None
+
+
+@pytest.mark.parametrize("sort", ["last_updated_at", "created_at"])
+@pytest.mark.anyio
+async def test_games_pages_cover_every_game_once(sort):
+    users, games = seed(n_users=3, games_per_user=25)
+    controller, queries = make_controller(users, games)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = await controller.get_games_by_auth_token(
+            "auth0|1", sort, 7, cursor
+        )
+        seen.extend(game.game_id for game in page)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 8
+    assert len(seen) == len(set(seen)) == 50
+    # each page is one query, plus the user lookup on the first page only
+    assert queries.calls == pages + 1
+
+
+@pytest.mark.anyio
+async def test_users_pages_cover_every_user_once():
+    users, games = seed(n_users=12, games_per_user=2)
+    controller, _ = make_controller(users, games)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = await controller.get_base_users(5, cursor, games_limit=1)
+        seen.extend(user.username for user in page)
+        assert all(len(user.games) == 1 and user.games_next_cursor for user in page)
+        if cursor is None:
+            break
+
+    assert seen == [f"user-{i}" for i in reversed(range(12))]
+
+
+@pytest.mark.anyio
+async def test_cursor_is_tied_to_its_sort():
+    users, games = seed(n_users=2, games_per_user=5)
+    controller, _ = make_controller(users, games)
+    _, cursor = await controller.get_games_by_auth_token("auth0|0", limit=2)
+
+    with pytest.raises(HTTPException) as wrong_sort:
+        await controller.get_games_by_auth_token("auth0|0", "created_at", 2, cursor)
+    assert wrong_sort.value.status_code == 400
+
+
+@pytest.mark.parametrize("n_users", [1, 10, 100, 500])
+@pytest.mark.anyio
+async def test_get_base_users_query_count_is_constant(n_users):
+    """GET /users must not issue more queries as the user count grows (timed in benchmarks/users_page.py)"""
+    users, games = seed(n_users=n_users, games_per_user=3)
+    controller, queries = make_controller(users, games)
+
+    result, cursor = await controller.get_base_users(limit=n_users)
+
+    assert queries.calls == 2
+    assert cursor is None
+    assert len(result) == n_users
+    by_name = {user.username: user for user in result}
+    # each user owns three games and is black in their neighbour's three
+    expected = 3 if n_users == 1 else 6
+    assert all(len(user.games) == expected for user in result)
+    for game in by_name["user-0"].games:
+        assert game.owner.username.startswith("user-")
+        assert game.black_player and game.black_player.username.startswith("user-")
+        assert "user-0" in (game.owner.username, game.black_player.username)
+
+
+@pytest.mark.anyio
+async def test_user_etag_changes_with_their_games():
+    users, games = seed(n_users=2, games_per_user=2)
+    controller, _ = make_controller(users, games)
+    user_id = users[0]["user_id"]
+
+    etag = await controller.get_user_etag(user_id)
+    assert await controller.get_user_etag(user_id) == etag
+
+    games[0]["version"] += 1
+    games[0]["last_updated_at"] += timedelta(microseconds=1)
+    assert await controller.get_user_etag(user_id) != etag
+    etag = await controller.get_user_etag(user_id)
+
+    games.pop()
+    assert await controller.get_user_etag(user_id) != etag
+
+    with pytest.raises(HTTPException) as missing:
+        await controller.get_user_etag(uuid4())
+    assert missing.value.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_user_etag_differs_for_each_page_of_their_games():
+    users, games = seed(n_users=2, games_per_user=2)
+    controller, _ = make_controller(users, games)
+    user_id = users[0]["user_id"]
+
+    pages = [
+        await controller.get_user_etag(user_id),
+        await controller.get_user_etag(user_id, games_sort="created_at"),
+        await controller.get_user_etag(user_id, games_limit=1),
+        await controller.get_user_etag(user_id, games_cursor="next"),
+    ]
+
+    assert len(set(pages)) == len(pages)
+    assert await controller.get_user_etag(user_id, games_limit=1) == pages[2]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("export_format", ["pgn", "ndjson"])
+async def test_export_streams_every_game_a_page_at_a_time(monkeypatch, export_format):
+    monkeypatch.setattr(games_module, "EXPORT_PAGE_SIZE", 4)
+    users, games = seed(3, 5)
+    games[0]["moves"] = "f2f3 e7e5 g2g4 d8h4"
+    controller, queries = make_controller(users, games)
+    controller.gc.boards = DatabaseBoardStore(queries)  # type: ignore
+    user_id = users[0]["user_id"]
+
+    chunks = []
+    stream = await controller.export_games_by_user_id(user_id, export_format)
+    async for chunk in stream:
+        chunks.append(chunk)
+        # nothing is read ahead of the game being sent
+        assert queries.calls <= 2 + len(chunks) // 4
+
+    # user-0 owns five games and plays black in five of user-2's
+    assert len(chunks) == 10
+    if export_format == "pgn":
+        exported = [chess.pgn.read_game(io.StringIO(chunk)) for chunk in chunks]
+        mated = next(g for g in exported if g.headers["Result"] == "0-1")
+        assert mated.headers["White"] == "user-0"
+        assert mated.end().board().is_checkmate()
+    else:
+        records = [json.loads(chunk) for chunk in chunks]
+        assert chunks[0].endswith("\n")
+        assert {r["game_id"] for r in records} == {
+            g["game_id"] for g in queries._games_of(user_id)
+        }
+        mated = next(r for r in records if r["result"] == "0-1")
+        assert mated["moves"] == ["f2f3", "e7e5", "g2g4", "d8h4"]
+
+
+@pytest.mark.anyio
+async def test_export_of_an_unknown_user_is_a_404():
+    controller, _ = make_controller(*seed(1, 1))
+    with pytest.raises(HTTPException) as error:
+        await controller.export_games_by_user_id(uuid4(), "pgn")
+    assert error.value.status_code == 404
+
+
+class FakeEngine:
+    """Answers every search with the same move"""
+
+    def __init__(self, move: str) -> None:
+        self.move = move
+        self.searched: list[str] = []
+
+    async def best_move(self, game_id, fen: str) -> str | None:
+        self.searched.append(fen)
+        # stands in for the queries and search time of a real reply
+        with track_query("games", "engine"):
+            pass
+        return self.move
+
+    def is_full(self) -> bool:
+        return False
+
+
+class BusyEngine(FakeEngine):
+    """Has no free worker for the first `busy` searches"""
+
+    def __init__(self, move: str, busy: int) -> None:
+        super().__init__(move)
+        self.busy = busy
+
+    async def best_move(self, game_id, fen: str) -> str | None:
+        if self.busy:
+            self.busy -= 1
+            raise EngineBusyError("Every engine worker is busy")
+        return await super().best_move(game_id, fen)
+
+
+@pytest.fixture
+def engine_game(game_row):
+    """A controller over one game, the human playing white and the engine black"""
+    controller = APIController()
+    game_row.players = {
+        "white_player_id": str(uuid4()),
+        "white_player_username": "human",
+        "black_player_id": str(ENGINE_USER_ID),
+        "black_player_username": "engine",
+    }
+    controller.gc.queries = game_row
+    controller.gc.boards = DatabaseBoardStore(game_row)  # type: ignore
+    controller.gc.cache = BoardCache()
+    controller.engine = FakeEngine("e7e5")  # type: ignore
+    return controller, game_row
+
+
+@pytest.mark.anyio
+async def test_engine_replies_on_its_turn_only(engine_game):
+    controller, row = engine_game
+    game_id = uuid4()
+
+    await controller.play_engine_move(game_id)
+    assert controller.engine.searched == []
+
+    game = await controller.gc.make_moves(
+        await controller.gc.get_detailed_game_by_uuid(game_id), ["e2e4"]
+    )
+    assert controller.engine_to_move(game)
+    async with controller.broadcaster.subscribe(game_id) as updates:
+        await controller.play_engine_move(game_id)
+        published = json.loads(await updates.get())
+
+    assert published["turn"] == "white"
+    assert row.row["moves"] == "e2e4 e7e5"
+    assert len(controller.engine.searched) == 1
+
+
+@pytest.mark.anyio
+async def test_engine_replies_run_outside_the_request_that_asked(engine_game):
+    controller, row = engine_game
+    game_id = uuid4()
+    game = await controller.gc.make_moves(
+        await controller.gc.get_detailed_game_by_uuid(game_id), ["e2e4"]
+    )
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(controller.play_engine_moves)
+        async with controller.broadcaster.subscribe(game_id) as updates:
+            with count_queries() as request:
+                if controller.engine_to_move(game):
+                    controller.reply_later(game_id)
+            published = json.loads(await updates.get())
+        tg.cancel_scope.cancel()
+
+    assert published["turn"] == "white"
+    assert row.row["moves"] == "e2e4 e7e5"
+    assert request.count == 0
+
+
+@pytest.mark.anyio
+async def test_engine_replies_lost_to_busy_workers_are_asked_for_again(
+    monkeypatch, engine_game
+):
+    monkeypatch.setattr(controller_module, "ENGINE_RETRY_SECONDS", 0)
+    controller, row = engine_game
+    controller.engine = BusyEngine("e7e5", busy=ENGINE_RETRIES + 2)  # type: ignore
+    game_id = uuid4()
+    await controller.gc.make_moves(
+        await controller.gc.get_detailed_game_by_uuid(game_id), ["e2e4"]
+    )
+
+    await controller.play_engine_move(game_id)
+    assert row.row["moves"] == "e2e4"
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(controller.play_engine_moves)
+        async with controller.broadcaster.subscribe(game_id) as updates:
+            # as after a restart, reading the game asks for the reply again
+            await controller.get_detailed_game(game_id)
+            await controller.get_detailed_game(game_id)
+            published = json.loads(await updates.get())
+        tg.cancel_scope.cancel()
+
+    assert published["turn"] == "white"
+    assert row.row["moves"] == "e2e4 e7e5"
+    # both reads asked for one reply, which was played once
+    assert len(controller.engine.searched) == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "batch",
+    [MoveBatch(moves=["e2e4", "e7e5"]), MoveBatch(pgn="1. e4 e5 2. Nf3 Nc6 *")],
+)
+async def test_batches_may_not_play_the_engine_side(batch, engine_game):
+    controller, row = engine_game
+    game_id = uuid4()
+    human = DetailedUser(
+        self="",
+        user_id=UUID(row.players["white_player_id"]),
+        username="human",
+        name="Human",
+        auth0_id="auth0|human",
+    )
+    controller.uc.cache = UserCache()
+    controller.uc.cache.put(human)
+
+    with pytest.raises(HTTPException) as error:
+        await controller.make_moves("auth0|human", game_id, batch)
+
+    assert error.value.status_code == 400
+    assert row.row["moves"] is None
+    # one move at a time is still played
+    await controller.make_moves("auth0|human", game_id, MoveBatch(moves=["e2e4"]))
+    assert row.row["moves"] == "e2e4"
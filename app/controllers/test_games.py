@@ -0,0 +1,148 @@
+from uuid import uuid4
+
+import pytest
+from fastapi import HTTPException
+
+from .board_cache import BoardCache
+from .boards import DatabaseBoardStore
+from .games import GameController
+from .position_cache import PositionCache
+
+
+@pytest.fixture
+def controller(game_row):
+    controller = GameController()
+    controller.queries = game_row
+    controller.boards = DatabaseBoardStore(controller.queries)  # type: ignore
+    controller.cache = BoardCache()
+    return controller
+
+
+@pytest.mark.anyio
+async def test_moves_are_stored_in_one_write(controller, make_game):
+    game = make_game(uuid4())
+
+    updated = await controller.make_moves(game, ["e2e4", "e7e5", "g1f3"])
+
+    assert controller.queries.updates == 1
+    assert controller.queries.row["moves"] == "e2e4 e7e5 g1f3"
+    assert updated.turn == "black"
+    assert updated.turn_count == 2
+
+
+@pytest.mark.anyio
+async def test_a_batch_with_an_illegal_move_stores_nothing(controller, make_game):
+    game = make_game(uuid4())
+
+    with pytest.raises(HTTPException) as error:
+        await controller.make_moves(game, ["e2e4", "e7e5", "e4e5"])
+
+    assert error.value.status_code == 400
+    assert "move 3 of 3 (e4e5)" in error.value.detail
+    assert controller.queries.updates == 0
+    assert (await controller.get_board(game.game_id)).ply() == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("null", ["0000", "e2e2"])
+async def test_null_moves_are_illegal(controller, null, make_game):
+    game = make_game(uuid4())
+
+    with pytest.raises(HTTPException) as error:
+        await controller.make_moves(game, ["e2e4", null, "d2d4"])
+
+    assert error.value.status_code == 400
+    assert f"move 2 of 3 ({null})" in error.value.detail
+    assert controller.queries.updates == 0
+
+
+@pytest.mark.anyio
+async def test_moves_are_tried_again_after_a_write_that_was_not_a_move(
+    controller, make_game
+):
+    game = make_game(uuid4())
+    update_board = controller.queries.update_board
+
+    async def assigned_first(*args) -> bool:
+        controller.queries.update_board = update_board
+        await controller.queries.update_last_updated_at(game.game_id, 0)
+        return await update_board(*args)
+
+    controller.queries.update_board = assigned_first
+
+    updated = await controller.make_moves(game, ["e2e4"])
+
+    assert updated.turn == "black"
+    assert controller.queries.row["moves"] == "e2e4"
+    assert controller.queries.row["version"] == 2
+
+
+@pytest.mark.anyio
+async def test_moves_chosen_before_another_move_landed_are_refused(
+    controller, make_game
+):
+    game = make_game(uuid4())
+    await controller.make_moves(game, ["e2e4", "e7e5"])
+
+    with pytest.raises(HTTPException) as error:
+        await controller.make_moves(game, ["d2d4"])
+
+    assert error.value.status_code == 409
+    assert controller.queries.row["moves"] == "e2e4 e7e5"
+
+
+PGN = """[Event "Casual game"]
+[White "a"]
+[Black "b"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 {Ruy Lopez} a6 *
+"""
+
+
+@pytest.mark.anyio
+async def test_a_pgn_adds_only_the_moves_not_yet_played(controller, make_game):
+    game = await controller.make_moves(make_game(uuid4()), ["e2e4", "e7e5"])
+
+    ucis = await controller.moves_from_pgn(game.game_id, PGN)
+
+    assert ucis == ["g1f3", "b8c6", "f1b5", "a7a6"]
+    await controller.make_moves(game, ucis)
+    assert await controller.moves_from_pgn(game.game_id, PGN) == []
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "pgn, status",
+    [
+        ("1. e4 e5 2. Ke3 *", 400),
+        ('[FEN "8/8/8/8/8/8/8/K6k w - - 0 1"]\n\n1. Kb1 *', 400),
+        ("1. d4 d5 *", 409),
+    ],
+)
+async def test_pgns_that_do_not_continue_the_game_are_refused(
+    controller, pgn, status, make_game
+):
+    game = make_game(uuid4())
+    await controller.make_moves(game, ["e2e4"])
+
+    with pytest.raises(HTTPException) as error:
+        await controller.moves_from_pgn(game.game_id, pgn)
+
+    assert error.value.status_code == status
+
+
+@pytest.mark.anyio
+async def test_legal_moves_follow_the_game(controller, make_game):
+    controller.legal_moves = PositionCache()
+    game = make_game(uuid4())
+
+    first = await controller.get_legal_moves(game.game_id)
+    again = await controller.get_legal_moves(game.game_id)
+    await controller.make_moves(game, ["e2e4"])
+    after = await controller.get_legal_moves(game.game_id)
+
+    assert first.turn == "white" and first.moves["e2"] == ["e3", "e4"]
+    assert again.moves == first.moves
+    assert after.turn == "black" and "e2" not in after.moves
+    stats = controller.legal_moves.stats()
+    assert (stats.hits, stats.misses) == (1, 2)
@@ -0,0 +1,124 @@
+import random
+
+import pytest
+from chess import Board
+
+from app.models.game import GameStatus
+
+from .position_cache import (
+    PositionCache,
+    game_status,
+    legal_moves_by_square,
+)
+
+
+def test_positions_reached_by_different_move_orders_share_an_entry():
+    cache: PositionCache[dict] = PositionCache()
+    computed = []
+
+    def compute(board: Board) -> dict:
+        computed.append(board.fen())
+        return legal_moves_by_square(board)
+
+    first, second = Board(), Board()
+    for uci in ("g1f3", "g8f6", "b1c3"):
+        first.push_uci(uci)
+    for uci in ("b1c3", "g8f6", "g1f3"):
+        second.push_uci(uci)
+
+    assert cache.get_or_compute(first, compute) is cache.get_or_compute(second, compute)
+    assert len(computed) == 1
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (1, 1, 1)
+
+
+def test_cache_evicts_least_recently_used_positions():
+    cache: PositionCache[int] = PositionCache(max_entries=2)
+    boards = [Board(), Board(), Board()]
+    boards[1].push_uci("e2e4")
+    boards[2].push_uci("d2d4")
+    for board in boards:
+        cache.get_or_compute(board, lambda b: len(b.move_stack))
+    assert cache.stats().evictions == 1
+    assert cache.get_or_compute(boards[0], lambda b: -1) == -1
+
+
+def test_legal_moves_are_grouped_by_square_with_promotions():
+    moves = legal_moves_by_square(Board())
+    assert moves["e2"] == ["e3", "e4"]
+    assert sorted(moves["g1"]) == ["f3", "h3"]
+    assert sum(len(to) for to in moves.values()) == 20
+
+    promotion = Board("8/4P3/8/8/8/8/8/k6K w - - 0 1")
+    assert sorted(legal_moves_by_square(promotion)["e7"]) == [
+        "e8b",
+        "e8n",
+        "e8q",
+        "e8r",
+    ]
+
+
+def expected_status(board: Board) -> dict:
+    outcome = board.outcome()
+    if outcome is None:
+        return {"game_state": "in progress", "result": "*", "draw_reason": None}
+    draw_reason = None if outcome.winner is not None else outcome.termination.name
+    return {
+        "game_state": "finished",
+        "result": outcome.result(),
+        "draw_reason": draw_reason and draw_reason.lower(),
+    }
+
+
+@pytest.mark.parametrize(
+    "fen, ucis, checkmate, stalemate",
+    [
+        (None, ["f2f3", "e7e5", "g2g4", "d8h4"], True, False),
+        ("7k/5Q2/6K1/8/8/8/8/8 w - - 0 1", ["f7f8"], True, False),
+        ("7k/8/6Q1/8/8/8/8/K7 w - - 0 1", ["g6f7"], False, True),
+        ("7k/8/8/8/8/8/6B1/K7 w - - 0 1", [], False, False),
+        ("7k/8/8/8/8/8/6R1/K7 w - - 149 120", ["g2g3"], False, False),
+        (None, ["g1f3", "g8f6", "f3g1", "f6g8"] * 4, False, False),
+    ],
+)
+def test_status_agrees_with_the_outcome(fen, ucis, checkmate, stalemate):
+    board = Board(fen) if fen else Board()
+    for uci in ucis:
+        board.push_uci(uci)
+
+    status = game_status(board, PositionCache())
+
+    assert status.model_dump(include={"game_state", "result", "draw_reason"}) == (
+        expected_status(board)
+    )
+    assert (status.checkmate, status.stalemate) == (checkmate, stalemate)
+    assert status.check == board.is_check()
+
+
+def test_statuses_of_random_games_agree_with_the_outcome():
+    cache: PositionCache[GameStatus] = PositionCache()
+    rng = random.Random(19)
+    for _ in range(10):
+        board = Board()
+        while not board.is_game_over():
+            board.push(rng.choice(list(board.legal_moves)))
+            status = game_status(board, cache)
+            assert status.model_dump(
+                include={"game_state", "result", "draw_reason"}
+            ) == expected_status(board)
+    assert cache.stats().hits > 0
+
+
+def test_a_repeated_position_is_cached_until_it_repeats_five_times():
+    cache: PositionCache[GameStatus] = PositionCache()
+    board = Board()
+    statuses = []
+    for uci in ["g1f3", "g8f6", "f3g1", "f6g8"] * 4:
+        board.push_uci(uci)
+        statuses.append(game_status(board, cache))
+
+    assert cache.stats().misses == 4
+    assert statuses[-5].game_state == "in progress"
+    assert statuses[-1].draw_reason == "fivefold_repetition"
+    # the cached entry for the position itself is untouched
+    assert cache.get_or_compute(board, lambda b: None).game_state == "in progress"
@@ -0,0 +1,138 @@
+import builtins
+import io
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+import pytest
+
+from app.db.base import count_queries
+from app.db.games import GameQueries
+from app.db.users import UserQueries
+from app.models.move import Move
+from app.models.users import NewUser
+
+from .board_cache import BoardCache
+from .boards import JournalBoardStore
+from .controller import APIController
+from .unit_of_work import unit_of_work
+from .user_cache import UserCache
+
+
+class Counts:
+    def __init__(self) -> None:
+        self.queries = 0
+        self.file_opens = 0
+
+
+@contextmanager
+def counting(monkeypatch) -> Iterator[Counts]:
+    """Count the queries and file opens within the block"""
+    counts = Counts()
+    os_open, io_open = os.open, io.open
+
+    def counted_os_open(*args, **kwargs):
+        counts.file_opens += 1
+        return os_open(*args, **kwargs)
+
+    def counted_open(*args, **kwargs):
+        counts.file_opens += 1
+        return io_open(*args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "open", counted_os_open)
+        # pathlib opens through io.open, the journal through the builtin
+        patch.setattr(io, "open", counted_open)
+        patch.setattr(builtins, "open", counted_open)
+        with count_queries() as queries:
+            yield counts
+    counts.queries = queries.count
+
+
+@pytest.fixture
+async def controller(sqlite_pool, tmp_path):
+    controller = APIController()
+    controller.uc.queries = UserQueries(sqlite_pool)
+    # users are left to the unit of work, to count what it saves on its own
+    controller.uc.cache = UserCache(max_entries=0)
+    controller.gc.queries = GameQueries(sqlite_pool)
+    games_dir = tmp_path / "games"
+    games_dir.mkdir()
+    controller.gc.boards = JournalBoardStore(controller.gc.queries, str(games_dir))
+    # nothing is cached across requests, so every board is read from its files
+    controller.gc.cache = BoardCache(max_entries=0)
+    for name in ("owner", "opponent"):
+        await controller.uc.queries.insert_user(
+            NewUser(username=name, name=name), f"auth0|{name}"
+        )
+    return controller
+
+
+async def request(monkeypatch, call) -> Counts:
+    """Serve a call the way the app serves a request, in a unit of work of its own"""
+    with unit_of_work(), counting(monkeypatch) as counts:
+        await call()
+    return counts
+
+
+@pytest.mark.anyio
+async def test_each_row_and_board_is_read_once_per_request(controller, monkeypatch):
+    game_id = await controller.create_game("auth0|owner")
+    opponent = await controller.uc.queries.get_auth0_id("auth0|opponent")
+
+    async def assign() -> None:
+        await controller.assign_player(
+            game_id, "auth0|owner", opponent["user_id"], "black"
+        )
+
+    async def get_game() -> None:
+        await controller.get_game_etag(game_id)
+        await controller.get_detailed_game(game_id)
+
+    async def get_moves() -> None:
+        await controller.get_legal_moves_etag(game_id)
+        await controller.get_legal_moves(game_id)
+
+    async def move() -> None:
+        await controller.make_move("auth0|owner", game_id, Move(start="e2", end="e4"))
+
+    # two users, the game, one write for both players and the game once more
+    assert vars(await request(monkeypatch, assign)) == {
+        "queries": 5,
+        "file_opens": 0,
+    }
+    # the version, then the row; the board's lock and journal
+    assert vars(await request(monkeypatch, get_game)) == {
+        "queries": 2,
+        "file_opens": 2,
+    }
+    # the version, once, then the board
+    assert vars(await request(monkeypatch, get_moves)) == {
+        "queries": 1,
+        "file_opens": 2,
+    }
+    # the user, the game, the write and the game after it; the board is read once,
+    # then the lock and the journal are opened to append the move
+    assert vars(await request(monkeypatch, move)) == {
+        "queries": 4,
+        "file_opens": 4,
+    }
+    game = await controller.get_detailed_game(game_id)
+    assert game.turn == "black" and game.black_player is not None
+
+
+@pytest.mark.anyio
+async def test_writes_are_seen_by_the_rest_of_the_request(controller):
+    game_id = await controller.create_game("auth0|owner")
+    opponent = await controller.uc.queries.get_auth0_id("auth0|opponent")
+
+    with unit_of_work():
+        before = await controller.get_detailed_game(game_id)
+        await controller.assign_player(
+            game_id, "auth0|owner", opponent["user_id"], "white"
+        )
+        after = await controller.get_detailed_game(game_id)
+
+    assert before.white_player is None
+    assert after.white_player is not None
+    assert after.white_player.username == "opponent"
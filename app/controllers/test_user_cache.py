@@ -0,0 +1,108 @@
+from uuid import uuid4
+
+import pytest
+
+from app.models.users import DetailedUser, NewUser
+
+from . import user_cache
+from .user_cache import UserCache
+from .users import UserController
+
+
+def make_user(auth0_id: str = "auth0|a") -> DetailedUser:
+    user_id = uuid4()
+    return DetailedUser(
+        self=f"users/{user_id}",
+        user_id=user_id,
+        username="a",
+        name="A",
+        auth0_id=auth0_id,
+    )
+
+
+def test_cache_finds_users_by_id_and_auth0_id():
+    cache = UserCache()
+    user = make_user()
+    assert cache.get_by_auth0_id("auth0|a") is None
+    cache.put(user)
+    assert cache.get(user.user_id) == user
+    assert cache.get_by_auth0_id("auth0|a") == user
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.entries) == (2, 1, 1)
+
+
+def test_cached_users_are_copies():
+    cache = UserCache()
+    user = make_user()
+    cache.put(user)
+    cached = cache.get(user.user_id)
+    assert cached is not None
+    cached.games_next_cursor = "page-2"
+    assert cache.get(user.user_id).games_next_cursor is None  # type: ignore
+
+
+def test_cache_evicts_least_recently_used():
+    cache = UserCache(max_entries=2)
+    first, second, third = make_user("1"), make_user("2"), make_user("3")
+    cache.put(first)
+    cache.put(second)
+    cache.get(first.user_id)
+    cache.put(third)
+    assert cache.get_by_auth0_id("2") is None
+    assert cache.get(first.user_id) is not None
+    assert cache.stats().evictions == 1
+
+
+def test_cache_expires_users(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(user_cache.time, "monotonic", lambda: now)
+    cache = UserCache(ttl_seconds=60)
+    user = make_user()
+    cache.put(user)
+    now += 59
+    assert cache.get_by_auth0_id("auth0|a") is not None
+    now += 1
+    assert cache.get_by_auth0_id("auth0|a") is None
+    assert cache.get(user.user_id) is None
+    stats = cache.stats()
+    assert (stats.entries, stats.expirations) == (0, 1)
+
+
+class UserRows:
+    """Stands in for UserQueries, counting the queries"""
+
+    def __init__(self) -> None:
+        self.rows: list[dict] = []
+        self.calls = 0
+
+    async def insert_user(self, user: NewUser, auth0_id: str):
+        self.calls += 1
+        row = {**user.model_dump(), "user_id": uuid4(), "auth0_id": auth0_id}
+        self.rows.append(row)
+        return row["user_id"]
+
+    async def get_auth0_id(self, auth0_id: str) -> dict | None:
+        self.calls += 1
+        return next((r for r in self.rows if r["auth0_id"] == auth0_id), None)
+
+    async def get_by_uuids(self, user_ids) -> list[dict]:
+        self.calls += 1
+        return [r for r in self.rows if r["user_id"] in user_ids]
+
+
+@pytest.mark.anyio
+async def test_created_users_are_found_without_a_query():
+    controller = UserController()
+    controller.queries = UserRows()  # type: ignore
+    controller.cache = UserCache()
+
+    created = await controller.create_user(
+        NewUser(username="a", name="A"), {"sub": "auth0|a"}
+    )
+    found = await controller.get_user_by_auth_id("auth0|a")
+    await controller.get_user_by_auth_id("auth0|a")
+    others = await controller.get_users_by_uuids([created.user_id])
+
+    assert found.user_id == others[0].user_id == created.user_id
+    # the insert only
+    assert controller.queries.calls == 1
@@ -0,0 +1,81 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from uuid import UUID
+
+from chess import Board
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.models.users import DetailedUser
+
+
+class UnitOfWork:
+    """
+    The game rows, users and boards read while serving one request, so that each is read
+    at most once however many controller methods ask for it.
+    Writes still go straight to the database, each as one statement, and forget the game
+    they change, so that the next read within the request sees the write.
+    """
+
+    def __init__(self) -> None:
+        self.games: dict[UUID, dict] = {}
+        # versions read on their own, e.g. for an ETag, before or without the row
+        self.versions: dict[UUID, int] = {}
+        self.boards: dict[tuple[UUID, int], Board] = {}
+        self.users: dict[UUID, DetailedUser] = {}
+        self.user_ids_by_auth0_id: dict[str, UUID] = {}
+
+    def version(self, game_id: UUID) -> int | None:
+        game_data = self.games.get(game_id)
+        if game_data is not None:
+            return game_data["version"]
+        return self.versions.get(game_id)
+
+    def add_user(self, user: DetailedUser) -> None:
+        self.users[user.user_id] = user
+        self.user_ids_by_auth0_id[user.auth0_id] = user.user_id
+
+    def user_by_auth0_id(self, auth0_id: str) -> DetailedUser | None:
+        user_id = self.user_ids_by_auth0_id.get(auth0_id)
+        return None if user_id is None else self.users.get(user_id)
+
+    def forget_game(self, game_id: UUID) -> None:
+        # boards are kept, they are keyed by version and a write makes a new one
+        self.games.pop(game_id, None)
+        self.versions.pop(game_id, None)
+
+
+_unit_of_work: ContextVar[UnitOfWork | None] = ContextVar("unit_of_work", default=None)
+
+
+def current_unit_of_work() -> UnitOfWork | None:
+    """The unit of work of the request being served, or None outside of one"""
+    return _unit_of_work.get()
+
+
+@contextmanager
+def unit_of_work() -> Iterator[UnitOfWork]:
+    """Read through a fresh unit of work within the block, e.g. one request"""
+    unit = UnitOfWork()
+    token = _unit_of_work.set(unit)
+    try:
+        yield unit
+    finally:
+        _unit_of_work.reset(token)
+
+
+class UnitOfWorkMiddleware:
+    """
+    Serves each HTTP request in a unit of work of its own. Websockets are left out,
+    as a stream outlives any one read of the game.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with unit_of_work():
+            await self.app(scope, receive, send)
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from app.models.users import DetailedUser
+
+
+class UserCacheStats(BaseModel):
+    """Counters for the in-process user cache"""
+
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+
+class UserCache:
+    """
+    A bounded LRU cache of users keyed by user id, and found by auth0 id as well.
+    Users expire `ttl_seconds` after they were cached, which bounds how long another
+    process's change to a user can go unseen; this process never updates a user.
+    Cached users are shared, callers get a copy to attach their games to.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 300.0) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # user, and when it expires
+        self._users: OrderedDict[UUID, tuple[DetailedUser, float]] = OrderedDict()
+        self._by_auth0_id: dict[str, UUID] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, user_id: UUID) -> DetailedUser | None:
+        with self._lock:
+            return self._get(user_id)
+
+    def get_by_auth0_id(self, auth0_id: str) -> DetailedUser | None:
+        with self._lock:
+            user_id = self._by_auth0_id.get(auth0_id)
+            if user_id is None:
+                self._misses += 1
+                return None
+            return self._get(user_id)
+
+    def _get(self, user_id: UUID) -> DetailedUser | None:
+        entry = self._users.get(user_id)
+        if entry is not None and entry[1] <= time.monotonic():
+            self._remove(user_id)
+            self._expirations += 1
+            entry = None
+        if entry is None:
+            self._misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self._hits += 1
+        return entry[0].model_copy()
+
+    def put(self, user: DetailedUser) -> None:
+        if self.max_entries < 1:
+            return
+        with self._lock:
+            self._remove(user.user_id)
+            self._users[user.user_id] = (
+                user.model_copy(),
+                time.monotonic() + self.ttl_seconds,
+            )
+            self._by_auth0_id[user.auth0_id] = user.user_id
+            while len(self._users) > self.max_entries:
+                self._remove(next(iter(self._users)))
+                self._evictions += 1
+
+    def invalidate(self, user_id: UUID) -> None:
+        with self._lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id: UUID) -> None:
+        entry = self._users.pop(user_id, None)
+        if entry is not None:
+            self._by_auth0_id.pop(entry[0].auth0_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+            self._by_auth0_id.clear()
+
+    def stats(self) -> UserCacheStats:
+        with self._lock:
+            return UserCacheStats(
+                entries=len(self._users),
+                max_entries=self.max_entries,
+                ttl_seconds=self.ttl_seconds,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+            )
+
+
+def new_user_cache() -> UserCache:
+    """A user cache bounded by USER_CACHE_SIZE and USER_CACHE_TTL_SECONDS"""
+    return UserCache(
+        max_entries=int(os.getenv("USER_CACHE_SIZE", "4096")),
+        ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "300")),
+    )
@@ -1,16 +1,19 @@
 from uuid import UUID
 
 from fastapi import HTTPException
-from icecream import ic
 
+from app.controllers.pagination import DEFAULT_LIMIT, decode_cursor, next_cursor
+from app.controllers.unit_of_work import current_unit_of_work
+from app.controllers.user_cache import new_user_cache
 from app.db.users import UserQueries
 from app.models.game import BasicUserInfo
 from app.models.users import BaseUser, DetailedUser, NewUser
 
 
 class UserController:
-    def __init__(self) -> None:
-        self.queries = UserQueries()
+    def __init__(self, queries: UserQueries | None = None) -> None:
+        self.queries = queries or UserQueries()
+        self.cache = new_user_cache()
 
     def construct_user(self, user_data: dict) -> DetailedUser:
         try:
@@ -23,26 +26,105 @@ class UserController:
                 auth0_id=user_data["auth0_id"],
             )
         except Exception as e:
-            ic(e)
-            raise ValueError("Error constructing user")
+            raise ValueError("Error constructing user") from e
 
-    def get_all_users(self) -> list[DetailedUser]:
-        users_data = self.queries.get_all_users()
+    async def get_all_users(self) -> list[DetailedUser]:
+        users_data = await self.queries.get_all_users()
         return [self.construct_user(user) for user in users_data]
 
-    def get_user_by_uuid(self, user_id: UUID) -> DetailedUser:
-        user_data = self.queries.get_by_uuid(user_id)
+    async def get_users_page(
+        self, limit: int = DEFAULT_LIMIT, cursor: str | None = None
+    ) -> tuple[list[DetailedUser], str | None]:
+        """A page of users, newest first, and the cursor for the next page"""
+        after, after_id = (
+            decode_cursor(cursor, "created_at") if cursor else (None, None)
+        )
+        users_data = await self.queries.get_page(limit + 1, after, after_id)
+        cursor = next_cursor(users_data, limit, "created_at", "user_id")
+        users = [self.construct_user(user) for user in users_data]
+        for user in users[:limit]:
+            self.cache.put(user)
+        return users, cursor
+
+    def remember(self, user: DetailedUser) -> DetailedUser:
+        """Keep a user just read or created, for the rest of the request and for later ones"""
+        self.cache.put(user)
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.add_user(user)
+        return user.model_copy()
+
+    def recall(
+        self, user_id: UUID | None = None, auth0_id: str | None = None
+    ) -> DetailedUser | None:
+        """The user if already read in this unit of work, or still cached"""
+        unit = current_unit_of_work()
+        if unit is not None:
+            known = (
+                unit.users.get(user_id)
+                if user_id is not None
+                else unit.user_by_auth0_id(auth0_id or "")
+            )
+            if known is not None:
+                return known.model_copy()
+        if user_id is not None:
+            user = self.cache.get(user_id)
+        else:
+            user = self.cache.get_by_auth0_id(auth0_id or "")
+        if user is not None and unit is not None:
+            # kept as is for the rest of the request, even if it expires meanwhile
+            unit.add_user(user.model_copy())
+        return user
+
+    async def get_user_by_uuid(self, user_id: UUID) -> DetailedUser:
+        user = self.recall(user_id=user_id)
+        if user is not None:
+            return user
+        user_data = await self.queries.get_by_uuid(user_id)
         if user_data is None:
             raise HTTPException(status_code=404, detail="User not found")
-        return self.construct_user(user_data)
+        return self.remember(self.construct_user(user_data))
+
+    async def get_users_by_uuids(self, user_ids: list[UUID]) -> list[DetailedUser]:
+        """The users that exist, reading only those that are not cached"""
+        users = []
+        missing = []
+        for user_id in user_ids:
+            user = self.recall(user_id=user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                users.append(user)
+        if missing:
+            users_data = await self.queries.get_by_uuids(missing)
+            users.extend(self.remember(self.construct_user(u)) for u in users_data)
+        return users
 
-    def create_user(self, user: NewUser, auth_result: dict) -> BaseUser:
+    async def create_user(self, user: NewUser, auth_result: dict) -> BaseUser:
         # THIS HAS NOT YET BEEN FULLY TESTED
-        new_id = self.queries.insert_user(user, auth_result["sub"])
-        return self.get_user_by_uuid(new_id)
+        new_id = await self.queries.insert_user(user, auth_result["sub"])
+        # built from what was inserted, so the new user needs no read
+        return self.remember(
+            self.construct_user(
+                {
+                    "user_id": new_id,
+                    "username": user.username,
+                    "email": user.email,
+                    "name": user.name,
+                    "auth0_id": auth_result["sub"],
+                }
+            )
+        )
 
-    def get_user_by_auth_id(self, auth0_id: str) -> DetailedUser:
-        data = self.queries.get_auth0_id(auth0_id)
+    async def get_user_by_auth_id(self, auth0_id: str) -> DetailedUser:
+        """
+        The user signed in as `auth0_id`. Every authenticated request starts here,
+        so users are cached, and only read when not cached or expired.
+        """
+        user = self.recall(auth0_id=auth0_id)
+        if user is not None:
+            return user
+        data = await self.queries.get_auth0_id(auth0_id)
         if data is None:
             raise HTTPException(status_code=404, detail="User not found")
-        return self.construct_user(data)
+        return self.remember(self.construct_user(data))
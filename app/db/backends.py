@@ -0,0 +1,81 @@
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any
+
+from app.db.conn import connect_db
+from app.db.sqlite import SQLiteConnection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+SQLITE_PATH = os.path.join(os.path.dirname(__file__), "chess.sqlite3")
+
+
+class Backend(ABC):
+    """The database the app runs on: how to connect to it, and how its schema is migrated"""
+
+    name: str
+
+    @property
+    def migrations_dir(self) -> str:
+        return os.path.join(MIGRATIONS_DIR, self.name)
+
+    @abstractmethod
+    def connect(self) -> Any:
+        """A new connection, speaking the mysql.connector API"""
+
+    @abstractmethod
+    def already_applied(self, error: Exception) -> bool:
+        """Whether a migration statement failed because its change is already there"""
+
+
+class MySQLBackend(Backend):
+    name = "mysql"
+
+    def connect(self) -> Any:
+        # autocommit so a reused connection never holds a stale read snapshot
+        return connect_db(autocommit=True)
+
+    def already_applied(self, error: Exception) -> bool:
+        from mysql.connector import errorcode
+        from mysql.connector.errors import DatabaseError
+
+        return isinstance(error, DatabaseError) and error.errno in {
+            errorcode.ER_DUP_FIELDNAME,
+            errorcode.ER_DUP_KEYNAME,
+            errorcode.ER_TABLE_EXISTS_ERROR,
+        }
+
+
+class SQLiteBackend(Backend):
+    """An embedded database file, for single node deployments and running without MySQL"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH, statement_cache: int = 256) -> None:
+        self.path = path
+        self.statement_cache = statement_cache
+
+    def connect(self) -> Any:
+        return SQLiteConnection(self.path, self.statement_cache)
+
+    def already_applied(self, error: Exception) -> bool:
+        message = str(error)
+        return isinstance(error, sqlite3.OperationalError) and (
+            message.startswith("duplicate column name") or "already exists" in message
+        )
+
+
+@lru_cache()
+def get_backend() -> Backend:
+    """Pick the database from DB_BACKEND, `mysql` (default) or `sqlite`"""
+    backend = os.getenv("DB_BACKEND", "mysql").lower()
+    if backend == "mysql":
+        return MySQLBackend()
+    if backend == "sqlite":
+        return SQLiteBackend(
+            os.getenv("SQLITE_PATH", SQLITE_PATH),
+            int(os.getenv("SQLITE_STATEMENT_CACHE", "256")),
+        )
+    raise ValueError(f"Unknown DB_BACKEND: {backend}")
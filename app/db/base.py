@@ -0,0 +1,132 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, partial, wraps
+from typing import Awaitable, Callable, Iterator, ParamSpec, TypeVar
+
+import anyio
+from anyio import CapacityLimiter
+
+from app.db.pool import ConnectionPool, get_pool
+from app.monitoring.metrics import DB_QUERY_SECONDS
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+class QueryStats:
+    """How many queries ran within a `count_queries` block, and how long they took"""
+
+    def __init__(self, outer: "QueryStats | None" = None) -> None:
+        self.count = 0
+        self.seconds = 0.0
+        # the stats of an enclosing block, which count the same queries
+        self.outer = outer
+
+    def add(self, seconds: float) -> None:
+        stats: QueryStats | None = self
+        while stats is not None:
+            stats.count += 1
+            stats.seconds += seconds
+            stats = stats.outer
+
+
+# the stats of whoever is counting queries in this context, see `count_queries`
+_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@lru_cache()
+def get_db_limiter() -> CapacityLimiter:
+    """Bounds the worker threads running queries, one per pooled connection"""
+    return CapacityLimiter(int(os.getenv("DB_POOL_SIZE", "5")))
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """
+    Count and time the queries run within the block, e.g. by one request.
+    Executor threads run in a copy of the caller's context, so their queries are counted too.
+    Blocks nest: the queries of an inner block are counted by the blocks around it as well.
+    """
+    stats = QueryStats(_query_stats.get())
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+@contextmanager
+def track_query(table: str, kind: str) -> Iterator[None]:
+    """Time a query, for the metrics and for whoever is counting queries"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        DB_QUERY_SECONDS.observe(elapsed, table=table, kind=kind)
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.add(elapsed)
+
+
+def run_in_executor(func: Callable[P, R]) -> Callable[P, Awaitable[R]]:
+    """
+    Turn a blocking query method into a coroutine that runs on the bounded DB executor,
+    so a slow query never blocks the event loop
+    """
+
+    @wraps(func)
+    async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        return await anyio.to_thread.run_sync(
+            partial(func, *args, **kwargs), limiter=get_db_limiter()
+        )
+
+    return wrapper
+
+
+class BaseQueries:
+    """
+    Shared plumbing for running queries on a pooled connection.
+    Public query methods are wrapped with `run_in_executor`, the helpers here block.
+    """
+
+    def __init__(self, table: str, pool: ConnectionPool | None = None) -> None:
+        self.table = table
+        self._pool = pool
+
+    @property
+    def pool(self) -> ConnectionPool:
+        # resolved lazily so that constructing a query class never needs a DB
+        return self._pool if self._pool is not None else get_pool()
+
+    def fetch_all(self, query: str, params: tuple = ()) -> list[dict]:
+        with track_query(self.table, "fetch_all"), self.pool.connection() as db:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(query, params)
+            data_res = cursor.fetchall()
+            cursor.close()
+        data: list[dict] = [row for row in data_res]  # type: ignore
+        return data
+
+    def fetch_one(self, query: str, params: tuple = ()) -> dict | None:
+        with track_query(self.table, "fetch_one"), self.pool.connection() as db:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(query, params)
+            db_data = cursor.fetchone()
+            cursor.close()
+        if db_data is None:
+            return None
+        data: dict = db_data  # type: ignore
+        return data
+
+    def execute(self, query: str, params: tuple = ()) -> int:
+        """Run a write and return the number of affected rows"""
+        with track_query(self.table, "execute"), self.pool.connection() as db:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute(query, params)
+            rowcount: int = cursor.rowcount
+            cursor.close()
+            db.commit()
+        return rowcount
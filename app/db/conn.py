@@ -1,14 +1,20 @@
 import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-import mysql.connector
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from mysql.connector import MySQLConnection
+
 
 class DBException(Exception):
     pass
 
 
-def connect_db() -> mysql.connector.MySQLConnection:
+@lru_cache()
+def get_db_credentials() -> dict[str, str]:
+    """Read the database credentials once, rather than on every connection"""
     load_dotenv()
     host = os.getenv("DB_HOST")
     user = os.getenv("DB_USER")
@@ -17,14 +23,26 @@ def connect_db() -> mysql.connector.MySQLConnection:
 
     if None in [host, user, password, database]:
         raise DBException("Missing database credentials")
+    return {
+        "host": host,  # type: ignore
+        "user": user,  # type: ignore
+        "password": password,  # type: ignore
+        "database": database,  # type: ignore
+    }
+
+
+def connect_db(**kwargs) -> "MySQLConnection":
+    # imported on the first connection, the driver is slow to import and
+    # not needed at all on SQLite
+    import mysql.connector
+
+    credentials = get_db_credentials()
 
     try:
         return mysql.connector.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
+            **credentials,
             auth_plugin="mysql_native_password",
+            **kwargs,
         )  # type: ignore
 
     except mysql.connector.Error as err:
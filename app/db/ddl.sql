@@ -5,7 +5,9 @@ CREATE TABLE `users` (
     `auth0_id` VARCHAR(255) NOT NULL UNIQUE,
     `name` VARCHAR(255) NOT NULL,
     `email` VARCHAR(255),
-    `username` VARCHAR(255) NOT NULL UNIQUE
+    `username` VARCHAR(255) NOT NULL UNIQUE,
+    `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX `idx_users_created` (`created_at`)
 ) ENGINE = InnoDB DEFAULT CHARSET = utf8;
 DROP TABLE IF EXISTS `games`;
 CREATE TABLE `games` (
@@ -14,9 +16,27 @@ CREATE TABLE `games` (
     `owner_id` CHAR(36) NOT NULL,
     `black_player_id` CHAR(36) NULL,
     `white_player_id` CHAR(36) NULL,
-    `last_updated_at` DATETIME NULL,
+    `last_updated_at` DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6),
+    `fen` VARCHAR(100) NULL,
+    `moves` TEXT NULL,
+    `version` INT NOT NULL DEFAULT 0,
+    INDEX `idx_games_owner_updated` (`owner_id`, `last_updated_at`),
+    INDEX `idx_games_white_updated` (`white_player_id`, `last_updated_at`),
+    INDEX `idx_games_black_updated` (`black_player_id`, `last_updated_at`),
     FOREIGN KEY (`owner_id`) REFERENCES `users` (`user_id`)
 ) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+DROP TABLE IF EXISTS `schema_migrations`;
+CREATE TABLE `schema_migrations` (
+    `version` INT NOT NULL PRIMARY KEY,
+    `name` VARCHAR(255) NOT NULL,
+    `applied_at` DATETIME DEFAULT CURRENT_TIMESTAMP
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+INSERT INTO `schema_migrations` (`version`, `name`)
+VALUES (1, 'initial'),
+    (2, 'game_tracking'),
+    (3, 'player_indexes'),
+    (4, 'engine_user'),
+    (5, 'updated_at_microseconds');
 INSERT INTO `users` (
         `user_id`,
         `auth0_id`,
@@ -30,5 +50,12 @@ VALUES (
         'Test User',
         'test@chess.com',
         'test-user'
+    ),
+    (
+        '00000000-0000-4000-8000-00000000e1e0',
+        'engine|alphabeta',
+        'Computer',
+        NULL,
+        'engine'
     );
 SET FOREIGN_KEY_CHECKS = 1;
\ No newline at end of file
@@ -1,83 +1,203 @@
 from datetime import datetime
 from uuid import UUID, uuid4
 
-from icecream import ic
+from app.db.base import BaseQueries, run_in_executor
+from app.db.pool import ConnectionPool
 
-from app.db.conn import connect_db
+# the columns naming a user in a game, each indexed along with last_updated_at
+PLAYER_COLUMNS = ("owner_id", "white_player_id", "black_player_id")
 
+# bounds the branches of one first pages query, three per user, under sqlite's limit of
+# 500 selects in a compound select
+FIRST_PAGES_USERS_PER_QUERY = 100
 
-class GameQueries:
-    def __init__(self) -> None:
-        self.table = "games"
 
+class GameQueries(BaseQueries):
+    def __init__(self, pool: ConnectionPool | None = None) -> None:
+        super().__init__("games", pool)
+        # games along with the usernames of the owner and both players
+        self.select_with_players = (
+            "SELECT g.*, o.username AS owner_username, "
+            "w.username AS white_player_username, b.username AS black_player_username "
+            f"FROM {self.table} g "
+            "JOIN users o ON o.user_id = g.owner_id "
+            "LEFT JOIN users w ON w.user_id = g.white_player_id "
+            "LEFT JOIN users b ON b.user_id = g.black_player_id"
+        )
+
+    def player_union(self, columns: str, players: str) -> str:
+        """
+        Select `columns` of the games played by `players`, tagged with the `player_id` each was selected for.
+        Each branch of the UNION is answered from the index on its player column.
+        """
+        return " UNION ".join(
+            f"SELECT {column} AS player_id, {columns} FROM {self.table} WHERE {column} IN ({players})"
+            for column in PLAYER_COLUMNS
+        )
+
+    @run_in_executor
     def delete_game(self, game_id: UUID) -> None:
         query = f"DELETE FROM {self.table} WHERE game_id = (%s);"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(game_id),))
-        cursor.close()
-        db.commit()
-        db.close()
-
-    def select_all_by_user_id(self, owner_id: UUID) -> list[dict]:
-        query = f"SELECT * FROM {self.table} WHERE owner_id = (%s) OR black_player_id = (%s) OR white_player_id = (%s);"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(owner_id),) * 3)
-        data_res = cursor.fetchall()
-        cursor.close()
-        db.close()
-        data: list[dict] = [row for row in data_res]  # type: ignore
-        return data
+        self.execute(query, (str(game_id),))
+
+    @staticmethod
+    def keyset(
+        sort: str, after: datetime | None, after_id: str | None
+    ) -> tuple[str, tuple]:
+        """The condition selecting games past a cursor, newest first"""
+        if after is None or after_id is None:
+            return "", ()
+        # the redundant bound on the sort column alone is what lets an index range start at the cursor
+        return (
+            f" AND g.{sort} <= (%s) AND (g.{sort} < (%s) OR (g.{sort} = (%s) AND g.game_id < (%s)))",
+            (after, after, after, after_id),
+        )
 
+    @run_in_executor
+    def select_page_by_user_id(
+        self,
+        user_id: UUID,
+        sort: str,
+        limit: int,
+        after: datetime | None = None,
+        after_id: str | None = None,
+    ) -> list[dict]:
+        """
+        Select a page of the games a user owns or plays in, with player usernames,
+        newest first by `sort` and starting past the (`after`, `after_id`) cursor
+        """
+        condition, params = self.keyset(sort, after, after_id)
+        # one branch per player column, each a range scan on that column's index
+        # cut to the page, rather than an OR that can only be answered by a full scan
+        # (derived tables rather than parenthesized selects, which sqlite can't union)
+        branches = " UNION ".join(
+            f"SELECT game_id FROM (SELECT g.game_id FROM {self.table} g WHERE g.{column} = (%s){condition} "
+            f"ORDER BY g.{sort} DESC, g.game_id DESC LIMIT %s) AS {column}_page"
+            for column in PLAYER_COLUMNS
+        )
+        query = (
+            f"{self.select_with_players} JOIN ({branches}) p ON p.game_id = g.game_id "
+            f"ORDER BY g.{sort} DESC, g.game_id DESC LIMIT %s;"
+        )
+        branch_params = (str(user_id),) + params + (limit,)
+        return self.fetch_all(query, branch_params * len(PLAYER_COLUMNS) + (limit,))
+
+    @run_in_executor
+    def select_first_pages_by_user_ids(
+        self, user_ids: list[UUID], sort: str, limit: int
+    ) -> list[dict]:
+        """
+        Select the newest `limit` games of each of the given users, tagged with the `player_id` they were selected for.
+        Player usernames are not joined, callers resolve them from the users they already hold.
+        """
+        games: list[dict] = []
+        for start in range(0, len(user_ids), FIRST_PAGES_USERS_PER_QUERY):
+            chunk = user_ids[start : start + FIRST_PAGES_USERS_PER_QUERY]
+            # one branch per user and player column, each a range scan on that column's
+            # index cut to `limit` games, so only the candidates for the pages are ranked
+            branches = " UNION ".join(
+                f"SELECT player_id, game_id FROM (SELECT g.{column} AS player_id, g.game_id FROM {self.table} g "
+                f"WHERE g.{column} = (%s) ORDER BY g.{sort} DESC, g.game_id DESC LIMIT %s) AS page_{i}_{column}"
+                for i in range(len(chunk))
+                for column in PLAYER_COLUMNS
+            )
+            query = (
+                "SELECT * FROM ("
+                f"SELECT p.player_id, g.*, ROW_NUMBER() OVER (PARTITION BY p.player_id ORDER BY g.{sort} DESC, g.game_id DESC) AS player_row "
+                f"FROM ({branches}) p "
+                f"JOIN {self.table} g ON g.game_id = p.game_id"
+                ") ranked WHERE player_row <= %s;"
+            )
+            params = tuple(
+                param
+                for user_id in chunk
+                for _ in PLAYER_COLUMNS
+                for param in (str(user_id), limit)
+            )
+            games.extend(self.fetch_all(query, params + (limit,)))
+        return games
+
+    @run_in_executor
     def select_by_id(self, game_id: UUID) -> dict | None:
-        query = f"SELECT * FROM {self.table} WHERE game_id = (%s);"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(game_id),))
-        db_data = cursor.fetchone()
-        cursor.close()
-        db.close()
-        if db_data is None:
-            return None
-        data: dict = db_data  # type: ignore
-        return data
+        query = f"{self.select_with_players} WHERE g.game_id = (%s);"
+        return self.fetch_one(query, (str(game_id),))
+
+    @run_in_executor
+    def select_version(self, game_id: UUID) -> int | None:
+        """The game's version, bumped by every change to it, by primary key alone"""
+        query = f"SELECT version FROM {self.table} WHERE game_id = (%s);"
+        data = self.fetch_one(query, (str(game_id),))
+        return None if data is None else data["version"]
 
+    @run_in_executor
+    def select_games_summary_by_user_id(self, user_id: UUID) -> list[dict]:
+        """
+        The user's username, with the number of their games and the newest last_updated_at
+        among them, one row per player column. No rows means no such user.
+        Every write to a game moves its last_updated_at, so the summary changes with any
+        of the user's games. Each row is read from the index on its player column alone.
+        """
+        counts = " UNION ALL ".join(
+            f"SELECT COUNT(*) AS games, MAX(last_updated_at) AS last_updated_at FROM {self.table} WHERE {column} = (%s)"
+            for column in PLAYER_COLUMNS
+        )
+        query = f"SELECT u.username, c.games, c.last_updated_at FROM users u CROSS JOIN ({counts}) c WHERE u.user_id = (%s);"
+        return self.fetch_all(query, (str(user_id),) * (len(PLAYER_COLUMNS) + 1))
+
+    @run_in_executor
     def insert_game(self, owner_id: UUID) -> UUID:
         """Insert a new game"""
-        query = f"INSERT INTO {self.table} (game_id, owner_id) VALUES (%s, %s)"
+        # last_updated_at starts at creation so that games always sort by it
+        query = f"INSERT INTO {self.table} (game_id, owner_id, created_at, last_updated_at) VALUES (%s, %s, %s, %s)"
         new_id = uuid4()
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(new_id), str(owner_id)))
-        cursor.close()
-        db.commit()
-        db.close()
+        now = datetime.now()
+        self.execute(query, (str(new_id), str(owner_id), now, now))
         return new_id
 
-    def assign_player(self, game_id: UUID, user_id: UUID, color: str) -> None:
-        """Assign a player to a game"""
-        query = f"UPDATE {self.table} SET {color}_player_id = (%s) WHERE game_id = (%s)"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(user_id), str(game_id)))
-        cursor.close()
-        db.commit()
-        db.close()
-
-    def update_last_updated_at(self, game_id: UUID) -> None:
-        """Update the last_updated_at field for a game"""
-        now = datetime.now()
-        query = f"UPDATE {self.table} SET last_updated_at = (%s) WHERE game_id = (%s)"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(
-            query,
-            (
-                now,
-                str(game_id),
-            ),
+    @run_in_executor
+    def assign_players(
+        self, game_id: UUID, white_player_id: UUID, black_player_id: UUID
+    ) -> bool:
+        """Assign both players to a game that has none yet. Returns whether it had none."""
+        query = f"UPDATE {self.table} SET white_player_id = (%s), black_player_id = (%s), last_updated_at = (%s), version = version + 1 WHERE game_id = (%s) AND white_player_id IS NULL AND black_player_id IS NULL"
+        params = (
+            str(white_player_id),
+            str(black_player_id),
+            datetime.now(),
+            str(game_id),
         )
-        cursor.close()
-        db.commit()
-        db.close()
+        return self.execute(query, params) == 1
+
+    @run_in_executor
+    def update_last_updated_at(self, game_id: UUID, version: int) -> bool:
+        """
+        Update the last_updated_at field for a game, if it is still at `version`.
+        Returns whether it was, the check and the bump being one atomic write.
+        """
+        now = datetime.now()
+        query = f"UPDATE {self.table} SET last_updated_at = (%s), version = version + 1 WHERE game_id = (%s) AND version = (%s)"
+        return self.execute(query, (now, str(game_id), version)) == 1
+
+    @run_in_executor
+    def select_board(self, game_id: UUID) -> dict | None:
+        """Select only the stored board columns of a game"""
+        query = f"SELECT fen, moves FROM {self.table} WHERE game_id = (%s);"
+        return self.fetch_one(query, (str(game_id),))
+
+    @run_in_executor
+    def update_board(
+        self, game_id: UUID, fen: str, new_moves: str, version: int
+    ) -> bool:
+        """
+        Store the current FEN, append to the UCI move list and update last_updated_at,
+        if the game is still at `version`. Returns whether it was.
+        """
+        now = datetime.now()
+        query = f"UPDATE {self.table} SET fen = (%s), moves = CONCAT_WS(' ', moves, (%s)), last_updated_at = (%s), version = version + 1 WHERE game_id = (%s) AND version = (%s)"
+        return self.execute(query, (fen, new_moves, now, str(game_id), version)) == 1
+
+    @run_in_executor
+    def set_board(self, game_id: UUID, fen: str, moves: str) -> int:
+        """Overwrite the stored board columns, leaving last_updated_at alone"""
+        query = f"UPDATE {self.table} SET fen = (%s), moves = (%s) WHERE game_id = (%s)"
+        return self.execute(query, (fen, moves or None, str(game_id)))
@@ -0,0 +1,129 @@
+"""
+Bring the configured database up to date with the versioned migrations in
+app/db/migrations/<backend>, recording each one applied in the schema_migrations table.
+
+    python -m app.db.migrate [--list]
+"""
+
+import argparse
+import os
+import re
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from app.db.backends import Backend, get_backend
+from app.db.pool import ConnectionPool, get_pool
+
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+
+class Migration(BaseModel):
+    version: int
+    name: str
+    statements: list[str]
+
+
+def split_statements(sql: str) -> list[str]:
+    """The statements of a migration file, without `--` comment lines"""
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+    statements = "\n".join(lines).split(";")
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def load_migrations(directory: str) -> list[Migration]:
+    migrations: dict[int, Migration] = {}
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE.match(file_name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}")
+        with open(os.path.join(directory, file_name)) as f:
+            statements = split_statements(f.read())
+        migrations[version] = Migration(
+            version=version, name=match.group(2), statements=statements
+        )
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def applied_versions(pool: ConnectionPool) -> set[int]:
+    with pool.connection() as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INT NOT NULL PRIMARY KEY, "
+            "name VARCHAR(255) NOT NULL, "
+            "applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cursor.execute("SELECT version FROM schema_migrations")
+        rows = cursor.fetchall()
+        cursor.close()
+    return {row["version"] for row in rows}  # type: ignore
+
+
+def apply_migration(
+    pool: ConnectionPool, migration: Migration, backend: Backend
+) -> None:
+    """
+    Run each statement of a migration and record it as applied.
+    MySQL commits DDL as it goes, so a migration that fails part way is not rolled back;
+    statements that fail because their change is already there, e.g. made by hand
+    following the README, are skipped, so rerunning it is safe.
+    """
+    with pool.connection() as db:
+        cursor = db.cursor()
+        for statement in migration.statements:
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                if not backend.already_applied(e):
+                    raise
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+            (migration.version, migration.name),
+        )
+        cursor.close()
+        db.commit()
+
+
+def migrate(
+    pool: ConnectionPool | None = None,
+    directory: str | None = None,
+    backend: Backend | None = None,
+) -> list[Migration]:
+    """
+    Apply every migration not yet applied, oldest first, returning those applied.
+    Migrations are read from the backend's own directory unless `directory` is given.
+    """
+    pool = pool or get_pool()
+    backend = backend or get_backend()
+    applied = applied_versions(pool)
+    migrations = load_migrations(directory or backend.migrations_dir)
+    pending = [m for m in migrations if m.version not in applied]
+    for migration in pending:
+        apply_migration(pool, migration, backend)
+    return pending
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--list", action="store_true", help="list pending migrations without applying"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    if args.list:
+        applied = applied_versions(get_pool())
+        for migration in load_migrations(get_backend().migrations_dir):
+            status = "applied" if migration.version in applied else "pending"
+            print(f"{migration.version:04d} {migration.name} {status}")
+        return
+    for migration in migrate():
+        print(f"applied {migration.version:04d} {migration.name}")
+
+
+if __name__ == "__main__":
+    main()
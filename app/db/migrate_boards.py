@@ -0,0 +1,73 @@
+"""
+Move boards out of the per-game pickle files or move journals and into the fen/moves
+columns of the games table, for running with BOARD_STORAGE=database.
+
+    python -m app.db.migrate_boards [--games-dir DIR] [--delete]
+"""
+
+import argparse
+import os
+import pickle
+from uuid import UUID
+
+import anyio
+from chess import Board
+from dotenv import load_dotenv
+
+from app.controllers.boards import DatabaseBoardStore, JournalBoardStore
+from app.db.games import GameQueries
+from app.db.migrate import migrate as migrate_schema
+
+GAMES_DIR = os.path.join(
+    os.path.dirname(__file__), os.path.pardir, "controllers", "games"
+)
+
+
+async def migrate(queries: GameQueries, games_dir: str, delete: bool = False) -> int:
+    """Copy every pickled or journaled board into its game's row, returning how many were moved"""
+    migrated = 0
+    for name in sorted(os.listdir(games_dir)):
+        path = os.path.join(games_dir, name)
+        if name.endswith(".pickle"):
+            game_id = UUID(name.removesuffix(".pickle"))
+            with open(path, "rb") as f:
+                board: Board = pickle.load(f)
+        elif name.endswith(".moves"):
+            game_id = UUID(name.removesuffix(".moves"))
+            history = os.path.join(games_dir, f"{game_id}.history")
+            board = DatabaseBoardStore.replay(
+                " ".join(JournalBoardStore.read_game(path, history))
+            )
+        else:
+            continue
+        moves = " ".join(move.uci() for move in board.move_stack)
+        if await queries.set_board(game_id, board.fen(), moves) == 0:
+            print(f"skipping {game_id}: no such game, or already migrated")
+            continue
+        migrated += 1
+        if delete:
+            os.remove(path)
+            history = os.path.join(games_dir, f"{game_id}.history")
+            if os.path.exists(history):
+                os.remove(history)
+    return migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games-dir", default=GAMES_DIR)
+    parser.add_argument(
+        "--delete", action="store_true", help="remove board files once migrated"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    queries = GameQueries()
+    # the board columns arrive with the schema migrations
+    migrate_schema(queries.pool)
+    migrated = anyio.run(migrate, queries, args.games_dir, args.delete)
+    print(f"migrated {migrated} boards")
+
+
+if __name__ == "__main__":
+    main()
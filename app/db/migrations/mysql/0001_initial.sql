@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS `users` (
+    `user_id` CHAR(36) NOT NULL PRIMARY KEY,
+    `auth0_id` VARCHAR(255) NOT NULL UNIQUE,
+    `name` VARCHAR(255) NOT NULL,
+    `email` VARCHAR(255),
+    `username` VARCHAR(255) NOT NULL UNIQUE
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
+CREATE TABLE IF NOT EXISTS `games` (
+    `game_id` CHAR(36) NOT NULL PRIMARY KEY,
+    `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+    `owner_id` CHAR(36) NOT NULL,
+    `black_player_id` CHAR(36) NULL,
+    `white_player_id` CHAR(36) NULL,
+    `last_updated_at` DATETIME NULL,
+    FOREIGN KEY (`owner_id`) REFERENCES `users` (`user_id`)
+) ENGINE = InnoDB DEFAULT CHARSET = utf8;
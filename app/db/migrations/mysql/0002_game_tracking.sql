@@ -0,0 +1,7 @@
+-- boards stored in the database, the version behind ETags and the keys pages are ordered by
+ALTER TABLE `games` ADD COLUMN `fen` VARCHAR(100) NULL;
+ALTER TABLE `games` ADD COLUMN `moves` TEXT NULL;
+ALTER TABLE `games` ADD COLUMN `version` INT NOT NULL DEFAULT 0;
+UPDATE `games` SET `last_updated_at` = `created_at` WHERE `last_updated_at` IS NULL;
+ALTER TABLE `games` MODIFY COLUMN `last_updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE `users` ADD COLUMN `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP;
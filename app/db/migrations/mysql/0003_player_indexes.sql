@@ -0,0 +1,6 @@
+-- one index per player column, so each branch of a player lookup is a range scan
+-- that is already in page order. InnoDB appends the primary key, game_id, to each.
+CREATE INDEX `idx_games_owner_updated` ON `games` (`owner_id`, `last_updated_at`);
+CREATE INDEX `idx_games_white_updated` ON `games` (`white_player_id`, `last_updated_at`);
+CREATE INDEX `idx_games_black_updated` ON `games` (`black_player_id`, `last_updated_at`);
+CREATE INDEX `idx_users_created` ON `users` (`created_at`);
@@ -0,0 +1,3 @@
+-- user ETags compare the newest last_updated_at of a user's games, which whole seconds
+-- would leave unchanged by a second write within the same second
+ALTER TABLE `games` MODIFY COLUMN `last_updated_at` DATETIME(6) DEFAULT CURRENT_TIMESTAMP(6);
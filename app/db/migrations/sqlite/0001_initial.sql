@@ -0,0 +1,21 @@
+-- SQLite databases start from the current schema, the later migrations only
+-- exist here to keep version numbers in step with mysql
+CREATE TABLE IF NOT EXISTS `users` (
+    `user_id` CHAR(36) NOT NULL PRIMARY KEY,
+    `auth0_id` VARCHAR(255) NOT NULL UNIQUE,
+    `name` VARCHAR(255) NOT NULL,
+    `email` VARCHAR(255),
+    `username` VARCHAR(255) NOT NULL UNIQUE,
+    `created_at` DATETIME DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS `games` (
+    `game_id` CHAR(36) NOT NULL PRIMARY KEY,
+    `created_at` DATETIME DEFAULT (datetime('now', 'localtime')),
+    `owner_id` CHAR(36) NOT NULL REFERENCES `users` (`user_id`),
+    `black_player_id` CHAR(36) NULL,
+    `white_player_id` CHAR(36) NULL,
+    `last_updated_at` DATETIME DEFAULT (datetime('now', 'localtime')),
+    `fen` VARCHAR(100) NULL,
+    `moves` TEXT NULL,
+    `version` INT NOT NULL DEFAULT 0
+);
@@ -0,0 +1 @@
+-- the columns are part of 0001 on sqlite
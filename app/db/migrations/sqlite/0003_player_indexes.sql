@@ -0,0 +1,6 @@
+-- unlike InnoDB, sqlite indexes carry the rowid rather than the primary key,
+-- so the id that breaks ties in page order is indexed explicitly
+CREATE INDEX IF NOT EXISTS `idx_games_owner_updated` ON `games` (`owner_id`, `last_updated_at`, `game_id`);
+CREATE INDEX IF NOT EXISTS `idx_games_white_updated` ON `games` (`white_player_id`, `last_updated_at`, `game_id`);
+CREATE INDEX IF NOT EXISTS `idx_games_black_updated` ON `games` (`black_player_id`, `last_updated_at`, `game_id`);
+CREATE INDEX IF NOT EXISTS `idx_users_created` ON `users` (`created_at`, `user_id`);
@@ -0,0 +1,10 @@
+-- the built-in engine plays as this user, so games reference it like any player.
+-- Fails if a user already has its username or auth0 id: rename them first.
+INSERT INTO `users` (`user_id`, `auth0_id`, `name`, `email`, `username`)
+VALUES (
+        '00000000-0000-4000-8000-00000000e1e0',
+        'engine|alphabeta',
+        'Computer',
+        NULL,
+        'engine'
+    );
@@ -0,0 +1 @@
+-- sqlite already keeps the microseconds of last_updated_at
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Callable, Iterator
+
+from pydantic import BaseModel
+
+from app.db.backends import get_backend
+from app.db.conn import DBException
+
+
+class PoolTimeoutException(DBException):
+    pass
+
+
+class PoolStats(BaseModel):
+    """Point-in-time metrics for sizing the connection pool"""
+
+    size: int
+    open: int
+    in_use: int
+    idle: int
+    checkouts: int
+    waits: int
+    timeouts: int
+    health_check_failures: int
+    checkout_latency_avg_ms: float
+    checkout_latency_max_ms: float
+
+
+class ConnectionPool:
+    """
+    A fixed-size, thread-safe pool of database connections.
+    Connections are opened lazily, health checked when they have sat idle
+    for longer than `health_check_interval`, and replaced if the check fails.
+    Callers that find the pool exhausted wait up to `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        size: int = 5,
+        timeout: float = 10.0,
+        health_check_interval: float = 30.0,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle: deque[tuple[Any, float]] = deque()
+        self._open = 0
+        self._in_use = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._checkout_seconds_total = 0.0
+        self._checkout_seconds_max = 0.0
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Check out a connection, returning it to the pool when done"""
+        conn = self.checkout()
+        healthy = True
+        try:
+            yield conn
+        except Exception:
+            # the connection may be mid-transaction or broken, don't reuse it
+            healthy = False
+            raise
+        finally:
+            self.checkin(conn, healthy)
+
+    def checkout(self) -> Any:
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        conn = None
+        idle_since = 0.0
+        with self._lock:
+            if not self._idle and self._open >= self.size:
+                self._waits += 1
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutException(
+                        f"Timed out after {self.timeout}s waiting for a connection"
+                    )
+                self._lock.wait(remaining)
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+            else:
+                # reserve the slot before connecting outside of the lock
+                self._open += 1
+            self._in_use += 1
+
+        try:
+            if conn is None:
+                conn = self.connect()
+            elif time.monotonic() - idle_since > self.health_check_interval:
+                conn = self._ensure_healthy(conn)
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_seconds_total += elapsed
+            self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+        return conn
+
+    def checkin(self, conn: Any, healthy: bool = True) -> None:
+        if not healthy:
+            self._close(conn)
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._open -= 1
+            self._lock.notify()
+
+    def _ensure_healthy(self, conn: Any) -> Any:
+        try:
+            if conn.is_connected():
+                return conn
+        except Exception:
+            pass
+        with self._lock:
+            self._health_check_failures += 1
+        self._close(conn)
+        return self.connect()
+
+    @staticmethod
+    def _close(conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            avg = (
+                self._checkout_seconds_total / self._checkouts
+                if self._checkouts
+                else 0.0
+            )
+            return PoolStats(
+                size=self.size,
+                open=self._open,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                checkouts=self._checkouts,
+                waits=self._waits,
+                timeouts=self._timeouts,
+                health_check_failures=self._health_check_failures,
+                checkout_latency_avg_ms=avg * 1000,
+                checkout_latency_max_ms=self._checkout_seconds_max * 1000,
+            )
+
+    def close(self) -> None:
+        """Close every idle connection. Checked out connections are closed on return."""
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+
+def new_pool() -> ConnectionPool:
+    """A connection pool to the configured backend, sized by the DB_POOL_* settings"""
+    return ConnectionPool(
+        get_backend().connect,
+        size=int(os.getenv("DB_POOL_SIZE", "5")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+    )
+
+
+@lru_cache()
+def get_pool() -> ConnectionPool:
+    """The pool of scripts and of query classes built without one; the app has its own"""
+    return new_pool()
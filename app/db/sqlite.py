@@ -0,0 +1,95 @@
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+from typing import Any
+
+# stored as text that sorts in time order, the way CURRENT_TIMESTAMP writes it
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+sqlite3.register_converter(
+    "DATETIME", lambda value: datetime.fromisoformat(value.decode())
+)
+
+PLACEHOLDER = re.compile(r"%s")
+
+
+@lru_cache(maxsize=1024)
+def translate(query: str) -> str:
+    """Rewrite a query from the MySQL connector's `%s` placeholders to SQLite's `?`"""
+    return PLACEHOLDER.sub("?", query)
+
+
+def concat_ws(separator: str, *values: Any) -> str:
+    """MySQL's CONCAT_WS, which skips NULLs"""
+    return separator.join(str(value) for value in values if value is not None)
+
+
+class SQLiteCursor:
+    """A cursor taking the queries and returning the rows the MySQL connector would"""
+
+    def __init__(self, cursor: sqlite3.Cursor, dictionary: bool) -> None:
+        self._cursor = cursor
+        self.dictionary = dictionary
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    def execute(self, query: str, params: tuple = ()) -> None:
+        self._cursor.execute(translate(query), params)
+
+    def executemany(self, query: str, rows: list[tuple]) -> None:
+        self._cursor.executemany(translate(query), rows)
+
+    def _row(self, row: sqlite3.Row | None) -> Any:
+        if row is None or not self.dictionary:
+            return None if row is None else tuple(row)
+        return dict(row)
+
+    def fetchone(self) -> Any:
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self) -> list:
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    An SQLite database behind the slice of the MySQL connector's connection API the app uses.
+    Statements are prepared once per connection and kept in sqlite3's statement cache.
+    """
+
+    def __init__(self, path: str, statement_cache: int = 256) -> None:
+        self._db = sqlite3.connect(
+            path,
+            # in autocommit mode, like the pooled MySQL connections
+            isolation_level=None,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # connections are pooled and used by one executor thread at a time
+            check_same_thread=False,
+            cached_statements=statement_cache,
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.create_function("CONCAT_WS", -1, concat_ws, deterministic=True)
+        # readers never block the writer, and a commit needs no fsync of the database
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.execute("PRAGMA busy_timeout = 5000")
+        self._open = True
+
+    def cursor(self, dictionary: bool = False) -> SQLiteCursor:
+        return SQLiteCursor(self._db.cursor(), dictionary)
+
+    def commit(self) -> None:
+        self._db.commit()
+
+    def is_connected(self) -> bool:
+        return self._open
+
+    def close(self) -> None:
+        self._open = False
+        self._db.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import anyio
+import pytest
+
+from .base import BaseQueries, count_queries, run_in_executor
+from .pool import ConnectionPool
+
+
+class SlowCursor:
+    def execute(self, query: str, params: tuple) -> None:
+        time.sleep(0.1)
+
+    def fetchone(self) -> dict:
+        return {"thread": threading.get_ident()}
+
+    def close(self) -> None:
+        pass
+
+
+class SlowConnection:
+    def cursor(self, dictionary: bool = False) -> SlowCursor:
+        return SlowCursor()
+
+    def close(self) -> None:
+        pass
+
+
+class SlowQueries(BaseQueries):
+    @run_in_executor
+    def select_one(self) -> dict | None:
+        return self.fetch_one("SELECT 1")
+
+
+@pytest.mark.anyio
+async def test_queries_run_off_the_event_loop_and_overlap():
+    queries = SlowQueries("t", ConnectionPool(SlowConnection, size=5))
+    results = []
+
+    async def run() -> None:
+        results.append(await queries.select_one())
+
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(run)
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 5
+    assert all(row and row["thread"] != threading.get_ident() for row in results)
+    # five 100ms queries overlap rather than running back to back
+    assert elapsed < 0.4
+
+
+@pytest.mark.anyio
+async def test_count_queries_counts_each_context_separately():
+    queries = SlowQueries("t", ConnectionPool(SlowConnection, size=5))
+    counts = {}
+
+    async def run(name: str, n: int) -> None:
+        with count_queries() as stats:
+            for _ in range(n):
+                await queries.select_one()
+        counts[name] = stats.count
+        # each query sleeps for 100ms
+        assert stats.seconds >= 0.1 * n
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(run, "one", 1)
+        tg.start_soon(run, "three", 3)
+
+    assert counts == {"one": 1, "three": 3}
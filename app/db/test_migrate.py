@@ -0,0 +1,223 @@
+import shutil
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from mysql.connector import errorcode
+from mysql.connector.errors import DatabaseError, ProgrammingError
+
+from .backends import MySQLBackend, SQLiteBackend
+from .conn import DBException, connect_db
+from .games import GameQueries
+from .migrate import load_migrations, migrate, split_statements
+from .pool import ConnectionPool
+from .users import UserQueries
+
+
+class FakeCursor:
+    def __init__(self, db: "FakeDB") -> None:
+        self.db = db
+        self.rows: list[dict] = []
+
+    def execute(self, statement: str, params: tuple = ()) -> None:
+        if statement in self.db.fail_with:
+            raise ProgrammingError(errno=self.db.fail_with[statement])
+        self.db.executed.append(statement)
+        if statement.startswith("SELECT version FROM schema_migrations"):
+            self.rows = [{"version": version} for version in self.db.applied]
+        if statement.startswith("INSERT INTO schema_migrations"):
+            self.db.applied.append(params[0])
+
+    def fetchall(self) -> list[dict]:
+        return self.rows
+
+    def close(self) -> None:
+        pass
+
+
+class FakeDB:
+    def __init__(self) -> None:
+        self.applied: list[int] = []
+        self.executed: list[str] = []
+        self.fail_with: dict[str, int] = {}
+
+    def cursor(self, dictionary: bool = False) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def is_connected(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    (tmp_path / "0001_first.sql").write_text("CREATE TABLE a (id INT);")
+    (tmp_path / "0002_second.sql").write_text(
+        "-- add a column\nALTER TABLE a ADD COLUMN b INT;\nCREATE INDEX i ON a (b);\n"
+    )
+    (tmp_path / "notes.txt").write_text("not a migration")
+    return tmp_path
+
+
+def test_split_statements_drops_comments_and_blanks():
+    sql = "-- comment\nSELECT 1;\n\n  SELECT\n  2;\n"
+    assert split_statements(sql) == ["SELECT 1", "SELECT\n  2"]
+
+
+def test_bundled_migrations_are_numbered_in_order_and_in_step():
+    mysql = [m.version for m in load_migrations(MySQLBackend().migrations_dir)]
+    sqlite = [m.version for m in load_migrations(SQLiteBackend().migrations_dir)]
+    assert mysql == list(range(1, len(mysql) + 1))
+    assert sqlite == mysql
+
+
+def test_sqlite_migrations_are_idempotent(sqlite_pool):
+    assert migrate(sqlite_pool, backend=SQLiteBackend()) == []
+
+
+def test_migrate_applies_pending_migrations_once(migrations_dir):
+    db = FakeDB()
+    pool = ConnectionPool(lambda: db)
+
+    applied = migrate(pool, str(migrations_dir))
+    assert [m.name for m in applied] == ["first", "second"]
+    assert "CREATE INDEX i ON a (b)" in db.executed
+    assert db.applied == [1, 2]
+
+    assert migrate(pool, str(migrations_dir)) == []
+    assert db.applied == [1, 2]
+
+
+def test_migrate_skips_changes_already_made_by_hand(migrations_dir):
+    db = FakeDB()
+    db.applied = [1]
+    db.fail_with["ALTER TABLE a ADD COLUMN b INT"] = errorcode.ER_DUP_FIELDNAME
+    pool = ConnectionPool(lambda: db)
+
+    applied = migrate(pool, str(migrations_dir))
+    assert [m.version for m in applied] == [2]
+    assert "CREATE INDEX i ON a (b)" in db.executed
+    assert db.applied == [1, 2]
+
+
+def test_migrate_stops_at_a_failing_migration(migrations_dir):
+    db = FakeDB()
+    db.fail_with["CREATE TABLE a (id INT)"] = errorcode.ER_PARSE_ERROR
+    pool = ConnectionPool(lambda: db)
+
+    with pytest.raises(DatabaseError):
+        migrate(pool, str(migrations_dir))
+    assert db.applied == []
+
+
+def test_the_engine_user_migration_refuses_a_taken_username(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "chess.sqlite3"))
+    pool = ConnectionPool(backend.connect)
+    migrations = tmp_path / "migrations"
+    migrations.mkdir()
+    bundled = Path(backend.migrations_dir)
+    for path in bundled.glob("000[123]_*.sql"):
+        shutil.copy(path, migrations)
+    migrate(pool, str(migrations), backend)
+    with pool.connection() as db:
+        db.cursor().execute(
+            "INSERT INTO users (user_id, auth0_id, name, email, username) "
+            "VALUES ('u', 'auth0|u', 'Someone', NULL, 'engine')"
+        )
+        db.commit()
+    shutil.copy(bundled / "0004_engine_user.sql", migrations)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        migrate(pool, str(migrations), backend)
+    pool.close()
+
+
+@pytest.fixture
+def mysql_pool():
+    try:
+        connect_db().close()
+    except (DBException, DatabaseError) as e:
+        pytest.skip(f"no database to explain queries against: {e}")
+    pool = ConnectionPool(MySQLBackend().connect)
+    migrate(pool, backend=MySQLBackend())
+    yield pool
+    pool.close()
+
+
+def capture_query(queries) -> list[tuple[str, tuple]]:
+    """Record the queries a query class would run instead of running them"""
+    captured: list[tuple[str, tuple]] = []
+
+    def fetch(query: str, params: tuple = ()) -> list:
+        captured.append((query, params))
+        return []
+
+    queries.fetch_all = fetch
+    queries.fetch_one = fetch
+    return captured
+
+
+async def hot_queries(pool: ConnectionPool) -> list[tuple[str, tuple]]:
+    """The queries behind the busiest routes, with their parameters"""
+    games = GameQueries(pool)
+    users = UserQueries(pool)
+    captured = capture_query(games)
+    user_captured = capture_query(users)
+    user_id, game_id = uuid4(), str(uuid4())
+
+    for sort in ("last_updated_at", "created_at"):
+        await games.select_page_by_user_id(user_id, sort, 51)
+        await games.select_page_by_user_id(user_id, sort, 51, datetime.now(), game_id)
+        await games.select_first_pages_by_user_ids([user_id, uuid4()], sort, 51)
+    await games.select_games_summary_by_user_id(user_id)
+    await games.select_by_id(uuid4())
+    await users.get_page(51, datetime.now(), str(user_id))
+    await users.get_auth0_id("auth0|explain")
+    return captured + user_captured
+
+
+def explain(pool: ConnectionPool, statement: str, params: tuple) -> list[dict]:
+    with pool.connection() as db:
+        cursor = db.cursor(dictionary=True)
+        cursor.execute(statement, params)
+        plan = cursor.fetchall()
+        cursor.close()
+    return plan
+
+
+@pytest.mark.anyio
+async def test_hot_queries_use_indexes_on_mysql(mysql_pool):
+    for query, params in await hot_queries(mysql_pool):
+        plan = explain(mysql_pool, f"EXPLAIN {query}", params)
+        # derived tables are the UNION results, already cut down by an index
+        full_scans = [
+            step
+            for step in plan
+            if step["type"] == "ALL" and not str(step["table"]).startswith("<")
+        ]
+        assert full_scans == [], query
+
+
+# the tables, and their aliases, whose full scans are what the indexes are for
+TABLES = {"games", "users", "g", "o", "w", "b", "u"}
+
+
+@pytest.mark.anyio
+async def test_hot_queries_use_indexes_on_sqlite(sqlite_pool):
+    for query, params in await hot_queries(sqlite_pool):
+        plan = explain(sqlite_pool, f"EXPLAIN QUERY PLAN {query}", params)
+        full_scans = [
+            step["detail"]
+            for step in plan
+            if step["detail"].startswith("SCAN ")
+            and step["detail"].split()[1] in TABLES
+            and "INDEX" not in step["detail"]
+        ]
+        assert full_scans == [], query
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from .pool import ConnectionPool, PoolTimeoutException
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.connected = True
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def close(self) -> None:
+        self.connected = False
+
+
+def test_pool_reuses_connections():
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, size=2)
+    for _ in range(5):
+        with pool.connection() as conn:
+            assert conn is opened[0]
+    assert len(opened) == 1
+    stats = pool.stats()
+    assert stats.checkouts == 5
+    assert stats.in_use == 0
+    assert stats.idle == 1
+
+
+def test_pool_times_out_when_exhausted():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolTimeoutException):
+            pool.checkout()
+    stats = pool.stats()
+    assert stats.waits == 1
+    assert stats.timeouts == 1
+
+
+def test_pool_waiter_gets_returned_connection():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=5)
+    conn = pool.checkout()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+    waiter.start()
+    pool.checkin(conn)
+    waiter.join()
+    assert got == [conn]
+    assert pool.stats().waits == 1
+
+
+def test_pool_replaces_unhealthy_connections():
+    pool = ConnectionPool(FakeConnection, size=1, health_check_interval=0)
+    with pool.connection() as conn:
+        conn.connected = False
+    with pool.connection() as replacement:
+        assert replacement is not conn
+        assert replacement.is_connected()
+    assert pool.stats().health_check_failures == 1
+
+
+def test_pool_discards_connection_on_error():
+    pool = ConnectionPool(FakeConnection, size=1)
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("query failed")
+    stats = pool.stats()
+    assert stats.open == 0
+    assert stats.in_use == 0
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.models.users import ENGINE_USER_ID, NewUser
+
+from . import games as games_module
+from .backends import Backend
+from .games import GameQueries
+from .sqlite import SQLiteConnection, translate
+from .users import UserQueries
+
+
+def test_translate_placeholders():
+    assert translate("SELECT * FROM t WHERE a = (%s) AND b IN (%s, %s)") == (
+        "SELECT * FROM t WHERE a = (?) AND b IN (?, ?)"
+    )
+
+
+def test_a_backend_must_say_how_to_connect_and_migrate():
+    class Nameless(Backend):
+        name = "nameless"
+
+    with pytest.raises(TypeError, match="already_applied, connect"):
+        Nameless()  # type: ignore
+
+
+def test_connection_is_wal_and_speaks_the_connector_api(tmp_path):
+    db = SQLiteConnection(str(tmp_path / "t.sqlite3"))
+    cursor = db.cursor(dictionary=True)
+    cursor.execute("PRAGMA journal_mode")
+    assert cursor.fetchone() == {"journal_mode": "wal"}
+
+    cursor.execute("CREATE TABLE t (id INT, at DATETIME, moves TEXT)")
+    now = datetime.now()
+    cursor.executemany("INSERT INTO t VALUES (%s, %s, %s)", [(1, now, None)])
+    cursor.execute("UPDATE t SET moves = CONCAT_WS(' ', moves, %s)", ("e2e4",))
+    cursor.execute("UPDATE t SET moves = CONCAT_WS(' ', moves, %s)", ("e7e5",))
+    assert cursor.rowcount == 1
+    cursor.execute("SELECT * FROM t WHERE at = %s", (now,))
+    assert cursor.fetchall() == [{"id": 1, "at": now, "moves": "e2e4 e7e5"}]
+    cursor.close()
+
+    assert db.is_connected()
+    db.close()
+    assert not db.is_connected()
+
+
+@pytest.mark.anyio
+async def test_game_and_user_queries_run_on_sqlite(sqlite_pool):
+    users, games = UserQueries(sqlite_pool), GameQueries(sqlite_pool)
+    owner = await users.insert_user(NewUser(username="a", name="A"), "auth0|a")
+    opponent = await users.insert_user(NewUser(username="b", name="B"), "auth0|b")
+    game_id = await games.insert_game(owner)
+    assert await games.assign_players(game_id, owner, opponent)
+    # players are only ever assigned once
+    assert not await games.assign_players(game_id, opponent, owner)
+    assert await games.update_board(game_id, "fen", "e2e4", 1)
+    # a write from a stale read of the game is refused
+    assert not await games.update_board(game_id, "fen", "e7e5", 1)
+
+    game = await games.select_by_id(game_id)
+    assert game is not None
+    assert game["owner_username"] == "a"
+    assert game["black_player_username"] == "b"
+    assert game["moves"] == "e2e4"
+    assert isinstance(game["last_updated_at"], datetime)
+    assert await games.select_version(game_id) == 2
+
+    summary = await games.select_games_summary_by_user_id(opponent)
+    assert [(row["username"], row["games"]) for row in summary] == [
+        ("b", 0),
+        ("b", 0),
+        ("b", 1),
+    ]
+    assert await games.update_last_updated_at(game_id, 2)
+    later = await games.select_games_summary_by_user_id(opponent)
+    assert later[2]["last_updated_at"] > summary[2]["last_updated_at"]
+    assert (await users.get_auth0_id("auth0|b"))["user_id"] == str(opponent)
+
+
+@pytest.mark.anyio
+async def test_user_pages_leave_out_the_engine_on_sqlite(sqlite_pool):
+    users = UserQueries(sqlite_pool)
+    user_id = await users.insert_user(NewUser(username="a", name="A"), "auth0|a")
+    assert await users.get_by_uuid(ENGINE_USER_ID) is not None
+
+    page = await users.get_page(10)
+
+    assert [row["user_id"] for row in page] == [str(user_id)]
+
+
+@pytest.mark.anyio
+async def test_game_pages_follow_the_cursor_on_sqlite(sqlite_pool):
+    users, games = UserQueries(sqlite_pool), GameQueries(sqlite_pool)
+    owner = await users.insert_user(NewUser(username="a", name="A"), "auth0|a")
+    game_ids = [await games.insert_game(owner) for _ in range(20)]
+    # ties on the sort column are broken by game_id
+    start = datetime(2024, 1, 1)
+    with sqlite_pool.connection() as db:
+        cursor = db.cursor()
+        for i, game_id in enumerate(game_ids):
+            cursor.execute(
+                "UPDATE games SET last_updated_at = %s WHERE game_id = %s",
+                (start + timedelta(minutes=i // 3), str(game_id)),
+            )
+        cursor.close()
+
+    seen, after, after_id = [], None, None
+    while True:
+        page = await games.select_page_by_user_id(
+            owner, "last_updated_at", 6, after, after_id
+        )
+        seen.extend(row["game_id"] for row in page)
+        if len(page) < 6:
+            break
+        after, after_id = page[-1]["last_updated_at"], page[-1]["game_id"]
+
+    expected = sorted(
+        ((start + timedelta(minutes=i // 3), str(g)) for i, g in enumerate(game_ids)),
+        reverse=True,
+    )
+    assert seen == [game_id for _, game_id in expected]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("users_per_query", [1, 100])
+async def test_first_pages_are_the_newest_games_of_each_user_on_sqlite(
+    sqlite_pool, monkeypatch, users_per_query
+):
+    monkeypatch.setattr(games_module, "FIRST_PAGES_USERS_PER_QUERY", users_per_query)
+    users, games = UserQueries(sqlite_pool), GameQueries(sqlite_pool)
+    a = await users.insert_user(NewUser(username="a", name="A"), "auth0|a")
+    b = await users.insert_user(NewUser(username="b", name="B"), "auth0|b")
+    idle = await users.insert_user(NewUser(username="c", name="C"), "auth0|c")
+    # b plays white in each of a's games, and owns three of their own
+    a_games = [await games.insert_game(a) for _ in range(5)]
+    for game_id in a_games:
+        await games.assign_players(game_id, b, a)
+    b_games = [await games.insert_game(b) for _ in range(3)]
+    start = datetime(2024, 1, 1)
+    with sqlite_pool.connection() as db:
+        cursor = db.cursor()
+        for i, game_id in enumerate(a_games + b_games):
+            cursor.execute(
+                "UPDATE games SET last_updated_at = %s WHERE game_id = %s",
+                (start + timedelta(minutes=i), str(game_id)),
+            )
+        cursor.close()
+
+    rows = await games.select_first_pages_by_user_ids(
+        [a, b, idle], "last_updated_at", 3
+    )
+    pages: dict[str, set[str]] = {}
+    for row in rows:
+        pages.setdefault(row["player_id"], set()).add(row["game_id"])
+
+    # b's own games are newer than those they play white in
+    assert pages == {
+        str(a): {str(g) for g in a_games[-3:]},
+        str(b): {str(g) for g in b_games},
+    }
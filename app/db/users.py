@@ -1,64 +1,65 @@
+from datetime import datetime
 from uuid import UUID, uuid4
 
-from icecream import ic
+from app.db.base import BaseQueries, run_in_executor
+from app.db.pool import ConnectionPool
+from app.models.users import ENGINE_USER_ID, NewUser
 
-from app.db.conn import connect_db
-from app.models.users import NewUser
 
+class UserQueries(BaseQueries):
+    def __init__(self, pool: ConnectionPool | None = None) -> None:
+        super().__init__("users", pool)
 
-class UserQueries:
-    def __init__(self) -> None:
-        self.table = "users"
-
+    @run_in_executor
     def get_all_users(self) -> list[dict]:
         query = f"SELECT * FROM {self.table}"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query)
-        data_res = cursor.fetchall()
-        cursor.close()
-        db.close()
-        data: list[dict] = [row for row in data_res]  # type: ignore
-        return data
+        return self.fetch_all(query)
+
+    @run_in_executor
+    def get_page(
+        self,
+        limit: int,
+        after: datetime | None = None,
+        after_id: str | None = None,
+    ) -> list[dict]:
+        """
+        Select a page of users, newest first, starting past the (`after`, `after_id`) cursor.
+        The built-in engine is not listed.
+        """
+        condition = "WHERE user_id <> (%s) "
+        params: tuple = (str(ENGINE_USER_ID),)
+        if after is not None and after_id is not None:
+            # the redundant bound on created_at alone is what lets an index range start at the cursor
+            condition += "AND created_at <= (%s) AND (created_at < (%s) OR (created_at = (%s) AND user_id < (%s))) "
+            params += (after, after, after, after_id)
+        query = f"SELECT * FROM {self.table} {condition}ORDER BY created_at DESC, user_id DESC LIMIT %s;"
+        return self.fetch_all(query, params + (limit,))
 
+    @run_in_executor
     def get_by_uuid(self, user_id: UUID) -> dict | None:
         query = f"SELECT * FROM {self.table} WHERE user_id = (%s);"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (str(user_id),))
-        db_data = cursor.fetchone()
-        cursor.close()
-        db.close()
-        if db_data is None:
-            return None
-        data: dict = db_data  # type: ignore
-        return data
+        return self.fetch_one(query, (str(user_id),))
 
+    @run_in_executor
+    def get_by_uuids(self, user_ids: list[UUID]) -> list[dict]:
+        if not user_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        query = f"SELECT * FROM {self.table} WHERE user_id IN ({placeholders});"
+        return self.fetch_all(query, tuple(str(user_id) for user_id in user_ids))
+
+    @run_in_executor
     def get_auth0_id(self, auth0_id: str) -> dict | None:
         query = f"SELECT * FROM {self.table} WHERE auth0_id = (%s);"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(query, (auth0_id,))
-        db_data = cursor.fetchone()
-        cursor.close()
-        db.close()
-        if db_data is None:
-            return None
-        data: dict = db_data  # type: ignore
-        return data
+        return self.fetch_one(query, (auth0_id,))
 
+    @run_in_executor
     def insert_user(self, user: NewUser, auth0_id: str) -> UUID:
         """Insert a new user"""
         new_id = uuid4()
         query = f"INSERT INTO {self.table} (user_id, username, email, name, auth0_id) VALUES (%s, %s, %s, %s, %s)"
-        db = connect_db()
-        cursor = db.cursor(dictionary=True)
-        cursor.execute(
+        self.execute(
             query,
             (str(new_id), user.username, user.email, user.name, auth0_id),
         )
-
-        db.commit()
-        cursor.close()
-        db.close()
         return new_id
@@ -0,0 +1,133 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from uuid import UUID
+
+from anyio import CapacityLimiter
+from pydantic import BaseModel
+
+from app.engine.search import best_move
+
+
+class EngineSettings(BaseModel):
+    # leave a core to the event loop, so searches never starve human requests
+    workers: int = max(1, (os.cpu_count() or 2) - 1)
+    depth: int = 3
+    move_seconds: float = 2.0
+    # games that may wait for a free worker, beyond those being searched
+    queue_size: int = 16
+    # added to the niceness of the worker processes
+    niceness: int = 10
+
+
+@lru_cache()
+def get_engine_settings() -> EngineSettings:
+    defaults = EngineSettings()
+    return EngineSettings(
+        workers=int(os.getenv("ENGINE_WORKERS", str(defaults.workers))),
+        depth=int(os.getenv("ENGINE_DEPTH", str(defaults.depth))),
+        move_seconds=float(
+            os.getenv("ENGINE_MOVE_SECONDS", str(defaults.move_seconds))
+        ),
+        queue_size=int(os.getenv("ENGINE_QUEUE_SIZE", str(defaults.queue_size))),
+        niceness=int(os.getenv("ENGINE_NICENESS", str(defaults.niceness))),
+    )
+
+
+class EngineBusyError(Exception):
+    """Raised when every worker is searching and the queue is full"""
+
+
+class EngineJob:
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.future: Future | None = None
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        if self.future is not None:
+            # only stops a search that has not started, a running one ends at its time limit
+            self.future.cancel()
+
+
+def lower_priority(niceness: int) -> None:
+    """Runs in each worker process as it starts"""
+    os.nice(niceness)
+
+
+class EnginePool:
+    """
+    Runs engine searches in a bounded pool of worker processes.
+    Jobs queue for a worker in order, at most one per game; a newer job for a game
+    cancels the older one, and `cancel` drops a game's job, e.g. when it is deleted.
+    """
+
+    def __init__(self, settings: EngineSettings | None = None) -> None:
+        self.settings = settings or get_engine_settings()
+        self._executor: ProcessPoolExecutor | None = None
+        self._limiter = CapacityLimiter(self.settings.workers)
+        self._jobs: dict[UUID, EngineJob] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # started on the first search, so importing the app never forks
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.settings.workers,
+                # spawned rather than forked, the server has threads of its own
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=lower_priority,
+                initargs=(self.settings.niceness,),
+            )
+        return self._executor
+
+    def is_full(self) -> bool:
+        return len(self._jobs) >= self.settings.workers + self.settings.queue_size
+
+    async def best_move(self, game_id: UUID, fen: str) -> str | None:
+        """
+        The engine's move for the position in UCI, or None if the job was cancelled
+        or there is no legal move
+        """
+        previous = self._jobs.get(game_id)
+        if previous is not None:
+            previous.cancel()
+        elif self.is_full():
+            raise EngineBusyError("Every engine worker is busy")
+        job = self._jobs[game_id] = EngineJob()
+        try:
+            async with self._limiter:
+                if job.cancelled:
+                    return None
+                job.future = self.executor.submit(
+                    best_move, fen, self.settings.depth, self.settings.move_seconds
+                )
+                try:
+                    move = await asyncio.wrap_future(job.future)
+                except asyncio.CancelledError:
+                    if job.cancelled:
+                        return None
+                    raise
+                except BrokenProcessPool:
+                    # a worker died, start afresh on the next search
+                    self.shutdown()
+                    raise
+            return None if job.cancelled else move
+        finally:
+            if self._jobs.get(game_id) is job:
+                del self._jobs[game_id]
+
+    def cancel(self, game_id: UUID) -> None:
+        job = self._jobs.pop(game_id, None)
+        if job is not None:
+            job.cancel()
+
+    def shutdown(self) -> None:
+        for job in self._jobs.values():
+            job.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
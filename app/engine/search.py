@@ -0,0 +1,194 @@
+"""
+A small alpha-beta engine over chess.Board: iterative deepening negamax with a
+quiescence search on captures, scored by material and piece-square tables.
+Everything here is CPU-bound and meant to run in a worker process, see `EnginePool`.
+"""
+
+import time
+
+from chess import (
+    BISHOP,
+    BLACK,
+    KING,
+    KNIGHT,
+    PAWN,
+    QUEEN,
+    ROOK,
+    WHITE,
+    Board,
+    Move,
+    square_mirror,
+)
+
+MATE = 100_000
+PIECE_VALUES = {PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900, KING: 0}
+
+# bonuses by square for white, a1 first; black's are mirrored
+# fmt: off
+PAWN_TABLE = (
+     0,  0,  0,   0,   0,  0,  0,  0,
+     5, 10, 10, -20, -20, 10, 10,  5,
+     5, -5, -10,  0,   0, -10, -5, 5,
+     0,  0,  0,  20,  20,  0,  0,  0,
+     5,  5, 10,  25,  25, 10,  5,  5,
+    10, 10, 20,  30,  30, 20, 10, 10,
+    50, 50, 50,  50,  50, 50, 50, 50,
+     0,  0,  0,   0,   0,  0,  0,  0,
+)
+KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+CENTER_TABLE = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10,   0,   5,  0,  0,   5,   0, -10,
+    -10,   5,   5, 10, 10,   5,   5, -10,
+     -5,   0,  10, 10, 10,  10,   0,  -5,
+     -5,   0,  10, 10, 10,  10,   0,  -5,
+    -10,   0,   5, 10, 10,   5,   0, -10,
+    -10,   0,   0,  0,  0,   0,   0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20,
+)
+KING_TABLE = (
+     20,  30,  10,   0,   0,  10,  30,  20,
+     20,  20,   0,   0,   0,   0,  20,  20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+)
+# fmt: on
+TABLES = {
+    PAWN: PAWN_TABLE,
+    KNIGHT: KNIGHT_TABLE,
+    BISHOP: CENTER_TABLE,
+    ROOK: CENTER_TABLE,
+    QUEEN: CENTER_TABLE,
+    KING: KING_TABLE,
+}
+
+# how many nodes are searched between looking at the clock
+CLOCK_CHECK_NODES = 512
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board: Board) -> int:
+    """The position's score in centipawns, from the side to move's point of view"""
+    score = 0
+    for piece_type, table in TABLES.items():
+        value = PIECE_VALUES[piece_type]
+        for square in board.pieces(piece_type, WHITE):
+            score += value + table[square]
+        for square in board.pieces(piece_type, BLACK):
+            score -= value + table[square_mirror(square)]
+    return score if board.turn == WHITE else -score
+
+
+class Search:
+    def __init__(self, board: Board, deadline: float) -> None:
+        self.board = board
+        self.deadline = deadline
+        self.nodes = 0
+
+    def tick(self) -> None:
+        self.nodes += 1
+        if self.nodes % CLOCK_CHECK_NODES == 0 and time.monotonic() > self.deadline:
+            raise SearchTimeout
+
+    def ordered(self, moves: list[Move], first: Move | None = None) -> list[Move]:
+        """The previous best move, then captures of the most valuable piece by the least valuable one"""
+
+        def key(move: Move) -> int:
+            if move == first:
+                return -10 * MATE
+            score = 0
+            if move.promotion:
+                score -= PIECE_VALUES[move.promotion]
+            victim = self.board.piece_type_at(move.to_square)
+            if victim is not None:
+                attacker = self.board.piece_type_at(move.from_square) or PAWN
+                score -= 10 * PIECE_VALUES[victim] - PIECE_VALUES[attacker]
+            return score
+
+        return sorted(moves, key=key)
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.tick()
+        moves = list(self.board.legal_moves)
+        if not moves:
+            # mated sooner is worse, so the engine goes for the quickest mate
+            return -MATE + ply if self.board.is_check() else 0
+        if ply and (
+            self.board.is_insufficient_material() or self.board.is_repetition(2)
+        ):
+            return 0
+        if depth <= 0:
+            return self.quiesce(alpha, beta)
+        for move in self.ordered(moves):
+            self.board.push(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            self.board.pop()
+            if score >= beta:
+                return beta
+            alpha = max(alpha, score)
+        return alpha
+
+    def quiesce(self, alpha: int, beta: int) -> int:
+        """Play out the captures, so a score is never taken mid-exchange"""
+        self.tick()
+        stand_pat = evaluate(self.board)
+        if stand_pat >= beta:
+            return beta
+        alpha = max(alpha, stand_pat)
+        for move in self.ordered(list(self.board.generate_legal_captures())):
+            self.board.push(move)
+            score = -self.quiesce(-beta, -alpha)
+            self.board.pop()
+            if score >= beta:
+                return beta
+            alpha = max(alpha, score)
+        return alpha
+
+    def root(self, depth: int, first: Move | None) -> Move:
+        best, alpha = None, -MATE - 1
+        for move in self.ordered(list(self.board.legal_moves), first):
+            self.board.push(move)
+            score = -self.negamax(depth - 1, -MATE - 1, -alpha, 1)
+            self.board.pop()
+            if best is None or score > alpha:
+                best, alpha = move, score
+        assert best is not None
+        return best
+
+
+def best_move(fen: str, max_depth: int = 3, time_limit: float = 2.0) -> str | None:
+    """
+    The engine's move in UCI for the position, or None if there is no legal move.
+    Searches one ply deeper at a time until `max_depth` or `time_limit` seconds,
+    answering with the best move of the deepest search that finished.
+    """
+    board = Board(fen)
+    moves = list(board.legal_moves)
+    if not moves:
+        return None
+    if len(moves) == 1:
+        return moves[0].uci()
+    search = Search(board, time.monotonic() + time_limit)
+    best = None
+    for depth in range(1, max_depth + 1):
+        try:
+            best = search.root(depth, best)
+        except SearchTimeout:
+            break
+    return (best or search.ordered(moves)[0]).uci()
@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+import anyio
+import pytest
+from chess import Board
+
+from .pool import EngineBusyError, EnginePool, EngineSettings
+
+FOOLS_MATE = "rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2"
+
+
+@pytest.fixture
+def pool():
+    pool = EnginePool(
+        EngineSettings(workers=1, depth=2, move_seconds=1, queue_size=1, niceness=0)
+    )
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.anyio
+async def test_searches_run_in_a_worker_process(pool):
+    assert await pool.best_move(uuid4(), FOOLS_MATE) == "d8h4"
+    assert not pool.is_full()
+
+
+@pytest.mark.anyio
+async def test_jobs_queue_for_a_worker_and_can_be_cancelled(pool):
+    first, second, third = uuid4(), uuid4(), uuid4()
+    results = {}
+
+    async def search(game_id) -> None:
+        results[game_id] = await pool.best_move(game_id, Board().fen())
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(search, first)
+        tg.start_soon(search, second)
+        await anyio.sleep(0.05)
+        # one searching, one queued
+        assert pool.is_full()
+        with pytest.raises(EngineBusyError):
+            await pool.best_move(third, Board().fen())
+        pool.cancel(second)
+
+    assert results[first] in {move.uci() for move in Board().legal_moves}
+    assert results[second] is None
+    assert not pool.is_full()
+
+
+@pytest.mark.anyio
+async def test_a_newer_job_for_a_game_replaces_the_older_one(pool):
+    game_id = uuid4()
+    results = []
+
+    async def search(fen: str) -> None:
+        results.append(await pool.best_move(game_id, fen))
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(search, Board().fen())
+        await anyio.sleep(0.05)
+        tg.start_soon(search, FOOLS_MATE)
+
+    assert sorted(results, key=str) == [None, "d8h4"]
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+from chess import Board
+
+from .search import MATE, Search, best_move, evaluate
+
+
+@pytest.mark.parametrize(
+    "fen, move",
+    [
+        # back rank mate
+        ("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1", "a1a8"),
+        # fool's mate
+        ("rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2", "d8h4"),
+        # a hanging queen
+        ("k7/8/8/3q4/8/8/8/K2R4 w - - 0 1", "d1d5"),
+        # the only legal move
+        ("k7/8/8/8/8/8/1q6/K7 w - - 0 1", "a1b2"),
+    ],
+)
+def test_engine_finds_the_move(fen, move):
+    assert best_move(fen, max_depth=3) == move
+
+
+def test_no_move_when_the_game_is_over():
+    assert best_move("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1") is None
+
+
+def test_evaluation_is_symmetric():
+    board = Board()
+    board.push_uci("e2e4")
+    mirrored = board.mirror()
+    # the mirror swaps the colors and the side to move, so it looks the same to the mover
+    assert evaluate(board) == evaluate(mirrored) < 0
+    assert evaluate(Board()) == 0
+
+
+def test_search_prefers_the_quickest_mate():
+    board = Board("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1")
+    board.push_uci("a1a8")
+    search = Search(board, time.monotonic() + 10)
+    assert search.negamax(1, -MATE - 1, MATE + 1, 1) == -MATE + 1
+
+
+def test_search_stops_at_its_time_limit():
+    start = time.monotonic()
+    move = best_move(Board().fen(), max_depth=10, time_limit=0.2)
+    assert time.monotonic() - start < 1.0
+    assert move in {m.uci() for m in Board().legal_moves}
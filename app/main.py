@@ -1,15 +1,25 @@
 from dotenv import load_dotenv
-from fastapi import FastAPI, status
+from fastapi import Depends, FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from __version__ import __version__
+from app.controllers.board_cache import BoardCacheStats
+from app.controllers.position_cache import PositionCacheStats
+from app.controllers.unit_of_work import UnitOfWorkMiddleware
+from app.controllers.user_cache import UserCacheStats
+from app.db.pool import PoolStats
 from app.models.routes import AvailableRoutes
+from app.monitoring.metrics import REGISTRY, stats_gauges
+from app.monitoring.middleware import MetricsMiddleware
+from app.resources import Resources, get_resources, lifespan
 from app.routers.games import router as games_router
 from app.routers.users import router as users_router
 
 load_dotenv(override=True)
 
-app = FastAPI()
+# what the app shares is built once it starts, and closed when it stops, see app.resources
+app = FastAPI(lifespan=lifespan)
 app.include_router(games_router)
 app.include_router(users_router)
 
@@ -28,6 +38,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(UnitOfWorkMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+def running() -> Resources:
+    """The resources of the started app, read by the gauges on each scrape"""
+    return app.state.resources
+
+
+for gauge in [
+    *stats_gauges("db_pool", PoolStats, lambda: running().pool.stats()),
+    *stats_gauges(
+        "board_cache", BoardCacheStats, lambda: running().controller.gc.cache.stats()
+    ),
+    *stats_gauges(
+        "legal_moves_cache",
+        PositionCacheStats,
+        lambda: running().controller.gc.legal_moves.stats(),
+    ),
+    *stats_gauges(
+        "status_cache",
+        PositionCacheStats,
+        lambda: running().controller.gc.statuses.stats(),
+    ),
+    *stats_gauges(
+        "user_cache", UserCacheStats, lambda: running().controller.uc.cache.stats()
+    ),
+]:
+    REGISTRY.register(gauge)
 
 
 @app.get("/", status_code=status.HTTP_200_OK)
@@ -37,8 +76,44 @@ async def read_root() -> AvailableRoutes:
             "/",
             "/games",
             "/games/{game_id}",
+            "/games/{game_id}/moves",
+            "/games/{game_id}/stream",
             "/users",
             "/users/{user_id}",
+            "/db/pool",
+            "/cache/boards",
+            "/cache/users",
+            "/metrics",
         ],
         version=__version__,
     )
+
+
+@app.get("/db/pool", status_code=status.HTTP_200_OK)
+async def read_pool_stats(
+    resources: Resources = Depends(get_resources),
+) -> PoolStats:
+    """Connection pool metrics, for sizing DB_POOL_SIZE under load"""
+    return resources.pool.stats()
+
+
+@app.get("/cache/boards", status_code=status.HTTP_200_OK)
+async def read_board_cache_stats(
+    resources: Resources = Depends(get_resources),
+) -> BoardCacheStats:
+    """Hit/miss counters of the in-process board cache"""
+    return resources.controller.gc.cache.stats()
+
+
+@app.get("/cache/users", status_code=status.HTTP_200_OK)
+async def read_user_cache_stats(
+    resources: Resources = Depends(get_resources),
+) -> UserCacheStats:
+    """Hit/miss counters of the in-process user cache"""
+    return resources.controller.uc.cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics() -> PlainTextResponse:
+    """Request, query, board store and token timings in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -13,3 +13,13 @@ class AssignColor(BaseModel):
         if v not in ["black", "white"]:
             raise ValueError("Invalid color")
         return v
+
+
+class AssignEngine(BaseModel):
+    """The color the built-in engine plays, the owner takes the other one"""
+
+    color: str
+
+    @validator("color")
+    def validate_color(cls, v):
+        return AssignColor.validate_color(v)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from re import U
+from typing import Literal
 from uuid import UUID
 
 from chess import Piece, Square
@@ -7,6 +7,14 @@ from fastapi import HTTPException
 from pydantic import BaseModel
 
 
+# how a game's board is serialized: a dict of PieceModel by square name,
+# a FEN string, or 64 piece symbols indexed by square
+BoardFormat = Literal["pieces", "fen", "array"]
+
+# how a user's games are exported: PGN, or one GameRecord of JSON per line
+ExportFormat = Literal["pgn", "ndjson"]
+
+
 class PieceModel(BaseModel):
     """Piece model for serialization"""
 
@@ -35,10 +43,29 @@ class BaseGame(BaseModel):
     last_updated_at: datetime | None = None
 
 
-class DetailedGame(BaseGame):
+class GameStatus(BaseModel):
+    """Where a game stands, as of its current position"""
+
+    game_state: str = "in progress"  # or "finished"
+    check: bool = False
+    checkmate: bool = False
+    stalemate: bool = False
+    # "stalemate", "insufficient_material", "seventyfive_moves" or "fivefold_repetition"
+    draw_reason: str | None = None
+    result: str = "*"  # "1-0", "0-1" or "1/2-1/2" once finished
+
+
+class DetailedGame(GameStatus, BaseGame):
     """Chess game model for serialization of a Chess object"""
 
     turn: str  # "white" or "black"
     turn_count: int
-    game_state: str
-    board: dict[str, PieceModel]
+    board: dict[str, PieceModel] | str | list[str]
+
+
+class GameRecord(BaseGame):
+    """A finished or ongoing game as exported, with its moves rather than its board"""
+
+    result: str  # "1-0", "0-1", "1/2-1/2" or "*" while in progress
+    fen: str
+    moves: list[str]  # UCI, from the starting position
@@ -1,4 +1,12 @@
-from pydantic import BaseModel
+from uuid import UUID
+
+from pydantic import BaseModel, Field, model_validator
+
+# a long game runs to a few hundred plies, this bounds the work one request can ask for
+MAX_BATCH_MOVES = 1000
+# room for the game so far and that many more moves, with headers and comments,
+# so that no request has an arbitrarily long PGN parsed
+MAX_PGN_LENGTH = 100_000
 
 
 class Move(BaseModel):
@@ -6,3 +14,31 @@ class Move(BaseModel):
 
     start: str
     end: str
+
+
+class MoveBatch(BaseModel):
+    """
+    Moves to apply to a game at once: UCI moves played from its current position,
+    or a PGN of the whole game, of which the moves not yet played are applied
+    """
+
+    moves: list[str] | None = Field(
+        default=None, min_length=1, max_length=MAX_BATCH_MOVES
+    )
+    pgn: str | None = Field(default=None, max_length=MAX_PGN_LENGTH)
+
+    @model_validator(mode="after")
+    def validate_source(self) -> "MoveBatch":
+        if (self.moves is None) == (self.pgn is None):
+            raise ValueError("Give either moves or pgn")
+        return self
+
+
+class LegalMoves(BaseModel):
+    """The legal moves of a game's current position, grouped by the square moved from"""
+
+    game_id: UUID
+    turn: str  # "white" or "black"
+    # from-square to the rest of each UCI move, e.g. {"e2": ["e3", "e4"]},
+    # so a `Move` is the from-square as `start` and a destination as `end`
+    moves: dict[str, list[str]]
@@ -0,0 +1,16 @@
+import pytest
+from pydantic import ValidationError
+
+from .move import MAX_BATCH_MOVES, MAX_PGN_LENGTH, MoveBatch
+
+
+def test_a_batch_takes_either_moves_or_a_pgn():
+    assert MoveBatch(moves=["e2e4"]).pgn is None
+    assert MoveBatch(pgn="1. e4 *").moves is None
+    for fields in ({}, {"moves": ["e2e4"], "pgn": "1. e4 *"}, {"moves": []}):
+        with pytest.raises(ValidationError):
+            MoveBatch(**fields)
+    with pytest.raises(ValidationError):
+        MoveBatch(moves=["e2e4"] * (MAX_BATCH_MOVES + 1))
+    with pytest.raises(ValidationError):
+        MoveBatch(pgn="1. e4 " + " " * MAX_PGN_LENGTH)
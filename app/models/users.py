@@ -5,6 +5,9 @@ from pydantic import BaseModel, EmailStr, Field
 
 from app.models.game import BaseGame
 
+# the user the built-in engine plays as, created by migration 0004
+ENGINE_USER_ID = UUID("00000000-0000-4000-8000-00000000e1e0")
+
 
 class NewUser(BaseModel):
     """
@@ -27,6 +30,8 @@ class BaseUser(BaseModel):
     username: str
     user_id: UUID
     games: list[BaseGame] = Field(default_factory=list)
+    # pass as games_cursor to /users/{user_id} for the next page of games
+    games_next_cursor: str | None = None
 
 
 class DetailedUser(BaseUser):
@@ -0,0 +1,268 @@
+"""
+A minimal metrics registry rendered in the Prometheus text exposition format.
+Metrics are module level, like the prometheus_client ones they stand in for,
+and are safe to update from the event loop and the DB executor threads alike.
+"""
+
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+from pydantic import BaseModel
+
+# in seconds, from a cached board read to a slow page of games
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric(ABC):
+    kind: str
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """The metric's lines in the text exposition format"""
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in values
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: the count in each bucket (not cumulative), the sum and the count
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._series.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            )
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe how long the block takes, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+        return 0 if series is None else int(series[1][1])
+
+    def sum(self, **labels: str) -> float:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+        return 0.0 if series is None else series[1][0]
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted(
+                (key, (list(counts), list(totals)))
+                for key, (counts, totals) in self._series.items()
+            )
+        lines = self.header()
+        for key, (counts, totals) in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                labels = format_labels(self.labels, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {totals[0]}")
+            lines.append(f"{self.name}_count{labels} {int(totals[1])}")
+        return lines
+
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped, e.g. from the pool's stats"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], dict[tuple[str, ...], float]],
+        labels: tuple[str, ...] = (),
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in sorted(self.read().items())
+        ]
+
+
+def stats_gauges(
+    prefix: str, model: type[BaseModel], read: Callable[[], BaseModel]
+) -> list[Gauge]:
+    """One gauge per field of a stats model, e.g. `db_pool_in_use` for `PoolStats.in_use`"""
+
+    def field(name: str) -> Callable[[], dict[tuple[str, ...], float]]:
+        return lambda: {(): float(getattr(read(), name))}
+
+    return [
+        Gauge(f"{prefix}_{name}", f"{model.__name__}.{name}", field(name))
+        for name in model.model_fields
+    ]
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as error:
+                # one failing gauge must not take the rest of the scrape down
+                lines.append(f"# {metric.name} unavailable: {error}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "Time to serve a request, by route template",
+        ("method", "route", "status"),
+    )
+)
+REQUEST_QUERIES = REGISTRY.register(
+    Histogram(
+        "http_request_db_queries",
+        "DB queries run to serve a request",
+        ("method", "route"),
+        buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 34),
+    )
+)
+REQUEST_QUERY_SECONDS = REGISTRY.register(
+    Histogram(
+        "http_request_db_seconds",
+        "Time spent in DB queries to serve a request",
+        ("method", "route"),
+    )
+)
+DB_QUERY_SECONDS = REGISTRY.register(
+    Histogram(
+        "db_query_duration_seconds",
+        "Time to run a query, including waiting for a pooled connection",
+        ("table", "kind"),
+    )
+)
+BOARD_STORE_SECONDS = REGISTRY.register(
+    Histogram(
+        "board_store_duration_seconds",
+        "Time to load, create, save or delete a board in its store",
+        ("store", "operation"),
+    )
+)
+JWT_VERIFY_SECONDS = REGISTRY.register(
+    Histogram(
+        "jwt_verify_duration_seconds",
+        "Time to verify a bearer token, by whether it was cached",
+        ("result",),
+    )
+)
+PROFILES_WRITTEN = REGISTRY.register(
+    Counter(
+        "profiles_written_total",
+        "Sampled profiles of slow requests dumped to PROFILE_DIR",
+        ("route",),
+    )
+)
@@ -0,0 +1,114 @@
+import logging
+import random
+import re
+import time
+from contextlib import nullcontext
+
+import anyio
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.base import count_queries
+from app.monitoring.metrics import (
+    PROFILES_WRITTEN,
+    REQUEST_QUERIES,
+    REQUEST_QUERY_SECONDS,
+    REQUEST_SECONDS,
+)
+from app.monitoring.profiler import (
+    Profile,
+    ProfilingConfig,
+    SamplingProfiler,
+    get_profiler,
+    get_profiling_config,
+)
+
+PROFILE_HEADER = b"x-profile"
+
+logger = logging.getLogger(__name__)
+
+
+def route_template(scope: Scope) -> str:
+    """
+    The matched route's path template, e.g. `/games/{game_id}`, so that the metrics
+    have one series per route rather than one per game
+    """
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request and counts its queries, by route template.
+    Sampled requests, and those asking with `X-Profile: 1` if allowed, are profiled,
+    and the profile is dumped to `profile_dir` when the request is slow or asked for it.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        config: ProfilingConfig | None = None,
+        profiler: SamplingProfiler | None = None,
+    ) -> None:
+        self.app = app
+        self.config = config or get_profiling_config()
+        self.profiler = profiler
+
+    def wants_profile(self, scope: Scope) -> tuple[bool, bool]:
+        """Whether to profile the request, and whether it asked to be"""
+        if self.config.allow_header and (PROFILE_HEADER, b"1") in scope["headers"]:
+            return True, True
+        sampled = random.random() < self.config.sample_rate
+        return sampled, False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiled, forced = self.wants_profile(scope)
+        profiler = self.profiler or get_profiler()
+        start = time.perf_counter()
+        with count_queries() as queries, (
+            profiler.profile() if profiled else nullcontext()
+        ) as profile:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                elapsed = time.perf_counter() - start
+                method, route = scope["method"], route_template(scope)
+                REQUEST_SECONDS.observe(
+                    elapsed, method=method, route=route, status=str(status)
+                )
+                REQUEST_QUERIES.observe(queries.count, method=method, route=route)
+                REQUEST_QUERY_SECONDS.observe(
+                    queries.seconds, method=method, route=route
+                )
+        if profile is not None and (forced or elapsed >= self.config.slow_seconds):
+            await self.dump(profile, method, route, elapsed)
+
+    async def dump(
+        self, profile: Profile, method: str, route: str, elapsed: float
+    ) -> None:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = anyio.Path(
+            self.config.profile_dir,
+            f"{time.strftime('%Y%m%dT%H%M%S')}-{method}-{slug}-{elapsed * 1000:.0f}ms.collapsed",
+        )
+        await path.parent.mkdir(parents=True, exist_ok=True)
+        await path.write_text(profile.collapsed())
+        PROFILES_WRITTEN.inc(route=route)
+        logger.info(
+            "Wrote a profile of %s %s (%.0fms) to %s",
+            method,
+            route,
+            elapsed * 1000,
+            path,
+        )
@@ -0,0 +1,107 @@
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from types import FrameType
+from typing import Iterator
+
+from pydantic import BaseModel
+
+
+class ProfilingConfig(BaseModel):
+    # the share of requests profiled, dumped only if they turn out slow
+    sample_rate: float = 0.0
+    slow_seconds: float = 0.5
+    # whether a request may ask to be profiled, and dumped whatever its time, with X-Profile
+    allow_header: bool = False
+    interval_seconds: float = 0.005
+    profile_dir: str = "profiles"
+
+
+@lru_cache()
+def get_profiling_config() -> ProfilingConfig:
+    return ProfilingConfig(
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        slow_seconds=float(os.getenv("PROFILE_SLOW_MS", "500")) / 1000,
+        allow_header=os.getenv("PROFILE_ALLOW_HEADER", "false").lower()
+        in ("1", "true", "yes"),
+        interval_seconds=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+        profile_dir=os.getenv("PROFILE_DIR", "profiles"),
+    )
+
+
+def collapse(frame: FrameType | None, thread_name: str) -> str:
+    """A stack as `thread;outermost;...;innermost`, the collapsed format flame graph tools read"""
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        names.append(f"{module}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class Profile:
+    """The stacks sampled from every thread while one request ran"""
+
+    def __init__(self) -> None:
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each `interval` seconds while any profile is open.
+    Requests are served by the event loop and the DB executor threads at once,
+    so each profile gets all of them, the other requests in flight included.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @contextmanager
+    def profile(self) -> Iterator[Profile]:
+        profile = Profile()
+        with self._lock:
+            self._profiles.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._sample, name="sampling-profiler", daemon=True
+                )
+                self._thread.start()
+        try:
+            yield profile
+        finally:
+            with self._lock:
+                self._profiles.discard(profile)
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                collapse(frame, names.get(ident, str(ident)))
+                for ident, frame in sys._current_frames().items()
+                if ident != own
+            ]
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                for profile in self._profiles:
+                    profile.stacks.update(stacks)
+                    profile.samples += 1
+            threading.Event().wait(self.interval)
+
+
+@lru_cache()
+def get_profiler() -> SamplingProfiler:
+    return SamplingProfiler(get_profiling_config().interval_seconds)
@@ -0,0 +1,61 @@
+import pytest
+from pydantic import BaseModel
+
+from .metrics import Counter, Gauge, Histogram, Metric, Registry, stats_gauges
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("t_seconds", "Time", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+
+    assert histogram.count(route="/a") == 3
+    assert histogram.render() == [
+        "# HELP t_seconds Time",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{route="/a",le="0.1"} 1',
+        't_seconds_bucket{route="/a",le="1.0"} 2',
+        't_seconds_bucket{route="/a",le="+Inf"} 3',
+        't_seconds_sum{route="/a"} 5.55',
+        't_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_metrics_check_their_labels():
+    counter = Counter("c_total", "C", ("route",))
+    with pytest.raises(ValueError):
+        counter.inc(status="200")
+    counter.inc(route='say "hi"\n')
+    assert counter.render()[-1] == 'c_total{route="say \\"hi\\"\\n"} 1.0'
+
+
+def test_a_metric_that_cannot_render_cannot_be_created():
+    class Unrendered(Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError, match="render"):
+        Unrendered("u", "U")  # type: ignore
+
+
+class Stats(BaseModel):
+    in_use: int
+    idle: int
+
+
+def test_registry_renders_stats_gauges_and_survives_failing_ones():
+    registry = Registry()
+    for gauge in stats_gauges("pool", Stats, lambda: Stats(in_use=2, idle=3)):
+        registry.register(gauge)
+
+    def broken() -> dict:
+        raise RuntimeError("no pool")
+
+    registry.register(Gauge("broken", "Broken", broken))
+    with pytest.raises(ValueError):
+        registry.register(Counter("pool_idle", "Again"))
+
+    text = registry.render()
+    assert "pool_in_use 2.0\n" in text
+    assert "# TYPE pool_idle gauge\npool_idle 3.0\n" in text
+    assert "# broken unavailable: no pool\n" in text
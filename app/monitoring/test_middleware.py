@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.db.base import count_queries, track_query
+
+from .metrics import PROFILES_WRITTEN, REQUEST_QUERIES, REQUEST_SECONDS
+from .middleware import MetricsMiddleware
+from .profiler import ProfilingConfig, SamplingProfiler
+
+
+def make_client(config: ProfilingConfig) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/things/{thing_id}")
+    def read_thing(thing_id: int) -> dict:
+        for _ in range(thing_id):
+            with track_query("things", "fetch_one"):
+                pass
+        return {"thing_id": thing_id}
+
+    @app.get("/slow")
+    def slow() -> dict:
+        time.sleep(0.05)
+        return {}
+
+    app.add_middleware(
+        MetricsMiddleware, config=config, profiler=SamplingProfiler(0.001)
+    )
+    return TestClient(app)
+
+
+def test_requests_are_timed_and_counted_by_route_template(tmp_path):
+    client = make_client(ProfilingConfig(profile_dir=str(tmp_path)))
+    route = "/things/{thing_id}"
+    before = REQUEST_SECONDS.count(method="GET", route=route, status="200")
+    queries = REQUEST_QUERIES.count(method="GET", route=route)
+
+    assert client.get("/things/3").status_code == 200
+    assert client.get("/things/4").status_code == 200
+    assert client.get("/nowhere").status_code == 404
+
+    assert REQUEST_SECONDS.count(method="GET", route=route, status="200") == before + 2
+    assert REQUEST_QUERIES.count(method="GET", route=route) == queries + 2
+    assert REQUEST_SECONDS.count(method="GET", route="unmatched", status="404") >= 1
+    # the three then four queries landed in the 3 and 5 buckets
+    assert f'http_request_db_queries_bucket{{method="GET",route="{route}",le="3"}}' in (
+        "\n".join(REQUEST_QUERIES.render())
+    )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_slow_sampled_requests_are_profiled(tmp_path):
+    config = ProfilingConfig(
+        sample_rate=1.0, slow_seconds=0.02, profile_dir=str(tmp_path)
+    )
+    client = make_client(config)
+    written = PROFILES_WRITTEN.value(route="/slow")
+
+    client.get("/things/1")
+    client.get("/slow")
+
+    (dump,) = tmp_path.iterdir()
+    assert "-GET-slow-" in dump.name
+    assert "test_middleware:slow" in dump.read_text()
+    assert PROFILES_WRITTEN.value(route="/slow") == written + 1
+
+
+@pytest.mark.parametrize("allow_header", [True, False])
+def test_profiles_are_asked_for_with_a_header_if_allowed(tmp_path, allow_header):
+    config = ProfilingConfig(allow_header=allow_header, profile_dir=str(tmp_path))
+    client = make_client(config)
+
+    client.get("/things/1", headers={"X-Profile": "1"})
+
+    assert len(list(tmp_path.iterdir())) == (1 if allow_header else 0)
+
+
+def test_profiler_samples_other_threads_until_closed():
+    profiler = SamplingProfiler(0.001)
+    done = threading.Event()
+
+    def spin() -> None:
+        while not done.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=spin, name="spinner")
+    worker.start()
+    with profiler.profile() as profile:
+        time.sleep(0.05)
+    done.set()
+    worker.join()
+
+    assert profile.samples > 0
+    lines = profile.collapsed().splitlines()
+    assert any(line.startswith("spinner;") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    time.sleep(0.01)
+    assert profiler._thread is None
+
+
+def test_queries_are_counted_by_the_middleware_and_whoever_wraps_it(tmp_path):
+    app = make_client(ProfilingConfig(profile_dir=str(tmp_path))).app
+    route = "/things/{thing_id}"
+    counted = []
+
+    async def counting_app(scope, receive, send) -> None:
+        with count_queries() as stats:
+            await app(scope, receive, send)  # type: ignore
+        counted.append(stats.count)
+
+    client = TestClient(counting_app)  # type: ignore
+    queries = REQUEST_QUERIES.sum(method="GET", route=route)
+
+    assert client.get("/things/2").status_code == 200
+
+    assert counted == [2]
+    assert REQUEST_QUERIES.sum(method="GET", route=route) == queries + 2
@@ -0,0 +1,70 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import anyio
+from fastapi import Depends, FastAPI, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, SecurityScopes
+from starlette.requests import HTTPConnection
+
+from app.admin.config import Settings, get_settings
+from app.admin.utils import VerifyToken
+from app.controllers.controller import APIController
+from app.db.pool import ConnectionPool, new_pool
+
+
+class Resources:
+    """
+    What the app builds once and shares between requests: the settings, the token
+    verifier, the database pool and the controller, which holds the board storage,
+    the caches and the engine workers. Built by the app's lifespan, so importing the
+    app builds nothing, and closed by it.
+    """
+
+    def __init__(
+        self,
+        settings: Settings | None = None,
+        auth: VerifyToken | None = None,
+        controller: APIController | None = None,
+        pool: ConnectionPool | None = None,
+    ) -> None:
+        self.settings = settings or get_settings()
+        self.auth = auth or VerifyToken(self.settings)
+        self.pool = pool or new_pool()
+        self.controller = controller or APIController(self.pool)
+
+    def close(self) -> None:
+        self.auth.keys.stop()
+        self.controller.close()
+        self.pool.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Build the resources when the app starts serving and release them when it stops"""
+    resources = Resources()
+    app.state.resources = resources
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(resources.controller.play_engine_moves)
+            yield
+            tg.cancel_scope.cancel()
+    finally:
+        resources.close()
+
+
+def get_resources(connection: HTTPConnection) -> Resources:
+    return connection.app.state.resources
+
+
+def get_controller(connection: HTTPConnection) -> APIController:
+    """The controller of the app serving the request or websocket"""
+    return get_resources(connection).controller
+
+
+async def verify(
+    request: Request,
+    security_scopes: SecurityScopes,
+    token: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer()),
+) -> dict:
+    """Verify the bearer token with the app's verifier, returning its claims"""
+    return await get_resources(request).auth.verify(security_scopes, token)
@@ -1,13 +1,28 @@
 import os
 from uuid import UUID
 
-from fastapi import APIRouter, Security, status
+import anyio
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    Security,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 
-from app.admin.utils import VerifyToken
 from app.controllers.controller import APIController
-from app.models.color_assignment import AssignColor
-from app.models.game import BaseGame, DetailedGame
-from app.models.move import Move
+from app.controllers.pagination import GameSort
+from app.models.color_assignment import AssignColor, AssignEngine
+from app.models.game import BaseGame, BoardFormat, DetailedGame
+from app.models.move import LegalMoves, Move, MoveBatch
+from app.resources import get_controller, verify
+from app.routers.conditional import etag_matches, not_modified
+from app.routers.pagination import LimitQuery, set_next_link
 
 GAMES_DIR = os.path.join(os.path.dirname(__file__), os.path.pardir, "games")
 
@@ -17,48 +32,191 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-auth = VerifyToken()
-
-controller = APIController()
-
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_games_route(auth_result=Security(auth.verify)) -> list[BaseGame]:
-    """Get a list of all games belonging to an autnenticated user"""
-    return controller.get_games_by_auth_token(auth_result.get("sub"))
+async def get_games_route(
+    request: Request,
+    response: Response,
+    sort: GameSort = "last_updated_at",
+    limit: int = LimitQuery,
+    cursor: str | None = None,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
+) -> list[BaseGame]:
+    """
+    Get a page of the games belonging to an autnenticated user, newest first.
+    A Link header points to the next page.
+    """
+    games, next_cursor = await controller.get_games_by_auth_token(
+        auth_result.get("sub"), sort, limit, cursor
+    )
+    set_next_link(request, response, next_cursor)
+    return games
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def create_game_route(auth_result=Security(auth.verify)) -> UUID:
+async def create_game_route(
+    auth_result=Security(verify), controller: APIController = Depends(get_controller)
+) -> UUID:
     """Create a new game and return the game id"""
-    return controller.create_game(auth_result.get("sub"))
+    return await controller.create_game(auth_result.get("sub"))
+
+
+# `?format=` picks how the board of a game is serialized
+FormatQuery = Query("pieces", alias="format")
 
 
 @router.get("/{game_id}")
-async def get_game_route(game_id: UUID) -> DetailedGame:
-    """Get the current state of the game"""
-    return controller.get_detailed_game(game_id)
+async def get_game_route(
+    game_id: UUID,
+    request: Request,
+    response: Response,
+    board_format: BoardFormat = FormatQuery,
+    controller: APIController = Depends(get_controller),
+) -> DetailedGame:
+    """
+    Get the current state of the game. Honours If-None-Match with a 304.
+    The board is a dict of pieces by square, or with `format=fen` a FEN string,
+    or with `format=array` 64 piece symbols from a1 to h8.
+    """
+    # taken before the game is read, so a move in between can only make it stale
+    etag = await controller.get_game_etag(game_id, board_format)
+    if etag_matches(request, etag):
+        return not_modified(etag)  # type: ignore
+    response.headers["ETag"] = etag
+    return await controller.get_detailed_game(game_id, board_format)
+
+
+@router.get("/{game_id}/moves")
+async def get_legal_moves_route(
+    game_id: UUID,
+    request: Request,
+    response: Response,
+    controller: APIController = Depends(get_controller),
+) -> LegalMoves:
+    """
+    Get the legal moves of the current position, grouped by the square moved from.
+    Honours If-None-Match with a 304.
+    """
+    etag = await controller.get_legal_moves_etag(game_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)  # type: ignore
+    response.headers["ETag"] = etag
+    return await controller.get_legal_moves(game_id)
 
 
 @router.delete("/{game_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_game_route(game_id: UUID, auth_result=Security(auth.verify)) -> None:
+async def delete_game_route(
+    game_id: UUID,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
+) -> None:
     """Delete the game by id, if found"""
-    controller.delete_game(game_id, auth_result.get("sub"))
+    await controller.delete_game(game_id, auth_result.get("sub"))
 
 
 @router.patch("/{game_id}", status_code=status.HTTP_200_OK)
 async def make_move(
-    game_id: UUID, move: Move, auth_result=Security(auth.verify)
+    game_id: UUID,
+    move: Move,
+    board_format: BoardFormat = FormatQuery,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
 ) -> DetailedGame | None:
-    """Make a move in the game"""
-    return controller.make_move(auth_result.get("sub"), game_id, move)
+    """
+    Make a move in the game, returning the game with its board in the requested format.
+    If the engine plays the other side, its reply follows once it is found.
+    """
+    game = await controller.make_move(
+        auth_result.get("sub"), game_id, move, board_format
+    )
+    if controller.engine_to_move(game):
+        controller.reply_later(game_id)
+    return game
+
+
+@router.patch("/{game_id}/moves", status_code=status.HTTP_200_OK)
+async def make_moves_route(
+    game_id: UUID,
+    batch: MoveBatch,
+    board_format: BoardFormat = FormatQuery,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
+) -> DetailedGame:
+    """
+    Apply a list of UCI moves, or import a PGN of the game, in one request.
+    The moves are validated together and stored in one write, or not at all.
+    """
+    game = await controller.make_moves(
+        auth_result.get("sub"), game_id, batch, board_format
+    )
+    if controller.engine_to_move(game):
+        controller.reply_later(game_id)
+    return game
 
 
 @router.patch("/{game_id}/assign", status_code=status.HTTP_200_OK)
 async def assign_game_to_player_route(
-    game_id: UUID, assignment: AssignColor, auth_result=Security(auth.verify)
+    game_id: UUID,
+    assignment: AssignColor,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
 ) -> BaseGame:
     """Assign a game to a non-owner player. The owner will be autoassigned to the other color."""
-    return controller.assign_player(
+    return await controller.assign_player(
         game_id, auth_result.get("sub"), assignment.assignee_id, assignment.color
     )
+
+
+@router.patch("/{game_id}/assign/engine", status_code=status.HTTP_200_OK)
+async def assign_engine_route(
+    game_id: UUID,
+    assignment: AssignEngine,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
+) -> BaseGame:
+    """
+    Have the built-in engine play a color against the owner, who takes the other one.
+    The engine replies to every move; as white, it opens once it is assigned.
+    """
+    game = await controller.assign_engine(
+        game_id, auth_result.get("sub"), assignment.color
+    )
+    if controller.engine_to_move(await controller.get_detailed_game(game_id)):
+        controller.reply_later(game_id)
+    return game
+
+
+@router.websocket("/{game_id}/stream")
+async def stream_game_route(
+    websocket: WebSocket,
+    game_id: UUID,
+    controller: APIController = Depends(get_controller),
+) -> None:
+    """Send the current state of the game, then the new state after every move"""
+    await websocket.accept()
+    # subscribe before reading the game so that no move can slip in between
+    async with controller.broadcaster.subscribe(game_id) as updates:
+        try:
+            game = await controller.get_detailed_game(game_id)
+        except HTTPException as e:
+            await websocket.close(code=4000 + e.status_code, reason=str(e.detail))
+            return
+        try:
+            await websocket.send_text(game.model_dump_json())
+            async with anyio.create_task_group() as tg:
+
+                async def wait_for_disconnect() -> None:
+                    try:
+                        while True:
+                            await websocket.receive_text()
+                    except WebSocketDisconnect:
+                        tg.cancel_scope.cancel()
+
+                tg.start_soon(wait_for_disconnect)
+                while (message := await updates.get()) is not None:
+                    await websocket.send_text(message)
+                await websocket.close(reason="Game deleted")
+                tg.cancel_scope.cancel()
+        except WebSocketDisconnect:
+            pass
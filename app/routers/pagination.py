@@ -0,0 +1,14 @@
+from fastapi import Query, Request, Response
+
+from app.controllers.pagination import DEFAULT_LIMIT, MAX_LIMIT
+
+LimitQuery = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT)
+
+
+def set_next_link(
+    request: Request, response: Response, cursor: str | None, param: str = "cursor"
+) -> None:
+    """Point the client at the next page with a Link header, if there is one"""
+    if cursor is not None:
+        next_url = request.url.include_query_params(**{param: cursor})
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
@@ -0,0 +1,123 @@
+from uuid import uuid4
+
+import pytest
+from chess import Board
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.controllers.broadcast import GameBroadcaster
+from app.models.move import LegalMoves
+from app.resources import get_controller
+
+from . import games
+
+
+class FakeController:
+    """Serves the games in `states` the way the routes ask the APIController for them"""
+
+    def __init__(self) -> None:
+        self.states: dict = {}
+        self.broadcaster = GameBroadcaster()
+
+    async def get_detailed_game(self, game_id, board_format="pieces"):
+        if game_id not in self.states:
+            raise HTTPException(status_code=404, detail="Game not found")
+        if board_format == "fen":
+            return self.states[game_id].model_copy(update={"board": Board().fen()})
+        return self.states[game_id]
+
+    async def get_game_etag(self, game_id, board_format="pieces"):
+        game = await self.get_detailed_game(game_id)
+        return f'"{game_id}-{game.turn_count}-{board_format}"'
+
+    async def get_legal_moves(self, game_id):
+        game = await self.get_detailed_game(game_id)
+        return LegalMoves(game_id=game_id, turn=game.turn, moves={"e2": ["e4"]})
+
+    async def get_legal_moves_etag(self, game_id):
+        game = await self.get_detailed_game(game_id)
+        return f'"{game_id}-{game.turn_count}-moves"'
+
+
+@pytest.fixture
+def client():
+    controller = FakeController()
+    app = FastAPI()
+    app.include_router(games.router)
+    app.dependency_overrides[get_controller] = lambda: controller
+    with TestClient(app) as client:
+        client.states = controller.states  # type: ignore
+        client.broadcaster = controller.broadcaster  # type: ignore
+        yield client
+
+
+def test_stream_pushes_moves_to_subscribers(client, make_game):
+    game_id = uuid4()
+    client.states[game_id] = make_game(game_id, turn_count=1)
+
+    with client.websocket_connect(f"/games/{game_id}/stream") as first:
+        with client.websocket_connect(f"/games/{game_id}/stream") as second:
+            assert first.receive_json()["turn_count"] == 1
+            assert second.receive_json()["turn_count"] == 1
+
+            client.portal.call(client.broadcaster.publish, make_game(game_id, 2))
+            assert first.receive_json()["turn_count"] == 2
+            assert second.receive_json()["turn_count"] == 2
+
+            client.portal.call(client.broadcaster.close, game_id)
+            with pytest.raises(WebSocketDisconnect):
+                first.receive_json()
+
+
+def test_stream_closes_for_missing_games(client):
+    with client.websocket_connect(f"/games/{uuid4()}/stream") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 4404
+
+
+def test_get_game_honours_if_none_match(client, make_game):
+    game_id = uuid4()
+    client.states[game_id] = make_game(game_id, turn_count=1)
+
+    first = client.get(f"/games/{game_id}")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+
+    cached = client.get(f"/games/{game_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+
+    client.states[game_id] = make_game(game_id, turn_count=2)
+    changed = client.get(f"/games/{game_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["turn_count"] == 2
+
+
+def test_get_game_in_another_format(client, make_game):
+    game_id = uuid4()
+    client.states[game_id] = make_game(game_id, turn_count=1)
+
+    pieces = client.get(f"/games/{game_id}")
+    fen = client.get(f"/games/{game_id}", params={"format": "fen"})
+    assert fen.json()["board"] == Board().fen()
+    assert fen.headers["ETag"] != pieces.headers["ETag"]
+
+    assert client.get(f"/games/{game_id}", params={"format": "svg"}).status_code == 422
+
+
+def test_legal_moves_honour_if_none_match(client, make_game):
+    game_id = uuid4()
+    client.states[game_id] = make_game(game_id, turn_count=1)
+
+    first = client.get(f"/games/{game_id}/moves")
+    assert first.json()["moves"] == {"e2": ["e4"]}
+    etag = first.headers["ETag"]
+    assert etag != client.get(f"/games/{game_id}").headers["ETag"]
+
+    cached = client.get(f"/games/{game_id}/moves", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert client.get(f"/games/{uuid4()}/moves").status_code == 404
@@ -1,11 +1,15 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Security, status
-from icecream import ic
+from fastapi import APIRouter, Depends, Query, Request, Response, Security, status
+from fastapi.responses import StreamingResponse
 
-from app.admin.utils import VerifyToken
 from app.controllers.controller import APIController
+from app.controllers.pagination import GameSort
+from app.models.game import ExportFormat
 from app.models.users import BaseUser, DetailedUser, NewUser
+from app.resources import get_controller, verify
+from app.routers.conditional import etag_matches, not_modified
+from app.routers.pagination import LimitQuery, set_next_link
 
 router = APIRouter(
     prefix="/users",
@@ -13,43 +17,101 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-auth = VerifyToken()
-
-controller = APIController()
-
 
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_users() -> list[BaseUser]:
+async def get_users(
+    request: Request,
+    response: Response,
+    limit: int = LimitQuery,
+    cursor: str | None = None,
+    games_sort: GameSort = "last_updated_at",
+    games_limit: int = LimitQuery,
+    controller: APIController = Depends(get_controller),
+) -> list[BaseUser]:
     """
-    Get a list of all users
+    Get a page of users, newest first, each with the first page of their games
+    A Link header points to the next page
     Only returns publicly available information
     Does not require auth
     """
-    return controller.get_base_users()
+    users, next_cursor = await controller.get_base_users(
+        limit, cursor, games_sort, games_limit
+    )
+    set_next_link(request, response, next_cursor)
+    return users
 
 
 @router.get("/{user_id}", status_code=status.HTTP_200_OK)
-async def get_user(user_id: UUID) -> BaseUser:
+async def get_user(
+    user_id: UUID,
+    request: Request,
+    response: Response,
+    games_sort: GameSort = "last_updated_at",
+    games_limit: int = LimitQuery,
+    games_cursor: str | None = None,
+    controller: APIController = Depends(get_controller),
+) -> BaseUser:
     """
-    Get a user by their ID
+    Get a user by their ID, with a page of their games
+    Pass games_next_cursor back as games_cursor for the next page
     Returns publicly available information
     Does not require auth
+    Honours If-None-Match with a 304
+    """
+    etag = await controller.get_user_etag(
+        user_id, games_sort, games_limit, games_cursor
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)  # type: ignore
+    response.headers["ETag"] = etag
+    return await controller.get_base_user(
+        user_id, games_sort, games_limit, games_cursor
+    )
+
+
+EXPORT_MEDIA_TYPES = {
+    "pgn": "application/x-chess-pgn",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@router.get("/{user_id}/games/export", status_code=status.HTTP_200_OK)
+async def export_user_games(
+    user_id: UUID,
+    export_format: ExportFormat = Query("pgn", alias="format"),
+    controller: APIController = Depends(get_controller),
+) -> StreamingResponse:
+    """
+    Download every game of a user as PGN, or with `format=ndjson` one game of JSON per line
+    The games are streamed one at a time, newest first
+    Does not require auth
     """
-    return controller.get_base_user(user_id)
+    games = await controller.export_games_by_user_id(user_id, export_format)
+    return StreamingResponse(
+        games,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{user_id}.{export_format}"'
+        },
+    )
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
 async def create_user(
-    user: NewUser, auth_result=Security(auth.verify)
+    user: NewUser,
+    auth_result=Security(verify),
+    controller: APIController = Depends(get_controller),
 ) -> BaseUser | None:
     """Create a new user"""
-    return controller.create_user(user, auth_result)
+    return await controller.create_user(user, auth_result)
 
 
 @router.get("/details/", status_code=status.HTTP_200_OK)
-async def get_detailed_user(auth_result=Security(auth.verify)) -> DetailedUser:
+async def get_detailed_user(
+    auth_result=Security(verify), controller: APIController = Depends(get_controller)
+) -> DetailedUser:
     """
     Get user details by their uuid
     Returns private information and required auth
     """
-    return controller.get_detailed_user(auth_result.get("sub"))
+    return await controller.get_detailed_user(auth_result.get("sub"))
@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+from uuid import uuid4
+
+from chess import Board
+from fastapi import Depends, FastAPI, Security
+from fastapi.testclient import TestClient
+
+from app import main, resources
+from app.admin.utils import KeySet, VerifyToken
+from app.controllers.controller import APIController
+from app.resources import Resources, get_controller, lifespan, verify
+from benchmarks.auth import SETTINGS
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), os.path.pardir)
+
+
+def test_the_app_builds_its_resources_once_it_starts(monkeypatch):
+    monkeypatch.setattr(resources, "get_settings", lambda: SETTINGS)
+    closed = []
+    close = Resources.close
+
+    def closing(self: Resources) -> None:
+        closed.append(self)
+        close(self)
+
+    monkeypatch.setattr(Resources, "close", closing)
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/controller")
+    async def read_controller(
+        controller: APIController = Depends(get_controller),
+    ) -> int:
+        return id(controller)
+
+    assert not hasattr(app.state, "resources")
+    with TestClient(app) as client:
+        built = app.state.resources
+        first = client.get("/controller").json()
+        assert first == client.get("/controller").json() == id(built.controller)
+        assert closed == []
+    assert closed == [built]
+
+
+def test_stats_are_read_from_the_resources_the_app_closes(monkeypatch):
+    monkeypatch.setattr(resources, "get_settings", lambda: SETTINGS)
+
+    with TestClient(main.app) as client:
+        built = main.app.state.resources
+        built.controller.gc.cache.put(uuid4(), Board(), 0)
+        assert client.get("/cache/boards").json()["entries"] == 1
+        assert "\nboard_cache_entries 1.0\n" in client.get("/metrics").text
+        assert client.get("/db/pool").json() == built.pool.stats().model_dump()
+    assert built.controller.gc.cache.stats().entries == 0
+
+
+def test_routes_verify_tokens_with_the_app_verifier(make_signer):
+    signer = make_signer("app")
+    keys = KeySet.from_jwks(signer.jwks())
+    app = FastAPI()
+    app.state.resources = Resources(
+        settings=SETTINGS, auth=VerifyToken(SETTINGS, keys=keys)
+    )
+
+    @app.get("/me")
+    async def read_me(auth_result=Security(verify)) -> str:
+        return auth_result["sub"]
+
+    client = TestClient(app)
+    token = signer.token("auth0|test")
+    response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == "auth0|test"
+    assert client.get("/me").status_code == 403
+    forged = make_signer("forger", kid="app").token("auth0|test")
+    assert (
+        client.get("/me", headers={"Authorization": f"Bearer {forged}"}).status_code
+        == 403
+    )
+
+
+def test_importing_the_app_builds_nothing_and_skips_dev_tools():
+    # without any auth0 settings, which are only read once the app starts
+    env = {k: v for k, v in os.environ.items() if not k.startswith("AUTH0_")}
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, app.main; "
+            "print(*sorted({'black', 'icecream', 'mysql.connector'} & set(sys.modules)))",
+        ],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert loaded.stdout.strip() == ""
@@ -0,0 +1,106 @@
+"""
+Locally signed Auth0-shaped tokens, so benchmarks run offline.
+The app verifies them against the JWKS written by `LocalSigner.write_jwks`, through AUTH0_JWKS_PATH.
+"""
+
+import json
+import os
+import time
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.admin.config import Settings
+from app.admin.utils import KeySet, VerifyToken
+
+KID = "benchmark"
+
+AUTH0_ENV = {
+    "AUTH0_DOMAIN": "benchmark.invalid",
+    "AUTH0_API_AUDIENCE": "https://api.benchmark.invalid",
+    "AUTH0_ISSUER": "https://benchmark.invalid/",
+    "AUTH0_ALGORITHMS": "RS256",
+    # the JWKS file never changes during a run
+    "AUTH0_JWKS_REFRESH_SECONDS": "0",
+}
+
+# what a verifier configured by AUTH0_ENV is set to
+SETTINGS = Settings(
+    auth0_domain=AUTH0_ENV["AUTH0_DOMAIN"],
+    auth0_api_audience=AUTH0_ENV["AUTH0_API_AUDIENCE"],
+    auth0_issuer=AUTH0_ENV["AUTH0_ISSUER"],
+    auth0_algorithms=AUTH0_ENV["AUTH0_ALGORITHMS"],
+    auth0_jwks_refresh_seconds=float(AUTH0_ENV["AUTH0_JWKS_REFRESH_SECONDS"]),
+)
+
+
+class LocalSigner:
+    """
+    Signs tokens with a private key kept in `key_path`, created on first use,
+    so that a server started against the same JWKS accepts tokens from every run.
+    Tokens name the key `kid`.
+    """
+
+    def __init__(self, key_path: str, kid: str = KID) -> None:
+        self.key_path = key_path
+        self.kid = kid
+        if os.path.exists(key_path):
+            with open(key_path, "rb") as f:
+                self.private_key = serialization.load_pem_private_key(
+                    f.read(), password=None
+                )
+        else:
+            self.private_key = rsa.generate_private_key(
+                public_exponent=65537, key_size=2048
+            )
+            os.makedirs(os.path.dirname(key_path) or ".", exist_ok=True)
+            with open(key_path, "wb") as f:
+                f.write(
+                    self.private_key.private_bytes(  # type: ignore
+                        serialization.Encoding.PEM,
+                        serialization.PrivateFormat.PKCS8,
+                        serialization.NoEncryption(),
+                    )
+                )
+
+    def jwks(self) -> dict:
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key())  # type: ignore
+        )
+        jwk.update({"kid": self.kid, "use": "sig", "alg": "RS256"})
+        return {"keys": [jwk]}
+
+    def write_jwks(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.jwks(), f)
+
+    def token(self, sub: str, expires_in: int = 3600) -> str:
+        now = int(time.time())
+        return jwt.encode(
+            {
+                "sub": sub,
+                "aud": AUTH0_ENV["AUTH0_API_AUDIENCE"],
+                "iss": AUTH0_ENV["AUTH0_ISSUER"],
+                "iat": now,
+                "exp": now + expires_in,
+            },
+            self.private_key,  # type: ignore
+            algorithm="RS256",
+            headers={"kid": self.kid},
+        )
+
+
+def configure_auth(jwks_path: str) -> None:
+    """Point the app's token verification at the local JWKS. Call before the app starts."""
+    os.environ.update(AUTH0_ENV)
+    os.environ["AUTH0_JWKS_PATH"] = jwks_path
+
+
+def trust(verifier: VerifyToken, signer: LocalSigner) -> None:
+    """
+    Make an in-process verifier accept the signer's tokens, whatever a .env loaded
+    over the environment set by `configure_auth`
+    """
+    verifier.config = SETTINGS
+    verifier.keys = KeySet.from_jwks(signer.jwks())
@@ -0,0 +1,275 @@
+"""
+Seed a local database and drive a realistic mix of requests at the API,
+reporting latency percentiles, throughput and DB queries per request.
+
+    python -m benchmarks.load [--users 100] [--games 1000] [--requests 5000]
+        [--concurrency 16] [--url http://localhost:5052] [--compare RESULT]
+
+Requests go to the app in process unless --url is given, in which case the server must
+share the database and board storage, and run with AUTH0_JWKS_PATH set to the JWKS written
+to the results directory. Each run is saved there as JSON, for comparing against later.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import anyio
+import httpx
+from chess import Board
+from dotenv import load_dotenv
+
+from app.controllers.boards import DEFAULT_BOARD_STORAGE
+from app.db.base import count_queries
+from benchmarks.auth import LocalSigner, configure_auth, trust
+from benchmarks.seed import Seeded, SeededGame, clear, seed
+from benchmarks.stats import (
+    RunResult,
+    Sample,
+    format_comparison,
+    format_table,
+    summarize,
+    summarize_by_endpoint,
+)
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+QUERY_COUNT_HEADER = "x-query-count"
+
+# the share of requests going to each endpoint, reads dominate as they do in play
+MIX = {
+    "GET /games/{id}": 50,
+    "PATCH /games/{id}": 20,
+    "GET /games": 20,
+    "GET /users": 10,
+}
+
+
+class QueryCountingApp:
+    """Wraps the app in process to report each request's query count in a response header"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with count_queries() as stats:
+
+            async def send_with_count(message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((QUERY_COUNT_HEADER.encode(), b"%d" % stats.count))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_count)
+
+
+class Workload:
+    """
+    Picks requests by the MIX weights. Moves are legal moves for the side to move,
+    made with that player's token; each game takes one move at a time.
+    """
+
+    def __init__(self, seeded: Seeded, signer: LocalSigner, rng: random.Random) -> None:
+        self.seeded = seeded
+        self.rng = rng
+        self.tokens = {sub: signer.token(sub) for sub in seeded.auth0_ids}
+        self.boards: dict[str, Board] = {}
+        self.moving: set[str] = set()
+
+    def headers(self, sub: str) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[sub]}"}
+
+    def next_request(
+        self, client: httpx.AsyncClient
+    ) -> tuple[str, Callable[[], Awaitable[httpx.Response]]]:
+        endpoint = self.rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        game = self.rng.choice(self.seeded.games)
+        if endpoint == "PATCH /games/{id}":
+            move = self.pick_move(game)
+            if move is not None:
+                return endpoint, lambda: self.make_move(client, game, *move)
+            endpoint = "GET /games/{id}"
+        if endpoint == "GET /games/{id}":
+            return endpoint, lambda: client.get(f"/games/{game.game_id}")
+        if endpoint == "GET /games":
+            sub = self.rng.choice(self.seeded.auth0_ids)
+            return endpoint, lambda: client.get("/games/", headers=self.headers(sub))
+        return endpoint, lambda: client.get("/users/")
+
+    def pick_move(self, game: SeededGame) -> tuple[str, str] | None:
+        key = str(game.game_id)
+        if key in self.moving:
+            return None
+        board = self.boards.setdefault(key, Board())
+        # the API has no way to name a promotion piece
+        moves = [move for move in board.legal_moves if move.promotion is None]
+        if not moves:
+            return None
+        move = self.rng.choice(moves)
+        self.moving.add(key)
+        return move.uci()[:2], move.uci()[2:4]
+
+    async def make_move(
+        self, client: httpx.AsyncClient, game: SeededGame, start: str, end: str
+    ) -> httpx.Response:
+        key = str(game.game_id)
+        board = self.boards[key]
+        sub = game.white_auth0_id if board.turn else game.black_auth0_id
+        try:
+            response = await client.patch(
+                f"/games/{game.game_id}",
+                json={"start": start, "end": end},
+                headers=self.headers(sub),
+            )
+            if response.status_code == 200:
+                board.push_uci(start + end)
+            return response
+        finally:
+            self.moving.discard(key)
+
+
+async def drive(
+    client: httpx.AsyncClient, workload: Workload, requests: int, concurrency: int
+) -> tuple[list[Sample], float]:
+    samples: list[Sample] = []
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            endpoint, send = workload.next_request(client)
+            start = time.perf_counter()
+            response = await send()
+            elapsed = time.perf_counter() - start
+            queries = response.headers.get(QUERY_COUNT_HEADER)
+            samples.append(
+                Sample(
+                    endpoint=endpoint,
+                    seconds=elapsed,
+                    status=response.status_code,
+                    queries=None if queries is None else int(queries),
+                )
+            )
+
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for _ in range(concurrency):
+            tg.start_soon(worker)
+    return samples, time.perf_counter() - start
+
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> RunResult:
+    os.makedirs(args.out, exist_ok=True)
+    signer = LocalSigner(os.path.join(args.out, "benchmark-key.pem"))
+    jwks_path = os.path.join(args.out, "jwks.json")
+    signer.write_jwks(jwks_path)
+    configure_auth(jwks_path)
+
+    from app.controllers.games import GameController
+    from app.db.migrate import migrate
+    from app.db.pool import get_pool
+
+    migrate()
+    rng = random.Random(args.seed)
+    boards = GameController().boards
+    removed = await clear(get_pool(), boards)
+    if removed:
+        print(f"cleared {removed} users from an earlier run")
+    seeded = await seed(get_pool(), boards, args.users, args.games, rng)
+    print(f"seeded {args.users} users and {args.games} games")
+
+    started_at = datetime.now(timezone.utc)
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        else:
+            from app.main import app
+
+            # ASGITransport sends no lifespan events, so the app is started here
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            trust(app.state.resources.auth, signer)
+            transport = httpx.ASGITransport(app=QueryCountingApp(app))  # type: ignore
+            client = httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+        await stack.enter_async_context(client)
+
+        workload = Workload(seeded, signer, rng)
+        await drive(client, workload, args.warmup, args.concurrency)
+        samples, duration = await drive(
+            client, workload, args.requests, args.concurrency
+        )
+
+    return RunResult(
+        started_at=started_at,
+        commit=current_commit(),
+        target=args.url or "in process",
+        settings={
+            "users": args.users,
+            "games": args.games,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "BOARD_STORAGE": os.getenv("BOARD_STORAGE", DEFAULT_BOARD_STORAGE),
+            "DB_POOL_SIZE": os.getenv("DB_POOL_SIZE", "5"),
+            "BOARD_CACHE_SIZE": os.getenv("BOARD_CACHE_SIZE", "1024"),
+        },
+        duration_seconds=duration,
+        requests_per_second=len(samples) / duration if duration else 0.0,
+        overall=summarize(samples),
+        endpoints=summarize_by_endpoint(samples),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=1, help="seed of the workload")
+    parser.add_argument("--url", help="benchmark a running server instead")
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="a saved result to compare this run to")
+    args = parser.parse_args()
+
+    load_dotenv()
+    result = anyio.run(run, args)
+    print(format_table(result))
+
+    path = os.path.join(args.out, f"{result.started_at:%Y%m%dT%H%M%S}.json")
+    with open(path, "w") as f:
+        f.write(result.model_dump_json(indent=2))
+    print(f"saved {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = RunResult.model_validate_json(f.read())
+        print(format_comparison(baseline, result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Seed benchmark users and games straight into the configured database.
+Seeded users have `bench|` auth0 ids, so a rerun can clear the previous run's data first.
+"""
+
+import random
+from datetime import datetime, timedelta
+from uuid import UUID, uuid4
+
+from chess import Board
+from pydantic import BaseModel
+
+from app.controllers.boards import BoardStore
+from app.db.pool import ConnectionPool
+
+AUTH0_PREFIX = "bench|"
+
+# rows are inserted this many at a time
+BATCH_SIZE = 1000
+
+
+class SeededGame(BaseModel):
+    game_id: UUID
+    white_auth0_id: str
+    black_auth0_id: str
+
+
+class Seeded(BaseModel):
+    auth0_ids: list[str]
+    games: list[SeededGame]
+
+
+def insert_many(pool: ConnectionPool, query: str, rows: list[tuple]) -> None:
+    with pool.connection() as db:
+        cursor = db.cursor()
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(query, rows[start : start + BATCH_SIZE])
+        cursor.close()
+        db.commit()
+
+
+async def clear(pool: ConnectionPool, boards: BoardStore) -> int:
+    """Remove the games and users of earlier runs, returning how many users were removed"""
+    with pool.connection() as db:
+        cursor = db.cursor()
+        cursor.execute(
+            "SELECT g.game_id FROM games g JOIN users u ON u.user_id = g.owner_id WHERE u.auth0_id LIKE %s",
+            (f"{AUTH0_PREFIX}%",),
+        )
+        game_ids = [row[0] for row in cursor.fetchall()]  # type: ignore
+        cursor.execute(
+            "DELETE FROM games WHERE owner_id IN (SELECT user_id FROM users WHERE auth0_id LIKE %s)",
+            (f"{AUTH0_PREFIX}%",),
+        )
+        cursor.execute(
+            "DELETE FROM users WHERE auth0_id LIKE %s", (f"{AUTH0_PREFIX}%",)
+        )
+        removed: int = cursor.rowcount
+        cursor.close()
+        db.commit()
+    for game_id in game_ids:
+        await boards.delete(UUID(str(game_id)))
+    return removed
+
+
+async def seed(
+    pool: ConnectionPool,
+    boards: BoardStore,
+    n_users: int,
+    n_games: int,
+    rng: random.Random,
+) -> Seeded:
+    """
+    Insert `n_users` users and `n_games` games between them, each game owned by and
+    played as white by one user with another as black, at spread out timestamps.
+    """
+    if n_users < 2:
+        raise ValueError("Games need two players, seed at least two users")
+    start = datetime.now() - timedelta(days=30)
+    users = [
+        (
+            str(uuid4()),
+            f"{AUTH0_PREFIX}{i}",
+            f"Bench User {i}",
+            None,
+            f"bench-{i}-{uuid4().hex[:8]}",
+            start + timedelta(seconds=i),
+        )
+        for i in range(n_users)
+    ]
+    insert_many(
+        pool,
+        "INSERT INTO users (user_id, auth0_id, name, email, username, created_at) VALUES (%s, %s, %s, %s, %s, %s)",
+        users,
+    )
+
+    games, seeded = [], []
+    for i in range(n_games):
+        white, black = rng.sample(range(n_users), 2)
+        created_at = start + timedelta(seconds=rng.randrange(30 * 24 * 3600))
+        game_id = uuid4()
+        games.append(
+            (
+                str(game_id),
+                users[white][0],
+                users[white][0],
+                users[black][0],
+                created_at,
+                created_at,
+            )
+        )
+        seeded.append(
+            SeededGame(
+                game_id=game_id,
+                white_auth0_id=users[white][1],
+                black_auth0_id=users[black][1],
+            )
+        )
+    insert_many(
+        pool,
+        "INSERT INTO games (game_id, owner_id, white_player_id, black_player_id, created_at, last_updated_at) VALUES (%s, %s, %s, %s, %s, %s)",
+        games,
+    )
+    for game in seeded:
+        await boards.create(game.game_id, Board())
+    return Seeded(auth0_ids=[user[1] for user in users], games=seeded)
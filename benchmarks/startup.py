@@ -0,0 +1,105 @@
+"""
+Time how long a fresh process takes to import the app and start it, as on a restart,
+and optionally list the modules that take longest to import.
+
+    python -m benchmarks.startup [--runs 10] [--modules 15]
+
+Each run is a new interpreter, so nothing is shared between runs but the OS file cache.
+The app is started through its lifespan, with the auth settings in `benchmarks/auth.py`,
+so it needs no outside service.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.auth import AUTH0_ENV
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), os.path.pardir)
+
+# prints the seconds taken to import the app, then to start it
+RUN = """
+import time
+start = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+import anyio
+async def start_app():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+started = anyio.run(start_app)
+print(imported - start, started - imported)
+"""
+
+
+def run_env() -> dict[str, str]:
+    return {**os.environ, **AUTH0_ENV}
+
+
+def time_startup() -> tuple[float, float, float]:
+    """Seconds to import the app, to start it, and for the whole process"""
+    start = time.perf_counter()
+    done = subprocess.run(
+        [sys.executable, "-c", RUN],
+        cwd=REPO_ROOT,
+        env=run_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    process = time.perf_counter() - start
+    imported, started = (float(s) for s in done.stdout.split())
+    return imported, started, process
+
+
+def slowest_imports(count: int) -> list[tuple[int, int, str]]:
+    """The modules taking longest to import on their own, as (self us, cumulative us, name)"""
+    done = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=REPO_ROOT,
+        env=run_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in done.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.append((int(own), int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--modules", type=int, default=0, help="list the N slowest imports"
+    )
+    args = parser.parse_args()
+
+    # the first run warms the file cache and writes any missing bytecode
+    time_startup()
+    runs = [time_startup() for _ in range(args.runs)]
+    print(f"{'':<10} {'median':>8} {'min':>8} {'max':>8}")
+    for label, times in zip(("import", "lifespan", "process"), zip(*runs)):
+        ms = [t * 1000 for t in times]
+        print(
+            f"{label:<10} {statistics.median(ms):>8.1f} {min(ms):>8.1f} {max(ms):>8.1f}"
+        )
+    print(f"{args.runs} runs, in ms")
+
+    if args.modules:
+        print(f"\n{'self':>8} {'cumulative':>11}  module")
+        for own, cumulative, name in slowest_imports(args.modules):
+            print(f"{own / 1000:>8.1f} {cumulative / 1000:>11.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import math
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class Sample(BaseModel):
+    endpoint: str
+    seconds: float
+    status: int
+    # None when the app runs out of process and cannot report it
+    queries: int | None = None
+
+
+class EndpointStats(BaseModel):
+    requests: int
+    errors: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    queries_per_request: float | None = None
+
+
+class RunResult(BaseModel):
+    started_at: datetime
+    commit: str | None
+    target: str
+    settings: dict[str, str | int | float | None]
+    duration_seconds: float
+    requests_per_second: float
+    overall: EndpointStats
+    endpoints: dict[str, EndpointStats]
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """The nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def summarize(samples: list[Sample]) -> EndpointStats:
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    return EndpointStats(
+        requests=len(samples),
+        errors=sum(1 for sample in samples if sample.status >= 400),
+        mean_ms=sum(latencies) / len(latencies) if latencies else 0.0,
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        max_ms=latencies[-1] if latencies else 0.0,
+        queries_per_request=sum(queries) / len(queries) if queries else None,
+    )
+
+
+def summarize_by_endpoint(samples: list[Sample]) -> dict[str, EndpointStats]:
+    by_endpoint: dict[str, list[Sample]] = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample.endpoint, []).append(sample)
+    return {name: summarize(group) for name, group in sorted(by_endpoint.items())}
+
+
+def format_table(result: RunResult) -> str:
+    rows = [("endpoint", "reqs", "errors", "p50", "p95", "p99", "max", "queries")]
+    for name, stats in [*result.endpoints.items(), ("overall", result.overall)]:
+        rows.append(
+            (
+                name,
+                str(stats.requests),
+                str(stats.errors),
+                f"{stats.p50_ms:.1f}",
+                f"{stats.p95_ms:.1f}",
+                f"{stats.p99_ms:.1f}",
+                f"{stats.max_ms:.1f}",
+                (
+                    "-"
+                    if stats.queries_per_request is None
+                    else f"{stats.queries_per_request:.2f}"
+                ),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = [
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows
+    ]
+    lines.append(
+        f"{result.requests_per_second:.1f} req/s over {result.duration_seconds:.1f}s, latencies in ms"
+    )
+    return "\n".join(lines)
+
+
+def format_comparison(baseline: RunResult, result: RunResult) -> str:
+    """How each endpoint moved against a saved baseline run"""
+
+    def change(before: float, after: float) -> str:
+        if before == 0:
+            return "n/a"
+        return f"{(after - before) / before:+.1%}"
+
+    lines = [f"against {baseline.started_at:%Y-%m-%d %H:%M} ({baseline.commit})"]
+    pairs = [*result.endpoints.items(), ("overall", result.overall)]
+    for name, stats in pairs:
+        before = baseline.overall if name == "overall" else baseline.endpoints.get(name)
+        if before is None:
+            continue
+        lines.append(
+            f"{name}: p50 {change(before.p50_ms, stats.p50_ms)}, "
+            f"p95 {change(before.p95_ms, stats.p95_ms)}, "
+            f"p99 {change(before.p99_ms, stats.p99_ms)}"
+        )
+    lines.append(
+        f"req/s {change(baseline.requests_per_second, result.requests_per_second)}"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+"""
+Fire concurrent moves at games from two controllers with caches of their own, as two
+server processes would, then check that every move that was answered with success was
+stored, and report the moves stored per second for one contended game and for many.
+
+    python -m benchmarks.stress [--games 50] [--movers 2] [--moves 20] [--store database|pickle|journal]
+
+Runs on a throwaway SQLite database, so it needs no outside service.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from uuid import UUID
+
+import anyio
+from chess import COLOR_NAMES, Board
+from fastapi import HTTPException
+
+from app.controllers.board_cache import BoardCache
+from app.controllers.boards import (
+    DatabaseBoardStore,
+    JournalBoardStore,
+    PickleBoardStore,
+)
+from app.controllers.games import GameController
+from app.db.backends import SQLiteBackend
+from app.db.games import GameQueries
+from app.db.migrate import migrate
+from app.db.pool import ConnectionPool
+from app.db.users import UserQueries
+from app.models.game import BasicUserInfo, DetailedGame
+from app.models.users import NewUser
+
+
+class Tally:
+    def __init__(self) -> None:
+        self.stored = 0
+        self.conflicts = 0
+
+
+def make_worker(queries: GameQueries, store: str, games_dir: str) -> GameController:
+    controller = GameController()
+    controller.queries = queries
+    if store == "pickle":
+        controller.boards = PickleBoardStore(queries, games_dir)
+    elif store == "journal":
+        controller.boards = JournalBoardStore(queries, games_dir)
+    else:
+        controller.boards = DatabaseBoardStore(queries)
+    controller.cache = BoardCache()
+    return controller
+
+
+async def mover(
+    controller: GameController, game_id: UUID, moves: int, tally: Tally
+) -> None:
+    """Moves as a player would: look at the board, pick a legal move, send it"""
+    owner = BasicUserInfo(username="stress", user_id=game_id, self="")
+    for _ in range(moves):
+        board = await controller.get_board(game_id)
+        legal = list(board.legal_moves)
+        if not legal:
+            return
+        game = DetailedGame(
+            game_id=game_id,
+            self="",
+            owner=owner,
+            turn=COLOR_NAMES[board.turn],
+            turn_count=board.fullmove_number,
+            game_state="in progress",
+            board={},
+        )
+        try:
+            await controller.make_moves(game, [random.choice(legal).uci()])
+        except HTTPException:
+            tally.conflicts += 1
+        else:
+            tally.stored += 1
+
+
+async def stress(
+    pool: ConnectionPool, store: str, games_dir: str, games: int, args
+) -> None:
+    queries = GameQueries(pool)
+    owner = await UserQueries(pool).insert_user(
+        NewUser(username=f"stress-{games}", name="Stress"), f"stress|{games}"
+    )
+    workers = [make_worker(queries, store, games_dir) for _ in range(2)]
+    game_ids = [await queries.insert_game(owner) for _ in range(games)]
+    for game_id in game_ids:
+        await workers[0].boards.create(game_id, Board())
+
+    tally = Tally()
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for game_id in game_ids:
+            for i in range(args.movers):
+                tg.start_soon(mover, workers[i % 2], game_id, args.moves, tally)
+    elapsed = time.perf_counter() - start
+
+    in_storage = 0
+    for game_id in game_ids:
+        in_storage += len((await workers[1].boards.load_history(game_id)).move_stack)
+    lost = tally.stored - in_storage
+    print(
+        f"{games:>5} games {tally.stored:>7} moves {tally.stored / elapsed:>9.1f} moves/s "
+        f"{tally.conflicts:>6} conflicts {lost:>3} lost"
+    )
+    if lost:
+        raise SystemExit(f"{lost} moves answered with success were not stored")
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(f"{tmp}/stress.sqlite3")
+        pool = ConnectionPool(backend.connect)
+        migrate(pool, backend=backend)
+        try:
+            for games in (1, args.games):
+                await stress(pool, args.store, tmp, games, args)
+        finally:
+            pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--movers", type=int, default=2, help="concurrent per game")
+    parser.add_argument("--moves", type=int, default=20, help="tried by each mover")
+    parser.add_argument(
+        "--store", choices=["database", "pickle", "journal"], default="database"
+    )
+    anyio.run(run, parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials, SecurityScopes
+
+from app.admin.utils import KeySet, VerifyToken
+
+from .auth import SETTINGS, LocalSigner, trust
+
+
+@pytest.mark.anyio
+async def test_trusted_verifier_accepts_local_tokens(tmp_path):
+    key_path = str(tmp_path / "key.pem")
+    signer = LocalSigner(key_path)
+    verifier = VerifyToken(SETTINGS, keys=KeySet(refresh_seconds=0))
+    trust(verifier, signer)
+
+    # a second signer picks up the same key, so earlier JWKS files stay valid
+    token = LocalSigner(key_path).token("bench|1")
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    claims = await verifier.verify(SecurityScopes(), credentials)
+    assert claims["sub"] == "bench|1"
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from .stats import (
+    RunResult,
+    Sample,
+    format_comparison,
+    percentile,
+    summarize,
+    summarize_by_endpoint,
+)
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_summarize_by_endpoint():
+    samples = [
+        Sample(endpoint="GET /games", seconds=0.010, status=200, queries=2),
+        Sample(endpoint="GET /games", seconds=0.030, status=200, queries=2),
+        Sample(endpoint="GET /users", seconds=0.020, status=500, queries=4),
+    ]
+    by_endpoint = summarize_by_endpoint(samples)
+    assert list(by_endpoint) == ["GET /games", "GET /users"]
+    assert by_endpoint["GET /games"].p50_ms == 10.0
+    assert by_endpoint["GET /games"].max_ms == 30.0
+    assert by_endpoint["GET /users"].errors == 1
+
+    overall = summarize(samples)
+    assert overall.requests == 3
+    assert overall.queries_per_request == 8 / 3
+    assert (
+        summarize([Sample(endpoint="x", seconds=1, status=200)]).queries_per_request
+        is None
+    )
+
+
+def test_results_round_trip_and_compare():
+    samples = [Sample(endpoint="GET /games", seconds=0.01, status=200)]
+    result = RunResult(
+        started_at=datetime(2024, 1, 1),
+        commit="abc1234",
+        target="in process",
+        settings={"users": 10},
+        duration_seconds=1.0,
+        requests_per_second=100.0,
+        overall=summarize(samples),
+        endpoints=summarize_by_endpoint(samples),
+    )
+    saved = RunResult.model_validate_json(result.model_dump_json())
+    assert saved == result
+
+    faster = result.model_copy(update={"requests_per_second": 150.0})
+    assert "req/s +50.0%" in format_comparison(result, faster)
@@ -0,0 +1,107 @@
+"""
+Time pages of GET /users, each user with the first page of their games, on a SQLite
+database seeded with `--users` users, and check that the queries a page takes do not
+grow with the number of users on it.
+
+    python -m benchmarks.users_page [--users 1000] [--games 3] [--limits 1 10 100 200] [--runs 50]
+
+Runs on a throwaway SQLite database, so it needs no outside service.
+"""
+
+import argparse
+import math
+import tempfile
+import time
+
+import anyio
+
+from app.controllers.controller import APIController
+from app.db.backends import SQLiteBackend
+from app.db.base import count_queries
+from app.db.games import FIRST_PAGES_USERS_PER_QUERY, GameQueries
+from app.db.migrate import migrate
+from app.db.pool import ConnectionPool
+from app.db.users import UserQueries
+from app.models.users import NewUser
+
+from .stats import percentile
+
+
+def max_queries(limit: int) -> int:
+    """
+    The most queries a page may take: the users, their games for each
+    FIRST_PAGES_USERS_PER_QUERY of them, and the players of those games not on the page
+    """
+    return 2 + math.ceil(limit / FIRST_PAGES_USERS_PER_QUERY)
+
+
+async def seed(pool: ConnectionPool, users: int, games: int) -> None:
+    """Each user owns `games` games, playing white against the user who joined before them"""
+    user_queries, game_queries = UserQueries(pool), GameQueries(pool)
+    user_ids = [
+        await user_queries.insert_user(
+            NewUser(username=f"page-{i}", name=f"Page {i}"), f"page|{i}"
+        )
+        for i in range(users)
+    ]
+    for i, user_id in enumerate(user_ids):
+        for _ in range(games):
+            game_id = await game_queries.insert_game(user_id)
+            await game_queries.assign_players(game_id, user_id, user_ids[i - 1])
+
+
+async def time_pages(controller: APIController, limit: int, runs: int) -> int:
+    """Print the latency of the first page of `limit` users, returning its most queries"""
+    latencies, queries = [], []
+    for _ in range(runs):
+        # as on a worker that has not seen these users yet
+        controller.uc.cache.clear()
+        with count_queries() as stats:
+            start = time.perf_counter()
+            page, _ = await controller.get_base_users(limit)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(stats.count)
+    latencies.sort()
+    games = sum(len(user.games) for user in page)
+    print(
+        f"{limit:>5} users {games:>6} games {max(queries):>3} queries "
+        f"{percentile(latencies, 50):>8.2f} p50 ms {percentile(latencies, 95):>8.2f} p95 ms"
+    )
+    return max(queries)
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteBackend(f"{tmp}/users_page.sqlite3")
+        pool = ConnectionPool(backend.connect)
+        migrate(pool, backend=backend)
+        controller = APIController(pool)
+        try:
+            await seed(pool, args.users, args.games)
+            for limit in args.limits:
+                queries = await time_pages(controller, limit, args.runs)
+                if queries > max_queries(limit):
+                    raise SystemExit(
+                        f"a page of {limit} users took {queries} queries, "
+                        f"more than {max_queries(limit)}"
+                    )
+        finally:
+            controller.close()
+            pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--games", type=int, default=3, help="owned by each user")
+    parser.add_argument(
+        "--limits", type=int, nargs="+", default=[1, 10, 100, 200], help="page sizes"
+    )
+    parser.add_argument("--runs", type=int, default=50, help="of each page size")
+    anyio.run(run, parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import pytest
+
+from app.db.backends import SQLiteBackend
+from app.db.migrate import migrate
+from app.db.pool import ConnectionPool
+from benchmarks.auth import LocalSigner
+
+
+@pytest.fixture
+def anyio_backend():
+    """uvicorn runs the app on asyncio, so async tests do too"""
+    return "asyncio"
+
+
+@pytest.fixture
+def sqlite_pool(tmp_path):
+    """A pool on a throwaway, migrated SQLite database"""
+    backend = SQLiteBackend(str(tmp_path / "chess.sqlite3"))
+    pool = ConnectionPool(backend.connect)
+    migrate(pool, backend=backend)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def make_signer(tmp_path):
+    """Makes local token signers, one key per name, naming it `kid` (the name by default)"""
+
+    def make(name: str, kid: str | None = None) -> LocalSigner:
+        return LocalSigner(str(tmp_path / f"{name}.pem"), kid or name)
+
+    return make